@@ -0,0 +1,298 @@
+"""
+Asset Streaming API - 動画・同期データ配信エンドポイント
+
+VideoService.get_video_url / get_sync_data_url が返す /assets/videos/{file} と /assets/sync-data/{file} を配信する。
+
+- HTTP Range（単一範囲）で 206 を返し、プレイヤーのシークをバイト範囲リクエストにする
+- ETag は動画カタログの署名と同じ（サイズ, mtime_ns）から作り、If-None-Match / If-Modified-Since / If-Range に対応
+- サーバーが ASGI zerocopy 拡張に対応していれば sendfile で転送し、無ければ pread でチャンク転送する
+- 同時配信数は asset_stream_max_concurrent で制限し、超過時は 503 + Retry-After を返す
+"""
+
+import os
+import logging
+import mimetypes
+from email.utils import formatdate, parsedate_to_datetime
+from functools import partial
+from typing import Optional, Dict, Any, Tuple, List
+
+import anyio
+from fastapi import APIRouter, HTTPException, Request, Header
+from fastapi.responses import Response
+from starlette.types import Scope, Receive, Send
+
+from app.api.http_cache import etag_matches
+from app.config.settings import settings
+from app.services.video_service import video_service
+from app.services.timeline_repository import timeline_repository
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/assets", tags=["Asset Streaming"])
+
+ZEROCOPY_EXTENSION = "http.response.zerocopy"
+
+class StreamLimiter:
+    """同時配信数の上限（待たせずに即時に拒否する）"""
+
+    def __init__(self, limit: int):
+        self.limit = max(1, limit)
+        self.active = 0
+        # 統計
+        self.served = 0
+        self.rejected = 0
+        self.zerocopy = 0
+        self.bytes_sent = 0
+
+    def try_acquire(self) -> bool:
+        if self.active >= self.limit:
+            self.rejected += 1
+            return False
+        self.active += 1
+        return True
+
+    def release(self):
+        self.active -= 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'active': self.active,
+            'limit': self.limit,
+            'served': self.served,
+            'rejected': self.rejected,
+            'zerocopy': self.zerocopy,
+            'bytes_sent': self.bytes_sent
+        }
+
+stream_limiter = StreamLimiter(settings.asset_stream_max_concurrent)
+
+class FileRangeResponse(Response):
+    """
+    開いたファイルの指定範囲を送るレスポンス
+
+    ファイルと配信枠は送信完了・切断のどちらでも解放する。
+    """
+
+    def __init__(self, fd: int, offset: int, count: int, status_code: int, headers: Dict[str, str]):
+        super().__init__(status_code=status_code, headers=headers)
+        self.fd = fd
+        self.offset = offset
+        self.count = count
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            async with anyio.create_task_group() as task_group:
+                async def wrap(func):
+                    await func()
+                    task_group.cancel_scope.cancel()
+
+                task_group.start_soon(wrap, partial(self._send_file, scope, send))
+                await wrap(partial(self._listen_for_disconnect, receive))
+        finally:
+            os.close(self.fd)
+            stream_limiter.release()
+
+    async def _listen_for_disconnect(self, receive: Receive):
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                break
+
+    async def _send_file(self, scope: Scope, send: Send):
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        stream_limiter.served += 1
+
+        if ZEROCOPY_EXTENSION in scope.get("extensions", {}):
+            # サーバー側で sendfile（ファイル位置は使わず offset を指定）
+            stream_limiter.zerocopy += 1
+            with os.fdopen(os.dup(self.fd), "rb") as file:
+                await send({
+                    "type": ZEROCOPY_EXTENSION, "file": file,
+                    "offset": self.offset, "count": self.count, "more_body": False
+                })
+            stream_limiter.bytes_sent += self.count
+            return
+
+        position, end = self.offset, self.offset + self.count
+        chunk_size = settings.asset_stream_chunk_size
+        while position < end:
+            chunk = await anyio.to_thread.run_sync(os.pread, self.fd, min(chunk_size, end - position), position)
+            if not chunk:
+                # 配信中にファイルが縮んだ（Content-Length 分は送れないので打ち切る）
+                logger.warning(f"配信中にファイルが短くなりました: offset={position}")
+                break
+            position += len(chunk)
+            stream_limiter.bytes_sent += len(chunk)
+            await send({"type": "http.response.body", "body": chunk, "more_body": position < end})
+        if position < end or self.count == 0:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+def _etag(signature: List[int]) -> str:
+    size, mtime_ns = signature
+    return f'"{size:x}-{mtime_ns:x}"'
+
+def _not_modified_since(if_modified_since: Optional[str], mtime_ns: int) -> bool:
+    if not if_modified_since:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    return mtime_ns // 1_000_000_000 <= since.timestamp()
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Range ヘッダーを (開始, 終了[含む]) に変換
+
+    解釈できない指定・複数範囲は None（全体を返す）。
+
+    Raises:
+        ValueError: 範囲がファイル外（416）
+    """
+    if not header or not header.startswith("bytes="):
+        return None
+    spec = header[len("bytes="):].strip()
+    if "," in spec:
+        return None
+    start_text, separator, end_text = spec.partition("-")
+    if not separator:
+        return None
+    try:
+        if not start_text.strip():
+            # 末尾 n バイト
+            suffix = int(end_text)
+            if suffix <= 0 or size == 0:
+                raise ValueError("unsatisfiable")
+            return max(0, size - suffix), size - 1
+        start = int(start_text)
+        end = int(end_text) if end_text.strip() else size - 1
+    except ValueError as e:
+        if str(e) == "unsatisfiable":
+            raise
+        return None
+    if start >= size:
+        raise ValueError("unsatisfiable")
+    if start < 0 or end < start:
+        return None
+    return start, min(end, size - 1)
+
+async def _resolve_asset(kind: str, file_name: str) -> str:
+    """ファイル名をカタログ上のパスに変換（カタログに無いファイルは配信しない）"""
+    video_id = os.path.splitext(file_name)[0]
+    video = await video_service.get_video_by_id(video_id)
+    if kind == "videos" and video and video.video_info.file_name == file_name:
+        return str(video_service.videos_path / file_name)
+    if kind == "sync-data" and video and video.sync_data_file == file_name:
+        return str(timeline_repository.path_for(video_id))
+    raise HTTPException(
+        status_code=404,
+        detail={
+            "error": "asset_not_found",
+            "message": f"ファイル '{file_name}' が見つかりません"
+        }
+    )
+
+async def _serve_asset(
+    request: Request, kind: str, file_name: str,
+    range_header: Optional[str], if_range: Optional[str],
+    if_none_match: Optional[str], if_modified_since: Optional[str]
+) -> Response:
+    path = await _resolve_asset(kind, file_name)
+    headers = {
+        "Accept-Ranges": "bytes",
+        "Cache-Control": f"public, max-age={settings.asset_stream_max_age}"
+    }
+
+    acquired = request.method == "GET"
+    if acquired and not stream_limiter.try_acquire():
+        raise HTTPException(
+            status_code=503,
+            detail={
+                "error": "too_many_streams",
+                "message": "同時配信数の上限に達しています"
+            },
+            headers={"Retry-After": "1"}
+        )
+
+    fd = None
+    try:
+        try:
+            fd = await anyio.to_thread.run_sync(os.open, path, os.O_RDONLY)
+        except FileNotFoundError:
+            raise HTTPException(
+                status_code=404,
+                detail={
+                    "error": "asset_not_found",
+                    "message": f"ファイル '{file_name}' が見つかりません"
+                }
+            )
+        # カタログと同じ署名を開いたファイルから取る（再スキャン前の変更も反映される）
+        stat = os.fstat(fd)
+        size = stat.st_size
+        etag = _etag([size, stat.st_mtime_ns])
+        headers["ETag"] = etag
+        headers["Last-Modified"] = formatdate(stat.st_mtime, usegmt=True)
+
+        if etag_matches(if_none_match, etag) or (
+            if_none_match is None and _not_modified_since(if_modified_since, stat.st_mtime_ns)
+        ):
+            return Response(status_code=304, headers=headers)
+
+        # If-Range が現在のETag・更新日時と一致しなければ範囲指定を無視して全体を返す
+        if if_range and if_range.strip() not in (etag, headers["Last-Modified"]):
+            range_header = None
+        try:
+            byte_range = parse_range(range_header, size)
+        except ValueError:
+            headers["Content-Range"] = f"bytes */{size}"
+            return Response(status_code=416, headers=headers)
+
+        if byte_range is None:
+            status_code, offset, count = 200, 0, size
+        else:
+            start, end = byte_range
+            status_code, offset, count = 206, start, end - start + 1
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        headers["Content-Length"] = str(count)
+        headers["Content-Type"] = mimetypes.guess_type(file_name)[0] or "application/octet-stream"
+
+        if request.method == "HEAD":
+            return Response(status_code=status_code, headers=headers)
+
+        response = FileRangeResponse(fd, offset, count, status_code, headers)
+        fd, acquired = None, False  # 以降はレスポンスが閉じる・解放する
+        return response
+    finally:
+        # オープン失敗（404等）・304・416でもファイルと配信枠を解放する
+        if fd is not None:
+            os.close(fd)
+        if acquired:
+            stream_limiter.release()
+
+@router.api_route("/videos/{file_name}", methods=["GET", "HEAD"])
+async def stream_video(
+    request: Request,
+    file_name: str,
+    range_header: Optional[str] = Header(None, alias="Range"),
+    if_range: Optional[str] = Header(None),
+    if_none_match: Optional[str] = Header(None),
+    if_modified_since: Optional[str] = Header(None)
+):
+    """
+    動画ファイルを配信（Range・条件付きリクエスト対応）
+    """
+    return await _serve_asset(request, "videos", file_name, range_header, if_range, if_none_match, if_modified_since)
+
+@router.api_route("/sync-data/{file_name}", methods=["GET", "HEAD"])
+async def stream_sync_data(
+    request: Request,
+    file_name: str,
+    range_header: Optional[str] = Header(None, alias="Range"),
+    if_range: Optional[str] = Header(None),
+    if_none_match: Optional[str] = Header(None),
+    if_modified_since: Optional[str] = Header(None)
+):
+    """
+    同期データJSONを配信（Range・条件付きリクエスト対応）
+    """
+    return await _serve_asset(request, "sync-data", file_name, range_header, if_range, if_none_match, if_modified_since)
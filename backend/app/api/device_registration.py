@@ -7,13 +7,11 @@ Manages device capabilities and generates device IDs for session management.
 
 from fastapi import APIRouter, HTTPException, status, Depends
 from fastapi.responses import JSONResponse
-import json
-import os
 import uuid
 import logging
 import asyncio
-from datetime import datetime, timedelta
-from pathlib import Path
+from datetime import datetime
+from typing import Optional
 
 from app.config.settings import settings
 from app.models.device import (
@@ -22,6 +20,7 @@ from app.models.device import (
     DeviceError,
     DeviceInfo
 )
+from app.services.device_registry import device_registry
 
 # ログ設定
 logger = logging.getLogger(__name__)
@@ -40,25 +39,17 @@ router = APIRouter(
     }
 )
 
-# デバイス情報の読み込み
-def load_device_data() -> dict:
-    """devices.jsonファイルからデバイス情報を読み込み"""
+def _product_lookup(product_code: str) -> Optional[DeviceInfo]:
+    """レジストリから製品情報を取得（devices.json を読めない場合は500）"""
     try:
-        # 環境変数からデータパスを取得
-        data_dir = settings.get_data_path()
-        devices_file = data_dir / "devices.json"
-        
-        with open(devices_file, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            logger.info(f"デバイス情報読み込み完了: {len(data.get('devices', {}))}件")
-            return data
+        return device_registry.get_product(product_code)
     except FileNotFoundError:
         logger.error("devices.jsonファイルが見つかりません")
         raise HTTPException(
             status_code=500,
             detail="デバイス情報ファイルが見つかりません"
         )
-    except json.JSONDecodeError as e:
+    except ValueError as e:
         logger.error(f"devices.jsonの解析エラー: {e}")
         raise HTTPException(
             status_code=500,
@@ -69,12 +60,12 @@ def generate_device_id() -> str:
     """ユニークなデバイスIDを生成"""
     return f"device_{uuid.uuid4().hex[:8]}"
 
-def validate_product_code(product_code: str, device_data: dict) -> DeviceInfo:
+def validate_product_code(product_code: str) -> DeviceInfo:
     """製品コードの検証とデバイス情報取得"""
-    devices = device_data.get('devices', {})
+    device_info = _product_lookup(product_code)
     
     # 製品コード存在確認
-    if product_code not in devices:
+    if device_info is None:
         raise HTTPException(
             status_code=404,
             detail={
@@ -83,11 +74,8 @@ def validate_product_code(product_code: str, device_data: dict) -> DeviceInfo:
             }
         )
     
-    # デバイス情報取得
-    device_info_dict = devices[product_code]
-    
     # デバイス有効性確認
-    if not device_info_dict.get('is_active', False):
+    if not device_info.is_active:
         raise HTTPException(
             status_code=400,
             detail={
@@ -96,19 +84,7 @@ def validate_product_code(product_code: str, device_data: dict) -> DeviceInfo:
             }
         )
     
-    # DeviceInfoモデルに変換
-    try:
-        device_info = DeviceInfo(**device_info_dict)
-        return device_info
-    except Exception as e:
-        logger.error(f"デバイス情報の変換エラー: {e}")
-        raise HTTPException(
-            status_code=500,
-            detail={
-                "error": "data_conversion_error",
-                "message": "デバイス情報の処理中にエラーが発生しました"
-            }
-        )
+    return device_info
 
 @router.post("/register", response_model=DeviceRegistrationResponse)
 async def register_device(request: DeviceRegistrationRequest):
@@ -122,20 +98,19 @@ async def register_device(request: DeviceRegistrationRequest):
     logger.info(f"デバイス登録リクエスト: {request.product_code}")
     
     try:
-        # デバイス情報読み込み
-        device_data = load_device_data()
-        
-        # 製品コード検証
-        device_info = validate_product_code(request.product_code, device_data)
+        # 製品コード検証（メモリ内のデバイスレジストリを参照）
+        device_info = validate_product_code(request.product_code)
         
         # デバイスID生成
         device_id = generate_device_id()
         
         # セッションタイムアウト設定
-        timeout_minutes = device_data.get('validation_rules', {}).get('session_timeout_minutes', 60)
+        timeout_minutes = device_registry.session_timeout_minutes()
+        
+        # 動画フィルタリング用に device_id → 機能リストを記録
+        device_registry.register(device_id, device_info, timeout_minutes)
         
         # デバッグモード検出
-        from app.config.settings import settings
         debug_mode = settings.is_debug_mode()
         device_status = "debug_ready" if debug_mode else "registered"
         
@@ -177,13 +152,10 @@ async def get_device_info(product_code: str):
     logger.info(f"デバイス情報取得リクエスト: {product_code}")
     
     try:
-        # デバイス情報読み込み
-        device_data = load_device_data()
-        
         # 製品コード検証（情報取得のみなので有効性チェックは緩和）
-        devices = device_data.get('devices', {})
+        device_info = _product_lookup(product_code)
         
-        if product_code not in devices:
+        if device_info is None:
             raise HTTPException(
                 status_code=404,
                 detail={
@@ -192,10 +164,6 @@ async def get_device_info(product_code: str):
                 }
             )
         
-        # デバイス情報返却
-        device_info_dict = devices[product_code]
-        device_info = DeviceInfo(**device_info_dict)
-        
         logger.info(f"デバイス情報取得成功: {device_info.device_name}")
         
         return device_info
@@ -256,7 +224,7 @@ async def test_device(request: dict):
     
     try:
         # WebSocket経由でデバイスにテスト指示を送信
-        from app.api.playback_control import ws_manager
+        from app.api.playback_control import ws_manager, Audience
         
         # 応答キューを作成
         response_queue = asyncio.Queue()
@@ -269,8 +237,8 @@ async def test_device(request: dict):
             'timestamp': datetime.now().isoformat()
         }
         
-        # デバイスへの送信（セッションIDに対応するWebSocket接続へ）
-        await ws_manager.send_to_session(session_id, test_message)
+        # デバイスへの送信（セッション内のデバイス接続のみ）
+        ws_manager.route(session_id, test_message, Audience.DEVICES)
         
         logger.info(f"📤 [API] デバイステスト指示送信完了: session_id={session_id}")
         logger.info(f"⏳ [API] デバイスからの応答を待機中...")
@@ -0,0 +1,14 @@
+"""
+HTTP キャッシュ - 条件付きリクエストの共通処理
+
+動画API（タイムライン取得）とアセット配信の両方で使う。
+"""
+
+from typing import Optional
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match ヘッダーがETagに一致するか（弱いETag・複数指定・* に対応）"""
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or any(tag.removeprefix("W/") == etag for tag in candidates)
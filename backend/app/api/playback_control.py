@@ -9,21 +9,34 @@ from fastapi import APIRouter, WebSocket, WebSocketDisconnect, HTTPException
 from fastapi.responses import JSONResponse
 import json
 import logging
-from typing import Dict, Set
+from typing import Dict, Deque, List, Tuple, Optional, Callable, Awaitable, Any, Union, Set
+from collections import deque
+from dataclasses import dataclass
+from enum import Enum
 import asyncio
 import time
+import uuid
 from datetime import datetime
 
+from app.config.settings import settings
+
 # 簡素化されたPlaybackモデルをインポート
 from app.models.playback import (
     SyncMessage, DeviceStatus,
     ConnectionEstablished, SyncAcknowledge, DeviceConnected,
     create_relay_data, validate_sync_message, validate_device_status
 )
+from app.models.tick_frame import TICK_SUBPROTOCOL, TICK_MESSAGE_TYPES, encode_tick_frame
 
 # 新しい同期サービスをインポート
 from app.services.sync_data_service import sync_data_service
 from app.services.continuous_sync_service import continuous_sync_service
+from app.services.timeline_transfer_service import timeline_transfer_service
+from app.services.relay_backplane import RelayBackplane, create_backplane
+from app.services.compiled_timeline import compiled_timeline_store
+from app.services.timeline_repository import timeline_repository
+from app.services.session_lifecycle import session_lifecycle
+from app.services.clock_sync import OneWayClockEstimator, compensate_media_time
 
 # ロガー設定
 logger = logging.getLogger(__name__)
@@ -31,114 +44,512 @@ logger = logging.getLogger(__name__)
 # APIルーター作成
 router = APIRouter(prefix="/api/playback", tags=["playback"])
 
+# 最新値のみ意味を持つ時刻系メッセージ（未送信分は最新値で上書き）
+CONFLATABLE_MESSAGE_TYPES = {"sync", "video_sync", "currentTime", "sync_ack"}
+# キュー上限を超えても絶対に破棄しないメッセージ
+CRITICAL_MESSAGE_TYPES = {
+    "sync_data_bulk_transmission", "stop_signal", "start_signal",
+    "timeline_chunk_begin", "timeline_chunk", "timeline_chunk_end",
+    "time_sync_response"
+}
+# コンテンツハッシュによるタイムライン配信（timeline_offer → have/need）に対応したデバイスの機能名
+FEATURE_TIMELINE_OFFER = "timeline_offer"
+# 圧縮チャンク分割転送（timeline_chunk_*）に対応したデバイスの機能名
+FEATURE_TIMELINE_CHUNKED = "timeline_chunked"
+
+@dataclass(frozen=True)
+class OutboundFrame:
+    """
+    送信用にエンコード済みの共有フレーム
+
+    1回のファンアウトで1度だけ json.dumps し、全接続の送信キューで同じ文字列を共有する。
+    時刻系メッセージはバイナリ版（binary）も同時に1度だけ生成し、
+    サブプロトコル合意済みの接続にはそちらを送る
+    """
+    message_type: Optional[str]
+    payload: str
+    size_bytes: int
+    binary: Optional[bytes] = None
+    # 未送信分を最新値で置き換えてよいか（イベントを運ぶティックは置き換えない）
+    conflatable: bool = False
+
+def encode_frame(message: Dict[str, Any], raw_fields: Optional[Dict[str, str]] = None) -> OutboundFrame:
+    """
+    メッセージを共有フレームにエンコード（1回のみ）
+
+    Args:
+        message: 送信メッセージ
+        raw_fields: エンコード済みJSON文字列をそのまま埋め込むフィールド
+                    （大きなタイムライン本体を再シリアライズしないため）
+    """
+    payload = json.dumps(message, ensure_ascii=False)
+    if raw_fields:
+        spliced = "".join(
+            f", {json.dumps(key)}: {raw_json}" for key, raw_json in raw_fields.items()
+        )
+        payload = payload[:-1] + spliced + "}" if message else "{" + spliced[2:] + "}"
+    message_type = message.get("type")
+    binary = None
+    if message_type in TICK_MESSAGE_TYPES and not raw_fields:
+        binary = encode_tick_frame(message)
+    return OutboundFrame(
+        message_type=message_type,
+        payload=payload,
+        size_bytes=len(payload.encode("utf-8")),
+        binary=binary,
+        conflatable=message_type in CONFLATABLE_MESSAGE_TYPES and not message.get("events")
+    )
+
+@dataclass
+class FanOutResult:
+    """ファンアウト配信結果"""
+    message_type: Optional[str]
+    targeted: int = 0
+    queued: int = 0
+    dropped: int = 0
+    frame_bytes: int = 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "message_type": self.message_type,
+            "targeted": self.targeted,
+            "queued": self.queued,
+            "dropped": self.dropped,
+            "frame_bytes": self.frame_bytes
+        }
+
+class ConnectionSender:
+    """
+    接続ごとの送信キューと常駐ライタータスク
+
+    呼び出し側はキューに積むだけで即座に戻るため、
+    遅い受信側がいてもセッション全体の中継をブロックしない。
+    時刻系メッセージはタイプごとに最新値のみ保持（conflation）し、
+    重要メッセージとイベントを運ぶティックはキュー上限に関係なく必ず送信する。
+    """
+    def __init__(self, websocket: WebSocket, connection_id: str, session_id: str, role: str,
+                 on_failure: Callable[[str, str], Awaitable[None]], binary_ticks: bool = False):
+        self.websocket = websocket
+        self.connection_id = connection_id
+        self.session_id = session_id
+        self.role = role
+        # 時刻系メッセージをバイナリフレームで送るか（サブプロトコル合意時のみ）
+        self.binary_ticks = binary_ticks
+        # クライアントが device_hello で申告した対応機能
+        self.features: Set[str] = set()
+        # この接続のデバイスが保持しているタイムライン（video_id → sha256。have応答・送信完了で更新）
+        self.timeline_digests: Dict[str, str] = {}
+        # sync メッセージの ts から推定する片道遅延・時計オフセット
+        self.clock = OneWayClockEstimator()
+        # デバイスが time_sync_report で報告したNTP方式の推定値（オフセット・往復遅延）
+        self.device_clock: Optional[Dict[str, Any]] = None
+        self.connected_at = datetime.now()
+        self.max_queue = settings.websocket_send_queue_size
+        self.send_timeout = settings.websocket_send_timeout
+        self._on_failure = on_failure
+        # 送信順キュー（conflation対象はキーのみ積み、本体は _latest に保持）
+        self._queue: Deque[Tuple[Optional[str], Optional[OutboundFrame]]] = deque()
+        self._latest: Dict[str, OutboundFrame] = {}
+        self._wakeup = asyncio.Event()
+        self._closed = False
+        self._task: Optional[asyncio.Task] = None
+        # 統計
+        self.sent_count = 0
+        self.sent_bytes = 0
+        self.dropped_count = 0
+        self.conflated_count = 0
+
+    def start(self):
+        """ライタータスク開始"""
+        self._task = asyncio.create_task(self._writer_loop())
+
+    @property
+    def pending(self) -> int:
+        return len(self._queue)
+
+    def enqueue(self, frame: OutboundFrame) -> bool:
+        """
+        送信キューに追加（ノンブロッキング）
+
+        Returns:
+            bool: キューに積めた（または最新値を更新した）場合True
+        """
+        if self._closed:
+            return False
+
+        message_type = frame.message_type
+        if frame.conflatable:
+            if message_type in self._latest:
+                # 未送信の古い時刻を最新値で置き換え（順序位置は維持）
+                self._latest[message_type] = frame
+                self.conflated_count += 1
+                return True
+            self._latest[message_type] = frame
+            self._queue.append((message_type, None))
+
+        elif message_type in CONFLATABLE_MESSAGE_TYPES:
+            # イベントを運ぶティックは置き換えも破棄もしない（イベントカーソルは既に進んでいるため）。
+            # 未送信の古いティックは順序位置ごと外し、時刻が逆行しないようにする
+            if self._latest.pop(message_type, None) is not None:
+                self._queue.remove((message_type, None))
+                self.conflated_count += 1
+            self._queue.append((None, frame))
+
+        elif message_type in CRITICAL_MESSAGE_TYPES or len(self._queue) < self.max_queue:
+            self._queue.append((None, frame))
+
+        else:
+            self.dropped_count += 1
+            logger.warning(f"[WS] 送信キュー満杯のため破棄: {self.connection_id} type={message_type}")
+            return False
+
+        self._wakeup.set()
+        return True
+
+    async def _writer_loop(self):
+        """キューを順に送信する常駐ループ"""
+        try:
+            while not self._closed:
+                if not self._queue:
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                    continue
+
+                conflate_key, frame = self._queue.popleft()
+                if conflate_key is not None:
+                    frame = self._latest.pop(conflate_key, None)
+                    if frame is None:
+                        continue
+
+                if self.binary_ticks and frame.binary is not None:
+                    send = self.websocket.send_bytes(frame.binary)
+                    size = len(frame.binary)
+                else:
+                    send = self.websocket.send_text(frame.payload)
+                    size = frame.size_bytes
+                await asyncio.wait_for(send, timeout=self.send_timeout)
+                self.sent_count += 1
+                self.sent_bytes += size
+
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.warning(f"[WS] 送信エラー {self.connection_id}: {e}")
+            self._closed = True
+            await self._on_failure(self.connection_id, self.session_id)
+
+    async def close(self):
+        """ライタータスク停止"""
+        self._closed = True
+        self._queue.clear()
+        self._latest.clear()
+        if self._task and not self._task.done() and self._task is not asyncio.current_task():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    def get_stats(self) -> Dict[str, Any]:
+        """送信統計"""
+        return {
+            "pending": self.pending,
+            "sent": self.sent_count,
+            "sent_bytes": self.sent_bytes,
+            "binary_ticks": self.binary_ticks,
+            "dropped": self.dropped_count,
+            "conflated": self.conflated_count,
+            "clock": self.clock.get_stats() if self.clock.samples else None,
+            "device_clock": self.device_clock
+        }
+
+# 接続ロール
+ROLE_FRONTEND = "frontend"
+ROLE_DEVICE = "device"
+CONNECTION_ROLES = (ROLE_FRONTEND, ROLE_DEVICE)
+
+class Audience(str, Enum):
+    """メッセージ配信先"""
+    SENDER = "sender"        # 送信元の接続のみ（応答・ACK）
+    FRONTENDS = "frontends"  # セッション内のフロントエンド
+    DEVICES = "devices"      # セッション内のデバイス
+    ALL = "all"              # セッション内の全接続
+
+AUDIENCE_ROLES = {
+    Audience.FRONTENDS: ROLE_FRONTEND,
+    Audience.DEVICES: ROLE_DEVICE,
+    Audience.ALL: None
+}
+
 class SimpleWebSocketManager:
     """
     シンプルなWebSocket接続管理
     receiver.pyのパターンを参考にした基本実装
+
+    接続は session → role → connection_id の3段インデックスで管理し、
+    ロール別の接続一覧をO(1)で取得できる。
+    送信は接続ごとの ConnectionSender に委譲し、呼び出し側は待たされない
     """
     def __init__(self):
-        # アクティブな接続を管理
-        self.active_connections: Dict[str, WebSocket] = {}
-        # セッション別接続リスト  
-        self.session_connections: Dict[str, Set[str]] = {}
+        # 接続ID → 送信キュー（WebSocket・セッション・ロールを保持）
+        self.senders: Dict[str, ConnectionSender] = {}
+        # セッション → ロール → 接続ID → 送信キュー
+        self.sessions: Dict[str, Dict[str, Dict[str, ConnectionSender]]] = {}
+        # インスタンス間中継（未接続なら単一インスタンス動作）
+        self.backplane: Optional[RelayBackplane] = None
+        
+    async def attach_backplane(self, backplane: RelayBackplane, handler: Callable[[Dict[str, Any]], Awaitable[None]]):
+        """バックプレーンを接続し、接続中のセッションについて他インスタンスからの受信を開始"""
+        await backplane.start(handler)
+        self.backplane = backplane
+        for session_id in list(self.sessions):
+            await backplane.join(session_id)
+    
+    async def detach_backplane(self):
+        """バックプレーンを切断"""
+        if self.backplane:
+            backplane, self.backplane = self.backplane, None
+            await backplane.stop()
+    
+    def publish(self, session_id: str, kind: str, data: Dict[str, Any], body: Optional[Union[str, bytes]] = None) -> bool:
+        """他インスタンスへ発行（バックプレーン未接続時は何もしない）"""
+        if self.backplane is None:
+            return False
+        return self.backplane.publish(session_id, kind, data, body=body)
+        
+    def new_connection_id(self, role: str, session_id: str) -> str:
+        """衝突しない接続IDを生成"""
+        while True:
+            connection_id = f"{role}_{session_id}_{uuid.uuid4().hex[:8]}"
+            if connection_id not in self.senders:
+                return connection_id
         
-    async def connect(self, websocket: WebSocket, connection_id: str, session_id: str):
+    async def connect(self, websocket: WebSocket, connection_id: str, session_id: str, role: str):
         """WebSocket接続を受け入れて管理開始"""
-        await websocket.accept()
-        self.active_connections[connection_id] = websocket
-        
-        # セッション別管理
-        if session_id not in self.session_connections:
-            self.session_connections[session_id] = set()
-        self.session_connections[session_id].add(connection_id)
-        
-        logger.info(f"[WS] 接続受け入れ: {connection_id} (session: {session_id})")
+        if role not in CONNECTION_ROLES:
+            raise ValueError(f"未知の接続ロール: {role}")
+        
+        # バイナリ時刻フレームはクライアントがサブプロトコルを提示した場合のみ有効
+        offered = websocket.scope.get("subprotocols") or []
+        subprotocol = TICK_SUBPROTOCOL if TICK_SUBPROTOCOL in offered else None
+        await websocket.accept(subprotocol=subprotocol)
+        
+        # 送信ライター起動
+        sender = ConnectionSender(
+            websocket, connection_id, session_id, role, self.disconnect,
+            binary_ticks=subprotocol is not None
+        )
+        sender.start()
+        self.senders[connection_id] = sender
+        
+        # セッション・ロール別インデックス
+        first_in_session = session_id not in self.sessions
+        roles = self.sessions.setdefault(session_id, {})
+        roles.setdefault(role, {})[connection_id] = sender
+        session_lifecycle.touch(session_id)
+        # セッションの最初のローカル接続で他インスタンスからの中継を購読
+        if first_in_session and self.backplane is not None:
+            await self.backplane.join(session_id)
+        
+        logger.info(
+            f"[WS] 接続受け入れ: {connection_id} (session: {session_id}, role: {role}, "
+            f"subprotocol: {subprotocol or 'json'})"
+        )
         
     async def disconnect(self, connection_id: str, session_id: str):
         """WebSocket接続を切断・クリーンアップ"""
-        if connection_id in self.active_connections:
-            del self.active_connections[connection_id]
-            
-        if session_id in self.session_connections:
-            self.session_connections[session_id].discard(connection_id)
-            # セッションに接続がなくなったら削除
-            if not self.session_connections[session_id]:
-                del self.session_connections[session_id]
+        sender = self.senders.pop(connection_id, None)
+        if not sender:
+            return
+        await sender.close()
+        
+        roles = self.sessions.get(sender.session_id, {})
+        connections = roles.get(sender.role)
+        if connections is not None:
+            connections.pop(connection_id, None)
+            if not connections:
+                del roles[sender.role]
+        # セッションに接続がなくなったら削除（アイドル時間は最後の切断から数える）
+        if not roles:
+            self.sessions.pop(sender.session_id, None)
+            session_lifecycle.touch(sender.session_id)
+            if self.backplane is not None:
+                await self.backplane.leave(sender.session_id)
                 
         logger.info(f"[WS] 接続切断: {connection_id} (session: {session_id})")
-        
-    async def _safe_send_text(self, websocket: WebSocket, message_json: str, connection_id: str) -> tuple[str, bool]:
-        """安全なメッセージ送信（並列化用）"""
-        try:
-            await websocket.send_text(message_json)
-            logger.info(f"[WS] メッセージ送信成功: {connection_id}")
-            return connection_id, True
-        except Exception as e:
-            logger.warning(f"[WS] 送信エラー {connection_id}: {e}")
-            return connection_id, False
+    
+    def has_session(self, session_id: str) -> bool:
+        """セッションに接続が存在するか"""
+        return session_id in self.sessions
+    
+    def get_connections(self, session_id: str, role: Optional[str] = None) -> Dict[str, ConnectionSender]:
+        """
+        セッション内の接続を取得
+        
+        Args:
+            session_id: セッションID
+            role: ロール指定時はそのロールのみ（O(1)参照）
+        """
+        roles = self.sessions.get(session_id)
+        if not roles:
+            return {}
+        if role is not None:
+            return roles.get(role, {})
+        merged: Dict[str, ConnectionSender] = {}
+        for connections in roles.values():
+            merged.update(connections)
+        return merged
+    
+    def count_connections(self, session_id: str, role: Optional[str] = None) -> int:
+        """セッション内の接続数"""
+        roles = self.sessions.get(session_id, {})
+        if role is not None:
+            return len(roles.get(role, ()))
+        return sum(len(connections) for connections in roles.values())
+    
+    @property
+    def total_connections(self) -> int:
+        return len(self.senders)
+    
+    @property
+    def session_count(self) -> int:
+        return len(self.sessions)
+        
+    def send_to_connection(self, connection_id: str, message: dict) -> bool:
+        """特定接続の送信キューにメッセージを追加"""
+        sender = self.senders.get(connection_id)
+        if not sender:
+            logger.warning(f"[WS] WebSocket接続が見つかりません: {connection_id}")
+            return False
+        return sender.enqueue(encode_frame(message))
 
-    async def send_to_session(self, session_id: str, message: dict):
-        """セッション内の全接続にメッセージ並列送信"""
-        if session_id not in self.session_connections:
-            logger.warning(f"[WS] セッションが存在しません: {session_id}")
-            return
-        
-        connection_count = len(self.session_connections[session_id])
-        logger.info(f"[WS] セッションメッセージ並列送信開始: session={session_id}, connections={connection_count}")
+    def fan_out(
+        self,
+        session_id: str,
+        message: Union[Dict[str, Any], OutboundFrame],
+        role: Optional[str] = None,
+        predicate: Optional[Callable[[str], bool]] = None,
+        publish: bool = True
+    ) -> FanOutResult:
+        """
+        セッション内の接続へメッセージを一括配信
+
+        メッセージは1度だけエンコードし、同じフレームを各接続の送信キューに積む。
+        ロール単位の配信はバックプレーン経由で他インスタンスの同セッション接続にも届く。
+        
+        Args:
+            session_id: セッションID
+            message: 送信メッセージ（またはエンコード済みフレーム）
+            role: 対象ロール（"device" / "frontend"）。Noneなら全接続
+            predicate: 接続IDによる追加フィルタ（接続単位の配信のため他インスタンスへは発行しない）
+            publish: Falseならこのインスタンスの接続のみ（他インスタンスから受信した分の再配信）
             
-        message_json = json.dumps(message, ensure_ascii=False)
-        send_tasks = []
-        
-        # 送信タスク作成
-        for connection_id in list(self.session_connections[session_id]):  # listでコピー
-            websocket = self.active_connections.get(connection_id)
-            if websocket:
-                task = asyncio.create_task(
-                    self._safe_send_text(websocket, message_json, connection_id)
-                )
-                send_tasks.append(task)
-            else:
-                logger.warning(f"[WS] WebSocket接続が見つかりません: {connection_id}")
-        
-        # 並列実行
-        if send_tasks:
-            try:
-                results = await asyncio.wait_for(
-                    asyncio.gather(*send_tasks, return_exceptions=True),
-                    timeout=1.5
-                )
+        Returns:
+            FanOutResult: 配信統計（このインスタンスの接続分のみ）
+        """
+        frame = message if isinstance(message, OutboundFrame) else encode_frame(message)
+        result = FanOutResult(message_type=frame.message_type, frame_bytes=frame.size_bytes)
+        
+        if publish and predicate is None:
+            self.publish(session_id, "fan_out", {
+                "role": role,
+                "message_type": frame.message_type,
+                "payload": frame.payload,
+                "conflatable": frame.conflatable
+            })
+        
+        roles = self.sessions.get(session_id)
+        if not roles:
+            return result
+        targets = (roles.get(role, {}),) if role is not None else tuple(roles.values())
+        
+        for connections in targets:
+            for connection_id, sender in connections.items():
+                if predicate and not predicate(connection_id):
+                    continue
                 
-                # 失敗した接続を特定してクリーンアップ
-                disconnected = []
-                success_count = 0
-                
-                for result in results:
-                    if isinstance(result, tuple):
-                        connection_id, success = result
-                        if success:
-                            success_count += 1
-                        else:
-                            disconnected.append(connection_id)
-                    elif isinstance(result, Exception):
-                        logger.error(f"[WS] 送信タスクでエラー: {result}")
-                
-                logger.info(f"[WS] 並列送信完了: {success_count}/{len(send_tasks)} 成功")
-                
-                # 失敗した接続をクリーンアップ
-                for connection_id in disconnected:
-                    await self.disconnect(connection_id, session_id)
-                    
-            except asyncio.TimeoutError:
-                logger.warning(f"[WS] セッション送信がタイムアウト: {session_id}")
-                for task in send_tasks:
-                    if not task.done():
-                        task.cancel()
-            except Exception as e:
-                logger.error(f"[WS] 並列送信でエラー: {e}")
+                result.targeted += 1
+                if sender.enqueue(frame):
+                    result.queued += 1
+                else:
+                    result.dropped += 1
+        
+        logger.debug(f"[WS] ファンアウト: session={session_id}, type={frame.message_type}, role={role}, {result.queued}/{result.targeted}")
+        return result
+
+    def route(
+        self,
+        session_id: str,
+        message: Union[Dict[str, Any], OutboundFrame],
+        audience: Audience,
+        reply_to: Optional[str] = None
+    ) -> FanOutResult:
+        """
+        配信先を明示してメッセージを送信
+        
+        Args:
+            session_id: セッションID
+            message: 送信メッセージ
+            audience: 配信先（送信元のみ / ロール指定 / 全接続）
+            reply_to: Audience.SENDER の場合の返信先接続ID
+        """
+        if audience == Audience.SENDER:
+            frame = message if isinstance(message, OutboundFrame) else encode_frame(message)
+            result = FanOutResult(message_type=frame.message_type, frame_bytes=frame.size_bytes)
+            sender = self.senders.get(reply_to) if reply_to else None
+            if sender:
+                result.targeted = 1
+                if sender.enqueue(frame):
+                    result.queued = 1
+                else:
+                    result.dropped = 1
+            return result
+        
+        return self.fan_out(session_id, message, role=AUDIENCE_ROLES[audience])
+
+    def receive_remote_fan_out(self, session_id: str, data: Dict[str, Any]) -> FanOutResult:
+        """他インスタンスが発行したファンアウトをこのインスタンスの接続へ配信（再発行しない）"""
+        payload = data.get("payload", "")
+        message_type = data.get("message_type")
+        binary = None
+        if message_type in TICK_MESSAGE_TYPES:
+            binary = encode_tick_frame(json.loads(payload))
+        frame = OutboundFrame(
+            message_type=message_type,
+            payload=payload,
+            size_bytes=len(payload.encode("utf-8")),
+            binary=binary,
+            conflatable=bool(data.get("conflatable"))
+        )
+        return self.fan_out(session_id, frame, role=data.get("role"), publish=False)
+
+    async def send_to_session(self, session_id: str, message: dict) -> int:
+        """
+        セッション内の全接続の送信キューにメッセージを追加
+
+        Returns:
+            int: キューに積めた接続数
+        """
+        if not self.has_session(session_id) and self.backplane is None:
+            logger.warning(f"[WS] セッションが存在しません: {session_id}")
+            return 0
+        return self.fan_out(session_id, message).queued
 
 # WebSocketManager インスタンス
 ws_manager = SimpleWebSocketManager()
 
+async def deliver(session_id: str, connection_id: str, message: dict, audience: Audience) -> FanOutResult:
+    """
+    メッセージハンドラー用の配信ヘルパー
+    
+    各ハンドラーは応答ごとに配信先（audience）を宣言する。
+    ACK類は Audience.SENDER とし、無関係なデバイスへのブロードキャストを避ける。
+    """
+    result = ws_manager.route(session_id, message, audience, reply_to=connection_id)
+    if result.targeted == 0:
+        logger.debug(f"[WS] 配信先なし: type={result.message_type}, audience={audience.value}, session={session_id}")
+    return result
+
 # ================================================================================
 # WebSocket エンドポイント
 # ================================================================================
@@ -152,18 +563,18 @@ async def sync_websocket(websocket: WebSocket, session_id: str):
     receiver.pyのhandler()関数パターンを参考
     """
     # ユニークな接続IDを生成
-    connection_id = f"frontend_{session_id}_{datetime.now().strftime('%H%M%S')}"
+    connection_id = ws_manager.new_connection_id(ROLE_FRONTEND, session_id)
     
     try:
         # 接続受け入れ
-        await ws_manager.connect(websocket, connection_id, session_id)
+        await ws_manager.connect(websocket, connection_id, session_id, ROLE_FRONTEND)
         
         # 接続確認メッセージ送信（Pydanticモデル使用）
         connection_msg = ConnectionEstablished(
             connection_id=connection_id,
             session_id=session_id
         )
-        await websocket.send_text(connection_msg.json())
+        ws_manager.send_to_connection(connection_id, connection_msg.dict())
         
         # FastAPI WebSocket 受信ループ (receiver.pyパターンを調整)
         while True:
@@ -186,25 +597,20 @@ async def sync_websocket(websocket: WebSocket, session_id: str):
                 
             except json.JSONDecodeError:
                 logger.error(f"[WS] JSON解析エラー: {message}")
-                try:
-                    await websocket.send_text(json.dumps({
-                        "type": "error",
-                        "message": "無効なJSONフォーマット",
-                        "received": message
-                    }))
-                except:
+                if not ws_manager.send_to_connection(connection_id, {
+                    "type": "error",
+                    "message": "無効なJSONフォーマット",
+                    "received": message
+                }):
                     logger.warning(f"[WS] エラー応答送信失敗: 接続切断済み")
                     break
                 
             except Exception as e:
                 logger.error(f"[WS] メッセージ処理エラー: {e}")
-                try:
-                    await websocket.send_text(json.dumps({
-                        "type": "error", 
-                        "message": f"メッセージ処理エラー: {str(e)}"
-                    }))
-                except:
-                    logger.warning(f"[WS] エラー応答送信失敗: 接続切断済み")
+                ws_manager.send_to_connection(connection_id, {
+                    "type": "error", 
+                    "message": f"メッセージ処理エラー: {str(e)}"
+                })
                 break
                 
     except WebSocketDisconnect:
@@ -223,25 +629,26 @@ async def device_websocket(websocket: WebSocket, session_id: str):
     デバイスハブ用WebSocket接続
     将来の実デバイス接続用
     """
-    connection_id = f"device_{session_id}_{datetime.now().strftime('%H%M%S')}"
+    connection_id = ws_manager.new_connection_id(ROLE_DEVICE, session_id)
     
     try:
-        await ws_manager.connect(websocket, connection_id, session_id)
+        await ws_manager.connect(websocket, connection_id, session_id, ROLE_DEVICE)
         
         # デバイス接続確認（Pydanticモデル使用）
         device_msg = DeviceConnected(
             connection_id=connection_id,
             session_id=session_id
         )
-        await websocket.send_text(device_msg.json())
+        ws_manager.send_to_connection(connection_id, device_msg.dict())
         
         while True:
             try:
                 message = await websocket.receive_text()
+                received_ms = time.time() * 1000
                 logger.info(f"[WS] デバイス受信 ({connection_id}): {message}")
                 
                 data = json.loads(message)
-                await handle_device_message(session_id, connection_id, data)
+                await handle_device_message(session_id, connection_id, data, received_ms)
                 
             except WebSocketDisconnect as e:
                 # 正常な切断 (1000) はログレベルを下げる
@@ -282,7 +689,7 @@ async def handle_sync_message(session_id: str, connection_id: str, data: dict):
             "server_time": datetime.now().isoformat()
         }
         logger.info(f"[SYNC] Hello応答送信: {response_message}")
-        await ws_manager.send_to_session(session_id, response_message)
+        await deliver(session_id, connection_id, response_message, Audience.SENDER)
     
     elif message_type == "timeline_data_request":
         # タイムラインファイル事前送信要求（ラズパイパターン）
@@ -290,9 +697,9 @@ async def handle_sync_message(session_id: str, connection_id: str, data: dict):
         logger.info(f"[SYNC] タイムラインデータ要求: {video_id} (session: {session_id})")
         
         try:
-            # タイムラインデータ準備・送信
+            # タイムラインデータ準備・送信（キャッシュ済みデバイスには通知のみ）
             bulk_data = await sync_data_service.send_timeline_data_bulk(session_id, video_id)
-            await ws_manager.send_to_session(session_id, bulk_data)
+            await deliver_timeline(session_id, bulk_data)
             logger.info(f"[SYNC] タイムラインデータ送信完了: {video_id}")
             
         except Exception as e:
@@ -302,7 +709,7 @@ async def handle_sync_message(session_id: str, connection_id: str, data: dict):
                 "video_id": video_id,
                 "error": str(e)
             }
-            await ws_manager.send_to_session(session_id, error_response)
+            await deliver(session_id, connection_id, error_response, Audience.SENDER)
     
     elif message_type == "start_continuous_sync":
         # 連続時間同期開始要求
@@ -310,7 +717,7 @@ async def handle_sync_message(session_id: str, connection_id: str, data: dict):
         
         async def sync_callback(time_data: dict):
             """時間更新コールバック - デバイスに中継"""
-            await relay_sync_to_devices(session_id, time_data)
+            await relay_to_devices(session_id, time_data)
         
         try:
             await continuous_sync_service.start_continuous_sync(session_id, sync_callback)
@@ -320,7 +727,7 @@ async def handle_sync_message(session_id: str, connection_id: str, data: dict):
                 "session_id": session_id,
                 "message": "連続同期を開始しました"
             }
-            await ws_manager.send_to_session(session_id, response)
+            await deliver(session_id, connection_id, response, Audience.FRONTENDS)
             
         except Exception as e:
             logger.error(f"[SYNC] 連続同期開始エラー: {e}")
@@ -328,7 +735,7 @@ async def handle_sync_message(session_id: str, connection_id: str, data: dict):
                 "type": "continuous_sync_error", 
                 "error": str(e)
             }
-            await ws_manager.send_to_session(session_id, error_response)
+            await deliver(session_id, connection_id, error_response, Audience.SENDER)
     
     elif message_type == "stop_continuous_sync":
         # 連続時間同期停止
@@ -341,7 +748,7 @@ async def handle_sync_message(session_id: str, connection_id: str, data: dict):
             "session_id": session_id,
             "message": "連続同期を停止しました"
         }
-        await ws_manager.send_to_session(session_id, response)
+        await deliver(session_id, connection_id, response, Audience.FRONTENDS)
     
     elif message_type == "sync_control":
         # 同期制御（pause/resume/seek）
@@ -362,23 +769,35 @@ async def handle_sync_message(session_id: str, connection_id: str, data: dict):
             "action": action,
             "status": status
         }
-        await ws_manager.send_to_session(session_id, response)
+        await deliver(session_id, connection_id, response, Audience.SENDER)
         
     elif message_type == "sync":
         # 従来の動画同期メッセージ（既存機能維持）
+        server_receive_ms = time.time() * 1000
         current_time = data.get("time", 0)
         state = data.get("state", "unknown")
         duration = data.get("duration")
         ts = data.get("ts")
         
-        logger.info(f"[SYNC] 動画同期: {state} at {current_time}s (session: {session_id})")
+        # ts から送信→受信の遅延を推定し、受信時点のメディア時刻に補正
+        delay_ms = None
+        corrected_time = current_time
+        sender = ws_manager.senders.get(connection_id)
+        if sender is not None and isinstance(ts, (int, float)) and isinstance(current_time, (int, float)):
+            delay_ms = sender.clock.observe(ts, server_receive_ms)
+            corrected_time = compensate_media_time(current_time, state, delay_ms)
+        
+        logger.info(f"[SYNC] 動画同期: {state} at {current_time}s → {corrected_time}s (session: {session_id})")
         
         # 同期データサービスに時刻更新
-        time_state = sync_data_service.update_current_time(session_id, current_time, state == "play")
+        time_state = sync_data_service.update_current_time(session_id, corrected_time, state == "play")
         
-        # 受信データをそのままデバイスに中継（receiver.pyパターン）
-        relay_data = create_relay_data(session_id, data)
-        await relay_sync_to_devices(session_id, relay_data)
+        # 補正済み時刻と、その時刻が対応するサーバー時刻を付けてデバイスに中継（receiver.pyパターン）
+        relay_data = create_relay_data(
+            session_id, data, video_time=corrected_time,
+            server_timestamp=int(server_receive_ms), estimated_delay_ms=delay_ms
+        )
+        await relay_to_devices(session_id, relay_data)
         
         # フロントエンドに確認応答
         sync_ack = SyncAcknowledge(
@@ -387,7 +806,7 @@ async def handle_sync_message(session_id: str, connection_id: str, data: dict):
             received_state=state,
             relayed_to_devices=True
         )
-        await ws_manager.send_to_session(session_id, sync_ack.dict())
+        await deliver(session_id, connection_id, sync_ack.dict(), Audience.SENDER)
         
     elif message_type == "start_signal":
         # スタート信号をデバイスに中継
@@ -403,7 +822,7 @@ async def handle_sync_message(session_id: str, connection_id: str, data: dict):
         }
         
         # デバイスに信号を送信
-        sent_count = await relay_start_signal_to_devices(session_id, start_signal_data)
+        sent_count = await relay_to_devices(session_id, start_signal_data, tag="START_SIGNAL_RELAY")
         
         # 送信結果をフロントエンドに返す
         response = {
@@ -413,7 +832,7 @@ async def handle_sync_message(session_id: str, connection_id: str, data: dict):
             "sent_to_devices": sent_count,
             "message": f"スタート信号を{sent_count}台のデバイスに送信しました" if sent_count > 0 else "接続されたデバイスがありません"
         }
-        await ws_manager.send_to_session(session_id, response)
+        await deliver(session_id, connection_id, response, Audience.SENDER)
         
     elif message_type == "stop_signal":
         # ストップ信号をデバイスに中継（全ハードウェア停止）
@@ -430,7 +849,7 @@ async def handle_sync_message(session_id: str, connection_id: str, data: dict):
         }
         
         # デバイスに信号を送信
-        sent_count = await relay_stop_signal_to_devices(session_id, stop_signal_data)
+        sent_count = await relay_to_devices(session_id, stop_signal_data, tag="STOP_SIGNAL_RELAY")
         
         # 送信結果をフロントエンドに返す
         response = {
@@ -440,16 +859,33 @@ async def handle_sync_message(session_id: str, connection_id: str, data: dict):
             "sent_to_devices": sent_count,
             "message": f"ストップ信号を{sent_count}台のデバイスに送信しました" if sent_count > 0 else "接続されたデバイスがありません"
         }
-        await ws_manager.send_to_session(session_id, response)
+        await deliver(session_id, connection_id, response, Audience.SENDER)
         
     else:
         logger.warning(f"[SYNC] 未知のメッセージタイプ: {message_type}")
 
-async def handle_device_message(session_id: str, connection_id: str, data: dict):
+async def handle_device_message(session_id: str, connection_id: str, data: dict, received_ms: Optional[float] = None):
     """
     デバイスメッセージ処理（Pydanticモデル使用）
+    
+    Args:
+        received_ms: 受信時刻（エポックミリ秒。time_sync_request の t1 に使う）
     """
     message_type = data.get("type")
+    
+    if message_type == "time_sync_request":
+        # NTP方式の時刻同期：受信時刻 t1 と送信時刻 t2（エポックミリ秒）を返す
+        # 頻度が高く遅延に敏感なため、ログ出力より前に最短経路で応答する
+        t1 = received_ms if received_ms is not None else time.time() * 1000
+        await deliver(session_id, connection_id, {
+            "type": "time_sync_response",
+            "seq": data.get("seq"),
+            "t0": data.get("t0"),
+            "t1": t1,
+            "t2": time.time() * 1000
+        }, Audience.SENDER)
+        return
+    
     logger.info(f"[DEVICE] メッセージ受信: {message_type} from {connection_id}")
     
     if message_type == "device_status":
@@ -462,13 +898,98 @@ async def handle_device_message(session_id: str, connection_id: str, data: dict)
         device_status = DeviceStatus(**data)
         logger.info(f"[DEVICE] デバイス状態更新: {device_status.device_id} - {device_status.status}")
         
-        # 基本的な応答
-        await ws_manager.send_to_session(session_id, {
+        # 基本的な応答（送信元デバイスのみ）
+        await deliver(session_id, connection_id, {
             "type": "device_ack",
             "received_type": message_type,
             "device_id": device_status.device_id,
             "server_time": datetime.now().isoformat()
-        })
+        }, Audience.SENDER)
+        
+    elif message_type == "device_hello":
+        # デバイスの対応機能を記録
+        sender = ws_manager.senders.get(connection_id)
+        if sender:
+            sender.features = set(data.get("features") or [])
+            logger.info(f"[DEVICE] 対応機能: {connection_id} {sorted(sender.features)}")
+        await deliver(session_id, connection_id, {
+            "type": "device_ack",
+            "received_type": message_type,
+            "server_time": datetime.now().isoformat()
+        }, Audience.SENDER)
+        
+    elif message_type == "time_sync_report":
+        # デバイス側の推定値を記録（/connections で確認可能）
+        sender = ws_manager.senders.get(connection_id)
+        if sender:
+            sender.device_clock = {
+                "offset_ms": data.get("offset_ms"),
+                "rtt_ms": data.get("rtt_ms"),
+                "samples": data.get("total_samples"),
+                "reported_at": datetime.now().isoformat()
+            }
+            logger.info(f"[DEVICE] 時刻同期: {connection_id} offset={data.get('offset_ms')}ms rtt={data.get('rtt_ms')}ms")
+        
+    elif message_type == "timeline_offer_response":
+        # タイムライン通知への have/need 応答
+        sha256 = data.get("sha256")
+        status = data.get("status")
+        if status == "have":
+            logger.info(f"[DEVICE] タイムラインキャッシュ使用: {connection_id} video={data.get('video_id')} sha256={str(sha256)[:12]}")
+            sender = ws_manager.senders.get(connection_id)
+            if sender and sha256:
+                sender.timeline_digests[data.get("video_id")] = sha256
+            return
+        
+        content = sync_data_service.get_timeline_content(session_id, sha256) if sha256 else None
+        if not content:
+            logger.warning(f"[DEVICE] 要求されたタイムラインが見つかりません: sha256={sha256}")
+            await deliver(session_id, connection_id, {
+                "type": "timeline_data_error",
+                "video_id": data.get("video_id"),
+                "error": "timeline content not found"
+            }, Audience.SENDER)
+            return
+        
+        logger.info(f"[DEVICE] タイムライン本体送信: {connection_id} video={content['video_id']} {content['size']}B")
+        await push_timeline(
+            session_id, content["video_id"], content["canonical_json"],
+            content["transmission_metadata"], connection_ids=[connection_id], tag="TIMELINE_NEED"
+        )
+        
+    elif message_type in ("timeline_chunk_ack", "timeline_transfer_resume", "timeline_transfer_complete"):
+        # 分割転送の進捗・再開・完了
+        transfer = timeline_transfer_service.get_transfer(session_id, data.get("transfer_id", ""))
+        if not transfer:
+            logger.warning(f"[DEVICE] 不明または期限切れの転送: {data.get('transfer_id')}")
+            await deliver(session_id, connection_id, {
+                "type": "timeline_transfer_error",
+                "transfer_id": data.get("transfer_id"),
+                "error": "transfer not found or expired"
+            }, Audience.SENDER)
+            return
+        
+        device_key = data.get("device_id") or connection_id
+        next_seq = int(data.get("next_seq", 0))
+        
+        if message_type == "timeline_chunk_ack":
+            timeline_transfer_service.record_ack(transfer, device_key, next_seq)
+        elif message_type == "timeline_transfer_resume":
+            # 再接続後：デバイスが保持している位置の続きから再送
+            timeline_transfer_service.record_ack(transfer, device_key, next_seq)
+            logger.info(f"[DEVICE] 分割転送再開: {transfer['transfer_id'][:8]} from seq={next_seq} ({connection_id})")
+            send_transfer(session_id, transfer, [connection_id], start_seq=next_seq)
+        elif data.get("status") == "ok":
+            timeline_transfer_service.record_complete(transfer, device_key)
+            # 保持ダイジェストは内容のsha256（転送ペイロードの payload_sha256 ではない）
+            sender = ws_manager.senders.get(connection_id)
+            if sender and transfer["content_sha256"]:
+                sender.timeline_digests[transfer["video_id"]] = transfer["content_sha256"]
+            logger.info(f"[DEVICE] 分割転送完了: {transfer['transfer_id'][:8]} ({device_key})")
+        else:
+            # ダイジェスト不一致等：最初から再送
+            logger.warning(f"[DEVICE] 分割転送失敗のため再送: {transfer['transfer_id'][:8]} error={data.get('error')}")
+            send_transfer(session_id, transfer, [connection_id], start_seq=0)
         
     elif message_type == "device_test_result":
         # デバイステスト結果を処理
@@ -479,12 +1000,12 @@ async def handle_device_message(session_id: str, connection_id: str, data: dict)
         await handle_device_test_result(session_id, data)
         
     else:
-        # その他のメッセージ
-        await ws_manager.send_to_session(session_id, {
+        # その他のメッセージ（送信元デバイスのみ）
+        await deliver(session_id, connection_id, {
             "type": "device_ack",
             "received_type": message_type,
             "server_time": datetime.now().isoformat()
-        })
+        }, Audience.SENDER)
 
 # ================================================================================
 # REST API エンドポイント（基本情報）
@@ -497,13 +1018,14 @@ async def get_playback_status():
         "service": "playback_control",
         "version": "0.2.0",  # Pydanticモデル対応版
         "status": "running", 
-        "active_connections": len(ws_manager.active_connections),
-        "active_sessions": len(ws_manager.session_connections),
+        "active_connections": ws_manager.total_connections,
+        "active_sessions": ws_manager.session_count,
         "server_time": datetime.now().isoformat(),
         "features": [
             "websocket_sync",
             "pydantic_models", 
             "parallel_relay",
+            "per_connection_send_queue",
             "error_handling"
         ]
     }
@@ -512,12 +1034,20 @@ async def get_playback_status():
 async def get_connections():
     """アクティブ接続情報"""
     return {
-        "total_connections": len(ws_manager.active_connections),
-        "session_count": len(ws_manager.session_connections),
+        "total_connections": ws_manager.total_connections,
+        "session_count": ws_manager.session_count,
         "sessions": {
-            session_id: len(connections) 
-            for session_id, connections in ws_manager.session_connections.items()
-        }
+            session_id: {
+                role: len(connections)
+                for role, connections in roles.items()
+            }
+            for session_id, roles in ws_manager.sessions.items()
+        },
+        "send_queues": {
+            connection_id: sender.get_stats()
+            for connection_id, sender in ws_manager.senders.items()
+        },
+        "backplane": ws_manager.backplane.get_stats() if ws_manager.backplane else None
     }
 
 # ================================================================================
@@ -543,8 +1073,8 @@ async def load_timeline_debug(session_id: str, video_id: str = "demo1"):
         raise HTTPException(status_code=400, detail=f"タイムライン読み込み失敗: {str(e)}")
 
 @router.post("/debug/sync/{session_id}/start")
-async def start_debug_sync(session_id: str, interval: float = 0.5):
-    """デバッグ用: 連続同期開始"""
+async def start_debug_sync(session_id: str, interval: Optional[float] = None):
+    """デバッグ用: 連続同期開始（interval 未指定ならタイムラインに合わせた可変間隔）"""
     try:
         # タイムライン状態確認
         timeline_state = sync_data_service.get_timeline_state(session_id)
@@ -656,7 +1186,7 @@ async def send_start_signal(session_id: str):
         }
         
         # デバイスに信号を送信
-        sent_count = await relay_start_signal_to_devices(session_id, start_signal_data)
+        sent_count = await relay_to_devices(session_id, start_signal_data, tag="START_SIGNAL_RELAY")
         
         if sent_count == 0:
             logger.warning(f"[START_SIGNAL] デバイス未接続: session={session_id}")
@@ -707,7 +1237,7 @@ async def send_stop_signal(session_id: str):
         }
         
         # デバイスに信号を送信
-        sent_count = await relay_stop_signal_to_devices(session_id, stop_signal_data)
+        sent_count = await relay_to_devices(session_id, stop_signal_data, tag="STOP_SIGNAL_RELAY")
         
         if sent_count == 0:
             logger.warning(f"[STOP_SIGNAL] デバイス未接続: session={session_id}")
@@ -736,212 +1266,240 @@ async def get_all_debug_syncs():
     """デバッグ用: 全セッションの同期状態"""
     return {
         "active_syncs": continuous_sync_service.get_all_active_syncs(),
-        "total_sessions": len(continuous_sync_service.get_all_active_syncs())
+        "total_sessions": len(continuous_sync_service.get_all_active_syncs()),
+        "scheduler": continuous_sync_service.get_scheduler_stats(),
+        "compiled_timelines": compiled_timeline_store.get_stats(),
+        "timeline_repository": timeline_repository.get_stats()
     }
 
+@router.get("/debug/sessions")
+async def get_session_stats():
+    """デバッグ用: セッションごとのアイドル時間・メモリ概算と回収数"""
+    return session_lifecycle.get_stats()
+
 # ================================================================================
 # デバイス中継機能
 # ================================================================================
 
-async def safe_send_to_device(websocket: WebSocket, sync_data: dict, connection_id: str) -> bool:
+async def relay_to_devices(session_id: str, message: Union[dict, OutboundFrame], tag: str = "RELAY") -> int:
     """
-    デバイスへの安全な送信処理
-    例外処理とログを含む個別送信タスク
+    メッセージをセッション内のデバイス（ラズベリーパイ）へ中継
+    
+    同期データ・スタート信号・ストップ信号など全てのデバイス向け中継の共通経路。
+    エンコードは1回のみで、デバイス台数が増えてもシリアライズコストは一定。
+    ストップ信号・タイムライン一括送信は送信キューが満杯でも破棄されない。
+    
+    Args:
+        session_id: セッションID
+        message: 送信メッセージ（またはエンコード済みフレーム）
+        tag: ログ用タグ
+        
+    Returns:
+        int: 送信キューへの投入に成功したデバイス数
     """
-    try:
-        message_json = json.dumps(sync_data, ensure_ascii=False)
-        await websocket.send_text(message_json)
-        logger.info(f"[RELAY] デバイス {connection_id} に中継成功")
-        return True
-    except Exception as e:
-        logger.error(f"[RELAY] デバイス {connection_id} への中継エラー: {e}")
-        return False
+    # 他インスタンスに接続したデバイスへはバックプレーン経由で届く（戻り値はこのインスタンス分）
+    result = ws_manager.route(session_id, message, Audience.DEVICES)
+    
+    if result.targeted == 0:
+        logger.warning(f"[{tag}] セッション {session_id} にアクティブなデバイス接続がありません")
+        return 0
+    
+    logger.debug(f"[{tag}] {result.queued}/{result.targeted} デバイスに中継 ({result.frame_bytes}B)")
+    return result.queued
 
-async def relay_sync_to_devices(session_id: str, sync_data: dict):
+def send_transfer(session_id: str, transfer: Dict[str, Any], connection_ids: List[str], start_seq: int = 0) -> int:
     """
-    同期データをデバイス（ラズベリーパイ）に並列中継
+    分割転送のチャンクを指定接続へ送信
     
-    修正内容：
-    - 順次送信 → 並列送信による高速化
-    - 個別例外処理による安定性向上
-    - タイムアウト制御による応答性確保
-    """
-    logger.info(f"[RELAY] セッション {session_id} のデバイスに同期データ並列中継")
+    各チャンクは1度だけエンコードし、対象接続の送信キューで共有する。
     
-    # セッション内のデバイス接続を探す
-    if session_id not in ws_manager.session_connections:
-        logger.warning(f"[RELAY] セッション {session_id} が存在しません")
-        return
+    Args:
+        start_seq: 再開時の開始チャンク番号（それ以前は送らない）
     
-    device_tasks = []
-    device_count = 0
-    
-    for connection_id in ws_manager.session_connections[session_id]:
-        if connection_id.startswith("device_"):
-            websocket = ws_manager.active_connections.get(connection_id)
-            if websocket:
-                # 並列送信タスク作成
-                task = asyncio.create_task(
-                    safe_send_to_device(websocket, sync_data, connection_id)
-                )
-                device_tasks.append(task)
-                device_count += 1
-    
-    if not device_tasks:
-        logger.warning(f"[RELAY] セッション {session_id} にアクティブなデバイス接続がありません")
-        return
+    Returns:
+        int: 開始メッセージをキューに積めた接続数
+    """
+    targets = set(connection_ids)
+    in_targets = lambda connection_id: connection_id in targets
     
-    # 並列実行（2秒タイムアウト）
-    try:
-        results = await asyncio.wait_for(
-            asyncio.gather(*device_tasks, return_exceptions=True),
-            timeout=2.0
-        )
-        
-        # 成功数カウント
-        success_count = sum(1 for result in results if result is True)
-        logger.info(f"[RELAY] {success_count}/{device_count} デバイスに並列中継完了")
-        
-    except asyncio.TimeoutError:
-        logger.warning(f"[RELAY] デバイス中継がタイムアウト ({device_count}台)")
-        # タスクをキャンセル
-        for task in device_tasks:
-            if not task.done():
-                task.cancel()
-    except Exception as e:
-        logger.error(f"[RELAY] 並列中継でエラー: {e}")
+    begin = ws_manager.fan_out(session_id, timeline_transfer_service.begin_message(transfer), role=ROLE_DEVICE, predicate=in_targets)
+    for seq in range(max(start_seq, 0), len(transfer["chunks"])):
+        ws_manager.fan_out(session_id, timeline_transfer_service.chunk_message(transfer, seq), role=ROLE_DEVICE, predicate=in_targets)
+    ws_manager.fan_out(session_id, timeline_transfer_service.end_message(transfer), role=ROLE_DEVICE, predicate=in_targets)
+    return begin.queued
 
-async def relay_start_signal_to_devices(session_id: str, start_signal_data: dict) -> int:
+async def push_timeline(
+    session_id: str,
+    video_id: str,
+    payload_json: Union[str, bytes],
+    transmission_metadata: Dict[str, Any],
+    connection_ids: Optional[List[str]] = None,
+    tag: str = "TIMELINE",
+    publish: bool = True
+) -> int:
     """
-    スタート信号をデバイス（ラズベリーパイ）に並列送信
+    タイムライン本体をデバイスへ送信
+    
+    分割転送対応デバイスには閾値を超えるタイムラインを圧縮チャンクで送り、
+    それ以外には従来の sync_data_bulk_transmission（1フレーム）で送る。
     
     Args:
-        session_id: セッションID
-        start_signal_data: 送信するスタート信号データ
-        
+        payload_json: エンコード済みのタイムラインJSON（str / UTF-8 bytes。再シリアライズせず、
+                      必要な送信経路でのみ相互変換する）
+        connection_ids: 対象デバイス接続（Noneならセッション内の全デバイス。他インスタンスにも発行）
+    
     Returns:
-        int: 送信に成功したデバイス数
+        int: 送信をキューに積めたデバイス数（このインスタンス分）
     """
-    logger.info(f"[START_SIGNAL_RELAY] セッション {session_id} のデバイスにスタート信号並列送信")
+    if connection_ids is None:
+        connection_ids = list(ws_manager.get_connections(session_id, ROLE_DEVICE))
+        if publish:
+            ws_manager.publish(session_id, "push_timeline", {
+                "video_id": video_id,
+                "transmission_metadata": transmission_metadata
+            }, body=payload_json)
     
-    # セッション内のデバイス接続を探す
-    if session_id not in ws_manager.session_connections:
-        logger.warning(f"[START_SIGNAL_RELAY] セッション {session_id} が存在しません")
-        return 0
+    payload = payload_json if isinstance(payload_json, bytes) else payload_json.encode("utf-8")
+    chunked_ids, bulk_ids = [], set()
+    for connection_id in connection_ids:
+        sender = ws_manager.senders.get(connection_id)
+        if sender and FEATURE_TIMELINE_CHUNKED in sender.features and len(payload) > settings.timeline_chunk_threshold:
+            chunked_ids.append(connection_id)
+        else:
+            bulk_ids.add(connection_id)
     
-    device_tasks = []
-    device_count = 0
-    
-    for connection_id in ws_manager.session_connections[session_id]:
-        if connection_id.startswith("device_"):
-            websocket = ws_manager.active_connections.get(connection_id)
-            if websocket:
-                # 並列送信タスク作成
-                task = asyncio.create_task(
-                    safe_send_to_device(websocket, start_signal_data, connection_id)
-                )
-                device_tasks.append(task)
-                device_count += 1
-    
-    if not device_tasks:
-        logger.warning(f"[START_SIGNAL_RELAY] セッション {session_id} にアクティブなデバイス接続がありません")
-        return 0
+    queued = 0
+    if bulk_ids:
+        bulk_frame = encode_frame({
+            "type": "sync_data_bulk_transmission",
+            "session_id": session_id,
+            "video_id": video_id,
+            "transmission_metadata": transmission_metadata
+        }, raw_fields={
+            # 一括送信はテキストフレームのため、bytes で受け取った場合はここで1度だけデコード
+            "sync_data": payload_json if isinstance(payload_json, str) else payload_json.decode("utf-8")
+        })
+        queued += ws_manager.fan_out(
+            session_id, bulk_frame, role=ROLE_DEVICE,
+            predicate=lambda connection_id: connection_id in bulk_ids
+        ).queued
+        # 一括送信は受信側で即保存されるため、送信時点で保持済みとみなす
+        # （内容のsha256が分かっている場合のみ。受信したままのJSONは正規化前なので記録しない）
+        digest = transmission_metadata.get("sha256")
+        for connection_id in bulk_ids:
+            sender = ws_manager.senders.get(connection_id)
+            if sender and digest:
+                sender.timeline_digests[video_id] = digest
     
-    # 並列実行（2秒タイムアウト）
-    try:
-        results = await asyncio.wait_for(
-            asyncio.gather(*device_tasks, return_exceptions=True),
-            timeout=2.0
-        )
-        
-        # 成功数カウント
-        success_count = sum(1 for result in results if result is True)
-        logger.info(f"[START_SIGNAL_RELAY] {success_count}/{device_count} デバイスにスタート信号送信完了")
-        return success_count
-        
-    except asyncio.TimeoutError:
-        logger.warning(f"[START_SIGNAL_RELAY] スタート信号送信がタイムアウト ({device_count}台)")
-        # タスクをキャンセル
-        for task in device_tasks:
-            if not task.done():
-                task.cancel()
-        return 0
-    except Exception as e:
-        logger.error(f"[START_SIGNAL_RELAY] 並列送信でエラー: {e}")
-        return 0
+    if chunked_ids:
+        transfer = await timeline_transfer_service.create_transfer(session_id, video_id, payload, transmission_metadata)
+        queued += send_transfer(session_id, transfer, chunked_ids)
+    
+    logger.info(f"[{tag}] タイムライン本体送信: 一括 {len(bulk_ids)}台 / 分割 {len(chunked_ids)}台 ({len(payload)}B)")
+    return queued
 
-async def relay_stop_signal_to_devices(session_id: str, stop_signal_data: dict) -> int:
+async def deliver_timeline(session_id: str, bulk_message: Dict[str, Any], tag: str = "TIMELINE", publish: bool = True) -> int:
     """
-    ストップ信号をデバイス（ラズベリーパイ）に並列送信
+    タイムラインをコンテンツハッシュ経由でデバイスへ配信
     
-    全てのアクチュエータを停止させるための信号を送信する。
-    一時停止や動画終了時に使用される。
+    timeline_offer 対応デバイスには {video_id, sha256, size} のみを通知し、
+    デバイスが "need" と応答した場合に限り本体を送る（handle_device_message）。
+    未対応デバイスには従来どおり本体を一括送信する。
     
-    Args:
-        session_id: セッションID
-        stop_signal_data: 送信するストップ信号データ
-        
     Returns:
-        int: 送信に成功したデバイス数
+        int: 通知または本体送信をキューに積めたデバイス数（このインスタンス分）
     """
-    logger.info(f"[STOP_SIGNAL_RELAY] セッション {session_id} のデバイスにストップ信号並列送信")
+    if publish:
+        ws_manager.publish(session_id, "deliver_timeline", {"bulk_message": bulk_message})
     
-    # セッション内のデバイス接続を探す
-    if session_id not in ws_manager.session_connections:
-        logger.warning(f"[STOP_SIGNAL_RELAY] セッション {session_id} が存在しません")
-        return 0
+    metadata = bulk_message.get("transmission_metadata") or {}
+    content = sync_data_service.get_timeline_content(session_id, metadata.get("sha256", ""))
+    if content is None:
+        content = sync_data_service.register_timeline_content(
+            session_id, bulk_message.get("video_id"), bulk_message.get("sync_data") or {}, metadata
+        )
     
-    device_tasks = []
-    device_count = 0
-    
-    for connection_id in ws_manager.session_connections[session_id]:
-        if connection_id.startswith("device_"):
-            websocket = ws_manager.active_connections.get(connection_id)
-            if websocket:
-                # 並列送信タスク作成
-                task = asyncio.create_task(
-                    safe_send_to_device(websocket, stop_signal_data, connection_id)
-                )
-                device_tasks.append(task)
-                device_count += 1
-    
-    if not device_tasks:
-        logger.warning(f"[STOP_SIGNAL_RELAY] セッション {session_id} にアクティブなデバイス接続がありません")
-        return 0
+    def supports_offer(connection_id: str) -> bool:
+        sender = ws_manager.senders.get(connection_id)
+        return sender is not None and FEATURE_TIMELINE_OFFER in sender.features
     
-    # 並列実行（2秒タイムアウト）
-    try:
-        results = await asyncio.wait_for(
-            asyncio.gather(*device_tasks, return_exceptions=True),
-            timeout=2.0
+    offered = ws_manager.fan_out(session_id, {
+        "type": "timeline_offer",
+        "session_id": session_id,
+        "video_id": content["video_id"],
+        "sha256": content["sha256"],
+        "size": content["size"],
+        "transmission_metadata": content["transmission_metadata"]
+    }, role=ROLE_DEVICE, predicate=supports_offer)
+    
+    pushed = 0
+    legacy_ids = [
+        connection_id for connection_id in ws_manager.get_connections(session_id, ROLE_DEVICE)
+        if not supports_offer(connection_id)
+    ]
+    if legacy_ids:
+        pushed = await push_timeline(
+            session_id, content["video_id"], content["canonical_json"],
+            content["transmission_metadata"], connection_ids=legacy_ids, tag=tag, publish=False
         )
-        
-        # 成功数カウント
-        success_count = sum(1 for result in results if result is True)
-        logger.info(f"[STOP_SIGNAL_RELAY] {success_count}/{device_count} デバイスにストップ信号送信完了")
-        return success_count
-        
-    except asyncio.TimeoutError:
-        logger.warning(f"[STOP_SIGNAL_RELAY] ストップ信号送信がタイムアウト ({device_count}台)")
-        # タスクをキャンセル
-        for task in device_tasks:
-            if not task.done():
-                task.cancel()
-        return 0
+    
+    logger.info(
+        f"[{tag}] {content['video_id']} sha256={content['sha256'][:12]}: "
+        f"通知 {offered.queued}台 / 本体送信 {pushed}台 ({content['size']}B)"
+    )
+    return offered.queued + pushed
+
+async def handle_remote_envelope(envelope: Dict[str, Any]):
+    """
+    他インスタンスから届いたエンベロープをこのインスタンスの接続へ配信
+    
+    同セッションの接続がなければ何もしない。再発行はしない（publish=False）。
+    """
+    session_id = envelope.get("session_id")
+    if not session_id or not ws_manager.has_session(session_id):
+        return
+    
+    kind = envelope.get("kind")
+    data = envelope.get("data") or {}
+    
+    if kind == "fan_out":
+        ws_manager.receive_remote_fan_out(session_id, data)
+    
+    elif kind == "push_timeline":
+        await push_timeline(
+            session_id, data.get("video_id"), envelope.get("body") or "{}",
+            data.get("transmission_metadata") or {}, tag="REMOTE_TIMELINE", publish=False
+        )
+    
+    elif kind == "deliver_timeline":
+        await deliver_timeline(session_id, data.get("bulk_message") or {}, tag="REMOTE_TIMELINE", publish=False)
+    
+    else:
+        logger.warning(f"[BACKPLANE] 未知のエンベロープ種別: {kind}")
+
+async def start_relay_backplane():
+    """アプリ起動時：redis_url があればRedisバックプレーンを接続（無ければ単一インスタンス動作）"""
+    backplane = create_backplane()
+    if backplane is None:
+        logger.info("[BACKPLANE] redis_url 未設定のため単一インスタンスで動作します")
+        return
+    try:
+        await ws_manager.attach_backplane(backplane, handle_remote_envelope)
     except Exception as e:
-        logger.error(f"[STOP_SIGNAL_RELAY] 並列送信でエラー: {e}")
-        return 0
+        logger.error(f"[BACKPLANE] 接続失敗のため単一インスタンスで動作します: {e}")
+
+async def stop_relay_backplane():
+    """アプリ終了時：バックプレーンを切断"""
+    await ws_manager.detach_backplane()
 
 async def get_device_connections(session_id: str) -> list:
     """セッション内のデバイス接続一覧を取得"""
-    devices = []
-    if session_id in ws_manager.session_connections:
-        for connection_id in ws_manager.session_connections[session_id]:
-            if connection_id.startswith("device_"):
-                websocket = ws_manager.active_connections.get(connection_id)
-                if websocket:
-                    devices.append({
-                        "connection_id": connection_id,
-                        "connected": True
-                    })
-    return devices
\ No newline at end of file
+    return [
+        {
+            "connection_id": connection_id,
+            "connected": True,
+            "connected_at": sender.connected_at.isoformat(),
+            "send_queue": sender.get_stats()
+        }
+        for connection_id, sender in ws_manager.get_connections(session_id, ROLE_DEVICE).items()
+    ]
@@ -4,16 +4,19 @@ Preparation API - 準備処理REST APIエンドポイント
 待機画面で使用する準備処理の制御とステータス監視API
 """
 
+import asyncio
 from datetime import datetime
-from typing import Dict, Optional, List, Any
+from typing import Dict, Optional, List, Any, Tuple, Union
 import logging
 import json
 import time
-from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks, WebSocket, WebSocketDisconnect
+from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks, WebSocket, WebSocketDisconnect, Request, Query
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel, Field
 
 from app.services.preparation_service import preparation_service
+from app.services.preparation_cache import preparation_stage_cache
+from app.services.session_lifecycle import session_lifecycle
 from app.models.preparation import (
     PreparationState, PreparationStatus, PreparationProgress,
     ActuatorType, ActuatorTestResult, ActuatorTestStatus
@@ -26,6 +29,9 @@ router = APIRouter(prefix="/api/preparation", tags=["preparation"])
 # WebSocket接続管理
 websocket_connections: Dict[str, WebSocket] = {}
 
+# タイムラインアップロードの上限（16MB）
+TIMELINE_UPLOAD_MAX_BYTES = 16 * 1024 * 1024
+
 class PreparationStartRequest(BaseModel):
     """準備開始リクエスト"""
     video_id: str
@@ -337,11 +343,10 @@ async def preparation_websocket(websocket: WebSocket, session_id: str):
     
     logger.info(f"準備処理WebSocket接続確立: {session_id}")
     
-    # 進捗コールバック登録
-    preparation_service.add_progress_callback(
-        session_id, 
-        lambda progress: notify_websocket_progress(session_id, progress)
-    )
+    # 進捗コールバック登録（切断時に解除）
+    progress_callback = lambda progress: notify_websocket_progress(session_id, progress)
+    preparation_service.add_progress_callback(session_id, progress_callback)
+    session_lifecycle.touch(session_id)
     
     try:
         # 現在の状態送信
@@ -362,6 +367,8 @@ async def preparation_websocket(websocket: WebSocket, session_id: str):
                 # クライアントからのメッセージ待機
                 message = await websocket.receive_text()
                 
+                session_lifecycle.touch(session_id)
+                
                 # Pingメッセージ処理
                 if message == "ping":
                     await websocket.send_text("pong")
@@ -378,7 +385,8 @@ async def preparation_websocket(websocket: WebSocket, session_id: str):
     
     finally:
         # クリーンアップ
-        if session_id in websocket_connections:
+        preparation_service.remove_progress_callback(session_id, progress_callback)
+        if websocket_connections.get(session_id) is websocket:
             del websocket_connections[session_id]
 
 async def notify_websocket_progress(session_id: str, progress: PreparationProgress):
@@ -454,6 +462,7 @@ async def upload_timeline_json(
     フロントエンドからタイムラインJSONを受信してデバイスへ中継
     
     1000行のJSONでも1-3秒で処理完了（WebSocket一括送信）
+    大きなタイムラインは /upload-timeline/{session_id}/raw を使うこと（再シリアライズなし）
     
     Args:
         session_id: セッションID
@@ -476,92 +485,79 @@ async def upload_timeline_json(
         # 1. JSONサイズ検証（16MB制限）
         json_str = json.dumps(timeline_data, ensure_ascii=False)
         json_size_bytes = len(json_str.encode('utf-8'))
-        json_size_kb = json_size_bytes / 1024
         
-        if json_size_kb > 16 * 1024:  # 16MB
+        if json_size_bytes > TIMELINE_UPLOAD_MAX_BYTES:
             raise HTTPException(
                 status_code=413,
-                detail=f"JSONサイズが大きすぎます: {json_size_kb:.1f}KB（上限: 16MB）"
+                detail=f"JSONサイズが大きすぎます: {json_size_bytes / 1024:.1f}KB（上限: 16MB）"
             )
         
-        logger.info(f"[TIMELINE_UPLOAD] JSONサイズ: {json_size_kb:.2f}KB")
-        
-        # 2. 基本的なフォーマット検証
-        if 'events' not in timeline_data:
-            raise HTTPException(
-                status_code=400,
-                detail="タイムラインJSONに'events'フィールドが必要です"
-            )
+        events_count, total_duration = _summarize_timeline(timeline_data)
+        return await _relay_uploaded_timeline(
+            session_id, video_id, json_str, json_size_bytes, events_count, total_duration, start_time
+        )
         
-        events = timeline_data.get('events', [])
-        events_count = len(events)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"[TIMELINE_UPLOAD] エラー: {e}", exc_info=True)
+        raise HTTPException(
+            status_code=500,
+            detail=f"タイムライン送信エラー: {str(e)}"
+        )
+
+@router.post("/upload-timeline/{session_id}/raw", response_model=TimelineUploadResponse)
+async def upload_timeline_raw(
+    session_id: str,
+    request: Request,
+    video_id: str = Query(..., min_length=1, description="動画ID")
+) -> TimelineUploadResponse:
+    """
+    タイムラインJSON本体をリクエストボディのまま受信してデバイスへ中継
+    
+    ボディはタイムラインJSONそのもの（{"events": [...]}）。
+    受信しながらサイズ上限を検査し、超えた時点で 413 を返す（Content-Length があれば受信前に判定）。
+    解析は検証のために1度だけ（ワーカースレッドで）行って件数・再生時間だけを残し、
+    デバイス・他インスタンスへは受信したバイト列をそのまま転送する（文字列化・再シリアライズしない）。
+    
+    Args:
+        session_id: セッションID
+        video_id: 動画ID（クエリパラメータ）
         
-        if events_count == 0:
+    Raises:
+        HTTPException: サイズ超過(413)、JSON不正(400)、送信失敗(500)
+    """
+    start_time = time.time()
+    
+    declared_size = request.headers.get("content-length")
+    if declared_size and declared_size.isdigit() and int(declared_size) > TIMELINE_UPLOAD_MAX_BYTES:
+        raise HTTPException(
+            status_code=413,
+            detail=f"JSONサイズが大きすぎます: {int(declared_size) / 1024:.1f}KB（上限: 16MB）"
+        )
+    
+    logger.info(f"[TIMELINE_UPLOAD] 受信開始(raw): session={session_id}, video={video_id}")
+    
+    chunks = []
+    received = 0
+    async for chunk in request.stream():
+        chunks.append(chunk)
+        received += len(chunk)
+        if received > TIMELINE_UPLOAD_MAX_BYTES:
             raise HTTPException(
-                status_code=400,
-                detail="タイムラインJSONにイベントが含まれていません"
+                status_code=413,
+                detail=f"JSONサイズが大きすぎます: {received / 1024:.1f}KB超（上限: 16MB）"
             )
-        
-        logger.info(f"[TIMELINE_UPLOAD] イベント数: {events_count}")
-        
-        # 3. 総再生時間計算
-        total_duration = 0.0
-        if events:
-            max_time = max(event.get('t', 0) for event in events)
-            total_duration = float(max_time)
-        
-        # 4. メタデータ作成
-        transmission_metadata = {
-            'video_id': video_id,
-            'total_duration': total_duration,
-            'events_count': events_count,
-            'file_size_kb': json_size_kb,
-            'transmission_timestamp': datetime.now().isoformat(),
-            'source': 'frontend_upload',
-            'format': 'timeline_json'
-        }
-        
-        # 5. デバイスへWebSocketで送信
-        bulk_data = {
-            'type': 'sync_data_bulk_transmission',
-            'session_id': session_id,
-            'video_id': video_id,
-            'transmission_metadata': transmission_metadata,
-            'sync_data': timeline_data
-        }
-        
-        # WebSocket経由でデバイスへ並列送信
-        from app.api.playback_control import ws_manager
-        
-        devices_notified = 0
-        if session_id in ws_manager.session_connections:
-            # デバイス接続数をカウント
-            for connection_id in ws_manager.session_connections[session_id]:
-                if connection_id.startswith("device_"):
-                    devices_notified += 1
-            
-            # 並列送信実行
-            await ws_manager.send_to_session(session_id, bulk_data)
-            logger.info(f"[TIMELINE_UPLOAD] デバイスへ送信完了: {devices_notified}台")
-        else:
-            logger.warning(f"[TIMELINE_UPLOAD] セッションにデバイス接続なし: {session_id}")
-        
-        # 6. 処理時間計算
-        elapsed_ms = int((time.time() - start_time) * 1000)
-        
-        logger.info(f"[TIMELINE_UPLOAD] 送信完了: {elapsed_ms}ms, {json_size_kb:.2f}KB, {events_count}イベント")
-        
-        return TimelineUploadResponse(
-            success=True,
-            message=f"タイムラインJSON送信完了（{devices_notified}台のデバイスへ通知）",
-            session_id=session_id,
-            video_id=video_id,
-            size_kb=round(json_size_kb, 2),
-            events_count=events_count,
-            devices_notified=devices_notified,
-            transmission_time_ms=elapsed_ms
+    body = b"".join(chunks)
+    del chunks
+    
+    # 大きなボディの解析でイベントループを止めない（解析結果は検証後に破棄される）
+    events_count, total_duration = await asyncio.to_thread(_parse_timeline_summary, body)
+    
+    try:
+        return await _relay_uploaded_timeline(
+            session_id, video_id, body, len(body), events_count, total_duration, start_time
         )
-        
     except HTTPException:
         raise
     except Exception as e:
@@ -571,6 +567,103 @@ async def upload_timeline_json(
             detail=f"タイムライン送信エラー: {str(e)}"
         )
 
+def _parse_timeline_summary(body: bytes) -> Tuple[int, float]:
+    """
+    受信したタイムラインJSON（UTF-8バイト列）を解析・検証して (イベント数, 総再生時間) を返す
+    
+    Raises:
+        HTTPException: JSON不正・フォーマット不正(400)
+    """
+    try:
+        timeline_data = json.loads(body)
+    except ValueError as e:
+        # UnicodeDecodeError / JSONDecodeError
+        raise HTTPException(status_code=400, detail=f"タイムラインJSONの解析に失敗しました: {e}")
+    
+    if not isinstance(timeline_data, dict):
+        raise HTTPException(status_code=400, detail="タイムラインJSONはオブジェクトである必要があります")
+    
+    return _summarize_timeline(timeline_data)
+
+def _summarize_timeline(timeline_data: Dict[str, Any]) -> Tuple[int, float]:
+    """
+    タイムラインの基本フォーマットを検証して (イベント数, 総再生時間) を返す
+    
+    Raises:
+        HTTPException: フォーマット不正(400)
+    """
+    if 'events' not in timeline_data:
+        raise HTTPException(
+            status_code=400,
+            detail="タイムラインJSONに'events'フィールドが必要です"
+        )
+    
+    events = timeline_data.get('events', [])
+    events_count = len(events)
+    
+    if events_count == 0:
+        raise HTTPException(
+            status_code=400,
+            detail="タイムラインJSONにイベントが含まれていません"
+        )
+    
+    total_duration = float(max(event.get('t', 0) for event in events))
+    return events_count, total_duration
+
+async def _relay_uploaded_timeline(
+    session_id: str,
+    video_id: str,
+    payload_json: Union[str, bytes],
+    json_size_bytes: int,
+    events_count: int,
+    total_duration: float,
+    start_time: float
+) -> TimelineUploadResponse:
+    """
+    検証済みタイムラインをデバイスへ中継（payload_json をそのまま送り、再シリアライズしない）
+    """
+    json_size_kb = json_size_bytes / 1024
+    logger.info(f"[TIMELINE_UPLOAD] JSONサイズ: {json_size_kb:.2f}KB, イベント数: {events_count}")
+    
+    # メタデータ作成
+    transmission_metadata = {
+        'video_id': video_id,
+        'total_duration': total_duration,
+        'events_count': events_count,
+        'file_size_kb': json_size_kb,
+        'transmission_timestamp': datetime.now().isoformat(),
+        'source': 'frontend_upload',
+        'format': 'timeline_json'
+    }
+    
+    # デバイスへWebSocketで送信（受信・計測済みのJSONをそのまま使い、再シリアライズしない）
+    #    大きなタイムラインは対応デバイスへ圧縮チャンクで分割転送される
+    from app.api.playback_control import push_timeline
+    
+    devices_notified = await push_timeline(
+        session_id, video_id, payload_json, transmission_metadata, tag="TIMELINE_UPLOAD"
+    )
+    if devices_notified > 0:
+        logger.info(f"[TIMELINE_UPLOAD] デバイスへ送信完了: {devices_notified}台")
+    else:
+        logger.warning(f"[TIMELINE_UPLOAD] セッションにデバイス接続なし: {session_id}")
+    
+    # 処理時間計算
+    elapsed_ms = int((time.time() - start_time) * 1000)
+    
+    logger.info(f"[TIMELINE_UPLOAD] 送信完了: {elapsed_ms}ms, {json_size_kb:.2f}KB, {events_count}イベント")
+    
+    return TimelineUploadResponse(
+        success=True,
+        message=f"タイムラインJSON送信完了（{devices_notified}台のデバイスへ通知）",
+        session_id=session_id,
+        video_id=video_id,
+        size_kb=round(json_size_kb, 2),
+        events_count=events_count,
+        devices_notified=devices_notified,
+        transmission_time_ms=elapsed_ms
+    )
+
 # ヘルスチェック
 @router.get("/health")
 async def preparation_health():
@@ -582,5 +675,6 @@ async def preparation_health():
         "status": "healthy",
         "active_preparations": active_count,
         "websocket_connections": websocket_count,
+        "stage_cache": preparation_stage_cache.get_stats(),
         "timestamp": datetime.now().isoformat()
     }
\ No newline at end of file
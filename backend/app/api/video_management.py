@@ -4,15 +4,17 @@ Video Management API - 動画一覧・選択エンドポイント
 動画リスト取得、デバイス互換性フィルタリング、動画選択処理を提供
 """
 
-from fastapi import APIRouter, HTTPException, Query, Depends, status
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, HTTPException, Query, Header, Depends, status
+from fastapi.responses import JSONResponse, Response
 import logging
 from typing import List, Optional, Dict, Any
 from datetime import datetime
 
+from app.api.http_cache import etag_matches
 from app.config.settings import settings
 from app.models.video import VideoListResponse, VideoSelectRequest, VideoSelectResponse
 from app.services.video_service import video_service
+from app.services.timeline_repository import timeline_repository
 
 # ログ設定
 logger = logging.getLogger(__name__)
@@ -32,18 +34,21 @@ router = APIRouter(
 async def get_available_videos(
     device_id: Optional[str] = Query(None, description="デバイスIDでフィルタリング"),
     category: Optional[str] = Query(None, description="カテゴリでフィルタリング"),
-    force_rescan: bool = Query(False, description="強制再スキャン")
+    force_rescan: bool = Query(False, description="強制再スキャン"),
+    cursor: Optional[str] = Query(None, description="前ページの next_cursor"),
+    limit: Optional[int] = Query(None, ge=1, le=settings.video_list_max_page_size, description="1ページの件数（省略時は全件）")
 ):
     """
     利用可能な動画一覧を取得
     
-    デバイスIDが指定された場合、そのデバイスに対応した動画のみを返す
+    デバイスIDが指定された場合、そのデバイスに対応した動画のみを返す。
+    limit を指定するとページ単位で返し、続きは next_cursor を cursor に渡して取得する。
     """
-    logger.info(f"動画一覧取得リクエスト: device_id={device_id}, category={category}")
+    logger.info(f"動画一覧取得リクエスト: device_id={device_id}, category={category}, cursor={cursor}, limit={limit}")
     
     try:
-        # 全動画を取得
-        all_videos = video_service.scan_video_files(force_rescan=force_rescan)
+        # 全動画を取得（カタログ更新時のみビットマスクインデックスを再構築）
+        all_videos = await video_service.scan_video_files(force_rescan=force_rescan)
         
         if not all_videos:
             logger.warning("利用可能な動画が見つかりません")
@@ -56,29 +61,38 @@ async def get_available_videos(
             )
         
         # デバイスフィルタリング
-        filtered_videos = all_videos
         device_capabilities = None
         
         if device_id:
             try:
                 # デバイス情報から機能を取得（device_registration APIと連携）
                 device_capabilities = await _get_device_capabilities(device_id)
-                if device_capabilities:
-                    filtered_videos = video_service.filter_videos_by_device(all_videos, device_capabilities)
-                else:
+                if not device_capabilities:
                     logger.warning(f"デバイス情報が見つかりません: {device_id}")
             except Exception as e:
                 logger.error(f"デバイス情報取得エラー: {e}")
                 # エラーの場合はフィルタリング無しで続行
         
-        # カテゴリフィルタリング
-        if category:
-            filtered_videos = [v for v in filtered_videos if category in v.video_info.categories]
-            logger.info(f"カテゴリフィルタ適用: {category}")
+        # デバイス・カテゴリの絞り込みとページ切り出し（マスクのビット演算）
+        try:
+            listing = video_service.list_catalog_videos(device_capabilities, category, cursor, limit)
+        except ValueError as e:
+            logger.warning(f"動画一覧カーソルエラー: {e}")
+            raise HTTPException(
+                status_code=400,
+                detail={
+                    "error": "invalid_cursor",
+                    "message": "カーソルが不正です"
+                }
+            )
+        page_videos = [video for video, _, _ in listing['videos']]
         
-        # レスポンス用に変換
+        # 返却する動画の実メタデータ取得を優先（完了は待たない）
+        video_service.prioritize_media_probe(page_videos)
+        
+        # レスポンス用に変換（表示順: 準備完了順、タイトル順）
         video_list = []
-        for video in filtered_videos:
+        for video, compatible, missing in listing['videos']:
             video_dict = {
                 "video_id": video.video_id,
                 "title": video.title,
@@ -91,31 +105,36 @@ async def get_available_videos(
                 "effect_complexity": video.compatibility.effect_complexity.value,
                 "content_rating": video.video_info.content_rating.value,
                 "categories": video.video_info.categories,
-                "file_size_mb": video.video_info.file_size_mb
+                "file_size_mb": video.video_info.file_size_mb,
+                "width": video.video_info.width,
+                "height": video.video_info.height,
+                "fps": video.video_info.fps,
+                "has_audio": video.video_info.has_audio,
+                "metadata_probed": video.video_info.metadata_probed
             }
             
             # デバイス互換性情報を追加
             if device_capabilities:
-                video_dict["compatible"] = video.is_compatible_with_device(device_capabilities)
-                video_dict["missing_capabilities"] = video.get_missing_capabilities(device_capabilities)
+                video_dict["compatible"] = compatible
+                video_dict["missing_capabilities"] = missing
             
             video_list.append(video_dict)
         
-        # ソート（準備完了順、タイトル順）
-        video_list.sort(key=lambda x: (not x["ready"], x["title"]))
-        
         response = VideoListResponse(
             videos=video_list,
             total_count=len(all_videos),
-            available_count=len(filtered_videos),
+            available_count=listing['matched'],
             device_id=device_id,
-            filter_applied=device_id is not None or category is not None
+            filter_applied=device_id is not None or category is not None,
+            next_cursor=listing['next_cursor']
         )
         
-        logger.info(f"動画一覧取得成功: {len(video_list)}件返却")
+        logger.info(f"動画一覧取得成功: {len(video_list)}/{listing['matched']}件返却")
         
         return response
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"動画一覧取得エラー: {e}")
         raise HTTPException(
@@ -134,7 +153,7 @@ async def get_video_details(video_id: str):
     logger.info(f"動画詳細取得リクエスト: {video_id}")
     
     try:
-        video = video_service.get_video_by_id(video_id)
+        video = await video_service.get_video_by_id(video_id)
         
         if not video:
             raise HTTPException(
@@ -155,8 +174,8 @@ async def get_video_details(video_id: str):
             "file_size_mb": video.video_info.file_size_mb,
             "status": video.status.value,
             "thumbnail_url": video.video_info.thumbnail_url,
-            "video_url": video_service.get_video_url(video_id),
-            "sync_data_url": video_service.get_sync_data_url(video_id),
+            "video_url": await video_service.get_video_url(video_id),
+            "sync_data_url": await video_service.get_sync_data_url(video_id),
             
             # メタデータ
             "categories": video.video_info.categories,
@@ -200,6 +219,59 @@ async def get_video_details(video_id: str):
             }
         )
 
+@router.get("/{video_id}/timeline")
+async def get_video_timeline(
+    video_id: str,
+    sha256: Optional[str] = Query(None, description="期待するコンテンツハッシュ（一致すれば不変キャッシュ可）"),
+    if_none_match: Optional[str] = Header(None),
+    accept_encoding: Optional[str] = Header(None)
+):
+    """
+    タイムラインJSONを取得（HTTPキャッシュ・CDN対応）
+    
+    ボディは正規化JSON、ETag はそのsha256（読み込み時に1度だけ計算）。
+    If-None-Match が一致すれば 304、gzip 受理時は圧縮済みボディを返す。
+    sha256 クエリが現在の内容と一致する場合は immutable として長期キャッシュさせる。
+    """
+    try:
+        content = await timeline_repository.get_content(video_id)
+    except ValueError as e:
+        logger.error(f"タイムライン取得エラー: {e}")
+        raise HTTPException(
+            status_code=500,
+            detail={
+                "error": "timeline_invalid",
+                "message": f"タイムライン '{video_id}' の解析に失敗しました"
+            }
+        )
+    
+    if content is None:
+        raise HTTPException(
+            status_code=404,
+            detail={
+                "error": "timeline_not_found",
+                "message": f"タイムライン '{video_id}' が見つかりません"
+            }
+        )
+    
+    etag = f'"{content["sha256"]}"'
+    if sha256 == content["sha256"]:
+        cache_control = "public, max-age=31536000, immutable"
+    else:
+        cache_control = f"public, max-age={settings.timeline_http_max_age}"
+    headers = {"ETag": etag, "Cache-Control": cache_control, "Vary": "Accept-Encoding"}
+    
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    
+    if accept_encoding and "gzip" in accept_encoding.lower():
+        headers["Content-Encoding"] = "gzip"
+        body = timeline_repository.gzip_body(content)
+    else:
+        body = content["canonical_json"].encode("utf-8")
+    
+    return Response(content=body, media_type="application/json", headers=headers)
+
 @router.post("/select", response_model=VideoSelectResponse)
 async def select_video(request: VideoSelectRequest):
     """
@@ -211,7 +283,7 @@ async def select_video(request: VideoSelectRequest):
     
     try:
         # 動画存在確認
-        video = video_service.get_video_by_id(request.video_id)
+        video = await video_service.get_video_by_id(request.video_id)
         if not video:
             raise HTTPException(
                 status_code=404,
@@ -245,8 +317,8 @@ async def select_video(request: VideoSelectRequest):
         # レスポンス作成
         response = VideoSelectResponse(
             session_id=session_id,
-            video_url=video_service.get_video_url(request.video_id) or f"/assets/videos/{video.video_info.file_name}",
-            sync_data_url=video_service.get_sync_data_url(request.video_id),
+            video_url=await video_service.get_video_url(request.video_id) or f"/assets/videos/{video.video_info.file_name}",
+            sync_data_url=await video_service.get_sync_data_url(request.video_id),
             preparation_started=True,  # 将来的には実際の準備処理と連携
             estimated_preparation_time=30 if video.compatibility.effect_complexity.value == "high" else 15
         )
@@ -289,25 +361,29 @@ async def get_video_categories():
         }
     }
 
+@router.get("/catalog/stats")
+async def get_catalog_stats():
+    """
+    動画カタログインデックスとメタデータ取得の状況
+    """
+    from app.services.media_probe import media_probe_service
+    from app.api.asset_streaming import stream_limiter
+    
+    return {
+        "catalog": video_service.catalog.get_stats(),
+        "capability_index": video_service.capability_index.get_stats(),
+        "media_probe": media_probe_service.get_stats(),
+        "asset_streams": stream_limiter.get_stats()
+    }
+
 # ヘルパー関数
 async def _get_device_capabilities(device_id: str) -> Optional[List[str]]:
     """
     デバイスIDから機能一覧を取得
     
-    TODO: device_registration APIと連携して実際の機能を取得
-    現在は簡易実装
+    登録APIで発行した device_id（または製品コード）をデバイスレジストリから引く。
+    不明なデバイスはNone。
     """
-    # 簡易マッピング（将来的にはデバイスサービスと連携）
-    device_capability_map = {
-        "device_basic": ["VIBRATION", "AUDIO"],
-        "device_standard": ["VIBRATION", "MOTION", "SCENT", "AUDIO"],
-        "device_premium": ["VIBRATION", "MOTION", "SCENT", "AUDIO", "LIGHTING", "WIND"]
-    }
-    
-    # device_idがdevice_で始まる場合の処理
-    if device_id.startswith("device_"):
-        # デバイス登録APIで生成されたIDのパターンを想定
-        # 実際の実装では、デバイス情報ストレージから取得
-        return ["VIBRATION", "MOTION", "AUDIO"]  # デフォルト機能
+    from app.services.device_registry import device_registry
     
-    return device_capability_map.get(device_id, ["VIBRATION"])  # 最低限の機能
\ No newline at end of file
+    return device_registry.get_capabilities(device_id)
@@ -76,7 +76,38 @@ class Settings(BaseSettings):
     websocket_timeout: int = Field(default=300, description="WebSocketタイムアウト（秒）")
     max_connections: int = Field(default=100, description="最大同時接続数")
     ping_interval: int = Field(default=30, description="Pingインターバル（秒）")
-    
+    websocket_send_queue_size: int = Field(default=64, description="接続ごとの送信キュー上限（件）")
+    websocket_send_timeout: float = Field(default=5.0, description="1メッセージあたりの送信タイムアウト（秒）")
+    timeline_chunk_threshold: int = Field(default=256 * 1024, description="分割転送に切り替えるタイムラインサイズ（バイト）")
+    timeline_chunk_size: int = Field(default=64 * 1024, description="分割転送の圧縮チャンクサイズ（バイト）")
+    timeline_transfer_ttl: int = Field(default=600, description="分割転送の再開受付期間（秒）")
+    timeline_cache_max_bytes: int = Field(default=64 * 1024 * 1024, description="タイムラインキャッシュの上限（ファイルサイズ合計・バイト）")
+    timeline_mtime_check_interval: float = Field(default=1.0, description="キャッシュ済みタイムラインの更新確認間隔（秒）")
+    timeline_http_max_age: int = Field(default=300, description="タイムラインGETのCache-Control max-age（秒）")
+    session_idle_ttl: int = Field(default=1800, description="接続の無いセッション状態を回収するまでの時間（秒）")
+    session_gc_interval: int = Field(default=60, description="アイドルセッション回収の実行間隔（秒）")
+    sync_tick_min_interval: float = Field(default=0.1, description="連続同期ティックの最短間隔（秒・イベント密集時）")
+    sync_tick_max_interval: float = Field(default=2.0, description="連続同期ティックの最長間隔（秒・イベントの無い区間のキープアライブ）")
+    sync_tick_lead_time: float = Field(default=0.5, description="イベント直前に送る先行ティックのリード時間（秒）")
+    sync_latency_window: int = Field(default=32, description="遅延推定に使う直近サンプル数")
+    sync_assumed_min_delay_ms: float = Field(default=5.0, description="フロントエンド→バックエンドの最小片道遅延の仮定値（ミリ秒）")
+    sync_max_compensation_ms: float = Field(default=1000.0, description="メディア時刻補正の上限（ミリ秒）")
+    preparation_cache_video_ttl: int = Field(default=1800, description="準備キャッシュ: 動画プリロード結果の有効期間（秒）")
+    preparation_cache_sync_ttl: int = Field(default=1800, description="準備キャッシュ: 同期データ送信結果の有効期間（秒）")
+    preparation_cache_device_comm_ttl: int = Field(default=300, description="準備キャッシュ: デバイス通信テスト結果の有効期間（秒）")
+    preparation_cache_actuator_ttl: int = Field(default=600, description="準備キャッシュ: アクチュエーターテスト成功結果の有効期間（秒）")
+    preparation_cache_max_entries: int = Field(default=1024, description="準備キャッシュ: 保持する (デバイス, 動画) エントリ数の上限（超過時は最も古く使われたものから破棄）")
+    video_catalog_index_file: str = Field(default="video_catalog.json", description="動画カタログインデックスのファイル名（data_path配下）")
+    video_catalog_refresh_interval: int = Field(default=300, description="動画ディレクトリの差分再スキャン間隔（秒）")
+    video_list_max_page_size: int = Field(default=200, description="動画一覧APIの1ページあたりの最大件数")
+    media_probe_enabled: bool = Field(default=True, description="動画メタデータ（再生時間・解像度等）のバックグラウンド取得")
+    media_probe_workers: int = Field(default=2, description="メタデータ取得のプロセス数")
+    media_probe_timeout: float = Field(default=10.0, description="1ファイルあたりのメタデータ取得タイムアウト（秒）")
+    asset_stream_max_concurrent: int = Field(default=32, description="動画・同期データの同時配信数の上限")
+    asset_stream_chunk_size: int = Field(default=256 * 1024, description="zerocopy非対応サーバーでの配信チャンクサイズ（バイト）")
+    asset_stream_max_age: int = Field(default=3600, description="配信ファイルのCache-Control max-age（秒）")
+    device_registry_reload_interval: float = Field(default=2.0, description="devices.json の変更を確認する間隔（秒）")
+
     # WebSocket URL設定（マイコン統合用）
     # 注意: 実際のURLは環境変数 DEVICE_WEBSOCKET_BASE_URL で設定してください
     device_websocket_base_url: str = Field(
@@ -162,7 +193,7 @@ class Settings(BaseSettings):
     
     def get_device_data_path(self) -> Path:
         """デバイスデータファイルパスを取得"""
-        return Path("./data/devices.json")
+        return self.get_data_path() / "devices.json"
     
     def get_device_websocket_url(self, session_id: str) -> str:
         """マイコンWebSocket URL生成"""
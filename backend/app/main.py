@@ -84,12 +84,19 @@ app.include_router(device_registration.router)
 from app.api import video_management
 app.include_router(video_management.router)
 
+# 動画・同期データ配信ルーター
+from app.api import asset_streaming
+app.include_router(asset_streaming.router)
+
 # 準備処理APIルーター
 from app.api import preparation
 app.include_router(preparation.router)
 
 # Phase B-3: 再生制御APIルーター
 from app.api import playback_control
+from app.services.session_lifecycle import session_lifecycle
+from app.services.media_probe import media_probe_service
+from app.services.device_registry import device_registry
 app.include_router(playback_control.router)
 
 # APIバージョン情報
@@ -112,6 +119,8 @@ async def api_version():
             "/api/videos/{video_id}",
             "/api/videos/select",
             "/api/videos/categories/list",
+            "/assets/videos/{file_name}",
+            "/assets/sync-data/{file_name}",
             "/api/preparation/start/{session_id}",
             "/api/preparation/status/{session_id}",
             "/api/preparation/stop/{session_id}",
@@ -130,12 +139,21 @@ async def startup_event():
     logger.info(f"🌐 CORS origins: {len(settings.get_cors_origins())} configured")
     if settings.is_development():
         logger.info("📋 API Documentation available at /docs")
+    try:
+        device_registry.load()
+    except (OSError, ValueError) as e:
+        logger.error(f"❌ デバイス情報の読み込みに失敗しました: {e}")
+    await playback_control.start_relay_backplane()
+    session_lifecycle.start()
     logger.info("✅ Backend initialization complete")
 
 # アプリケーション終了時の処理
 @app.on_event("shutdown")
 async def shutdown_event():
     logger.info(f"🔴 {settings.app_name} shutting down...")
+    await session_lifecycle.stop()
+    await media_probe_service.stop()
+    await playback_control.stop_relay_backplane()
 
 # 例外ハンドラー
 @app.exception_handler(Exception)
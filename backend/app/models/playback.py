@@ -80,17 +80,31 @@ def validate_device_status(data: dict) -> tuple[bool, Optional[str]]:
         return False, str(e)
 
 # receiver.pyパターンに準拠した中継データ作成
-def create_relay_data(session_id: str, sync_data: dict) -> dict:
+def create_relay_data(
+    session_id: str,
+    sync_data: dict,
+    video_time: Optional[float] = None,
+    server_timestamp: Optional[int] = None,
+    estimated_delay_ms: Optional[float] = None
+) -> dict:
     """
     フロントエンドから受信した同期データを
     そのままデバイスに中継するための形式に変換
+    
+    video_time を指定した場合（遅延補正済み）は server_timestamp 時点のメディア時刻として送り、
+    補正前の値を video_time_raw に残す。
     """
-    return {
+    relay_data = {
         "type": "video_sync",
         "session_id": session_id,
-        "video_time": sync_data.get("time", 0),
+        "video_time": sync_data.get("time", 0) if video_time is None else video_time,
         "video_state": sync_data.get("state", "unknown"),
         "video_duration": sync_data.get("duration"),
         "client_timestamp": sync_data.get("ts"),
-        "server_timestamp": int(datetime.now().timestamp() * 1000)
-    }
\ No newline at end of file
+        "server_timestamp": server_timestamp if server_timestamp is not None else int(datetime.now().timestamp() * 1000)
+    }
+    if video_time is not None:
+        relay_data["video_time_raw"] = sync_data.get("time", 0)
+    if estimated_delay_ms is not None:
+        relay_data["estimated_delay_ms"] = round(estimated_delay_ms, 1)
+    return relay_data
\ No newline at end of file
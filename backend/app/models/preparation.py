@@ -114,6 +114,7 @@ class PreparationState(BaseModel):
     ready_for_playback: bool = Field(default=False, description="再生準備完了フラグ")
     min_required_actuators_ready: bool = Field(default=False, description="最小要件アクチュエータ準備完了")
     all_actuators_ready: bool = Field(default=False, description="全アクチュエータ準備完了")
+    cached_stages: List[str] = Field(default_factory=list, description="前回の結果を再利用して省略したステージ")
 
 class PreparationProgress(BaseModel):
     """準備進捗通知"""
@@ -191,6 +192,15 @@ ACTUATOR_TEST_DEFAULTS = {
     }
 }
 
+# アクチュエータを駆動する物理デバイス（同じESPのアクチュエータは同時にテストしない）
+ACTUATOR_DEVICE_GROUPS = {
+    ActuatorType.WATER: "ESP1",      # 水・風は同じESP
+    ActuatorType.WIND: "ESP1",
+    ActuatorType.FLASH: "ESP2",      # フラッシュ・色はLED用ESP
+    ActuatorType.COLOR: "ESP2",
+    ActuatorType.VIBRATION: "ESP3"   # 振動モーター
+}
+
 PREPARATION_PHASES = [
     "video_preload",       # 動画プリロード
     "sync_data_download",  # 同期データダウンロード
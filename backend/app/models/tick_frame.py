@@ -0,0 +1,103 @@
+"""
+Tick Frame - 高頻度同期メッセージ用のバイナリ固定長フレーム
+
+video_sync は毎秒数回デバイスへ中継されるため、
+WebSocketサブプロトコルで合意した接続にはJSONの代わりに固定長structで送る。
+ラズパイ側 (hardware/rpi_server/src/api/tick_frame.py) と同一レイアウトを保つこと。
+レイアウトを変えた場合は TICK_VERSION とサブプロトコル名を上げる（旧デバイスはJSONのまま受信する）。
+
+共通ヘッダー: magic(1) version(1) kind(1)
+- video_sync : state(1) video_time(f64) video_duration(f64, 無い場合NaN)
+               client_timestamp(i64, 無い場合-1) server_timestamp(i64)
+               video_time_raw(f64, 無い場合NaN) estimated_delay_ms(f64, 無い場合NaN)
+
+currentTime はデバイス側に処理が無く、イベント一覧も可変長のためJSONのまま送る。
+"""
+
+import math
+import struct
+from typing import Any, Dict, Optional
+
+# サブプロトコル名（合意できない接続はJSONのまま）
+TICK_SUBPROTOCOL = "4dx.tick.v2"
+
+TICK_MAGIC = 0xD4
+TICK_VERSION = 2
+
+KIND_VIDEO_SYNC = 1
+
+_HEADER = struct.Struct("<BBB")
+_VIDEO_SYNC = struct.Struct("<BBBBddqqdd")
+
+VIDEO_STATES = ("unknown", "play", "pause", "seeking", "seeked", "ended")
+_STATE_CODES = {state: code for code, state in enumerate(VIDEO_STATES)}
+
+# バイナリ化の対象メッセージタイプ
+TICK_MESSAGE_TYPES = {"video_sync"}
+
+def _optional_float(value: Any) -> float:
+    return float(value) if value is not None else math.nan
+
+def encode_tick_frame(message: Dict[str, Any]) -> Optional[bytes]:
+    """
+    同期メッセージをバイナリフレームにエンコード
+
+    固定レイアウトで表現できないメッセージ（未知の状態・対象外のタイプ等）は
+    None を返し、呼び出し側はJSONで送信する。
+    session_id は接続単位で既知のため含めない。
+    """
+    if message.get("type") != "video_sync":
+        return None
+    state = _STATE_CODES.get(message.get("video_state", "unknown"))
+    if state is None:
+        return None
+    client_ts = message.get("client_timestamp")
+    try:
+        return _VIDEO_SYNC.pack(
+            TICK_MAGIC, TICK_VERSION, KIND_VIDEO_SYNC, state,
+            float(message.get("video_time") or 0.0),
+            _optional_float(message.get("video_duration")),
+            int(client_ts) if client_ts is not None else -1,
+            int(message.get("server_timestamp") or 0),
+            _optional_float(message.get("video_time_raw")),
+            _optional_float(message.get("estimated_delay_ms"))
+        )
+    except (TypeError, ValueError, struct.error):
+        return None
+
+def decode_tick_frame(data: bytes, session_id: Optional[str] = None) -> Dict[str, Any]:
+    """
+    バイナリフレームをJSON版と同じ形のdictにデコード
+
+    Raises:
+        ValueError: 不正なフレーム
+    """
+    if len(data) < _HEADER.size:
+        raise ValueError("フレーム長が不足しています")
+    magic, version, kind = _HEADER.unpack_from(data)
+    if magic != TICK_MAGIC or version != TICK_VERSION:
+        raise ValueError(f"未対応のフレーム: magic={magic:#x}, version={version}")
+    if kind != KIND_VIDEO_SYNC:
+        raise ValueError(f"未知のフレーム種別: {kind}")
+
+    try:
+        (_, _, _, state, video_time, duration, client_ts, server_ts,
+         video_time_raw, estimated_delay_ms) = _VIDEO_SYNC.unpack(data)
+    except struct.error as e:
+        raise ValueError(f"フレーム解析エラー: {e}") from e
+
+    message = {
+        "type": "video_sync",
+        "session_id": session_id,
+        "video_time": video_time,
+        "video_state": VIDEO_STATES[state] if state < len(VIDEO_STATES) else "unknown",
+        "video_duration": None if math.isnan(duration) else duration,
+        "client_timestamp": None if client_ts < 0 else client_ts,
+        "server_timestamp": server_ts
+    }
+    # JSON版と同じく、値がある場合のみキーを含める
+    if not math.isnan(video_time_raw):
+        message["video_time_raw"] = video_time_raw
+    if not math.isnan(estimated_delay_ms):
+        message["estimated_delay_ms"] = estimated_delay_ms
+    return message
@@ -45,6 +45,13 @@ class VideoInfo(BaseModel):
     created_at: datetime = Field(default_factory=datetime.now, description="作成日時")
     updated_at: Optional[datetime] = Field(default=None, description="更新日時")
     
+    # コンテナヘッダーから取得した実メタデータ（バックグラウンドで反映）
+    width: Optional[int] = Field(default=None, description="横幅（px）")
+    height: Optional[int] = Field(default=None, description="高さ（px）")
+    fps: Optional[float] = Field(default=None, description="フレームレート")
+    has_audio: Optional[bool] = Field(default=None, description="音声トラックの有無")
+    metadata_probed: bool = Field(default=False, description="実メタデータ取得済み（Falseなら再生時間は推定値）")
+    
     # 分類情報
     categories: List[str] = Field(default_factory=list, description="カテゴリ")
     tags: List[str] = Field(default_factory=list, description="タグ")
@@ -112,6 +119,7 @@ class VideoListResponse(BaseModel):
     available_count: int = Field(..., ge=0, description="利用可能動画数")
     device_id: Optional[str] = Field(default=None, description="フィルタ対象デバイスID")
     filter_applied: bool = Field(default=False, description="デバイスフィルタ適用済み")
+    next_cursor: Optional[str] = Field(default=None, description="次ページのカーソル（最終ページならNone）")
 
 class VideoSelectRequest(BaseModel):
     """動画選択リクエスト"""
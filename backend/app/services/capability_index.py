@@ -0,0 +1,222 @@
+"""
+機能ビットマスクインデックス - デバイス別動画一覧の高速化
+
+カタログ構築時に各動画の必要機能・カテゴリをビットマスクに変換し、一覧の表示順に並べた配列として保持する。
+デバイス機能によるフィルタ・不足機能の算出・カテゴリフィルタはマスクのビット演算で行い、
+(デバイスマスク, カテゴリマスク) ごとの絞り込み結果はカタログが更新されるまで再利用する。
+ページングは表示順のソートキーを使ったカーソル方式（カタログ更新を挟んでも重複・欠落しない）。
+"""
+
+import base64
+import binascii
+import json
+import logging
+from bisect import bisect_right
+from collections import OrderedDict
+from typing import Dict, Optional, Any, List, Tuple, Iterable, TYPE_CHECKING
+
+from app.models.video import EnhancedVideo, VIDEO_CATEGORIES, EFFECT_TYPES
+
+if TYPE_CHECKING:
+    from app.services.video_catalog import VideoCatalogIndex
+
+logger = logging.getLogger(__name__)
+
+# 保持する絞り込み結果の上限（デバイス機能・カテゴリの組み合わせ数）
+MAX_CACHED_SELECTIONS = 256
+
+# 表示順のソートキー（準備完了が先、タイトル順、同名は動画ID順）
+SortKey = Tuple[bool, str, str]
+
+def _sort_key(video: EnhancedVideo) -> SortKey:
+    return (video.status.value != "ready", video.title, video.video_id)
+
+def encode_cursor(key: SortKey) -> str:
+    """ソートキーを不透明なカーソル文字列に変換"""
+    raw = json.dumps(list(key), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str) -> SortKey:
+    """
+    カーソル文字列をソートキーに戻す
+
+    Raises:
+        ValueError: 不正なカーソル
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        not_ready, title, video_id = json.loads(raw)
+    except (binascii.Error, ValueError, TypeError) as e:
+        raise ValueError(f"不正なカーソル: {cursor}") from e
+    if not isinstance(not_ready, bool) or not isinstance(title, str) or not isinstance(video_id, str):
+        raise ValueError(f"不正なカーソル: {cursor}")
+    return (not_ready, title, video_id)
+
+class BitRegistry:
+    """名前 → ビット位置の対応表（既知の名前を先に割り当て、未知の名前は追加順に割り当てる）"""
+
+    def __init__(self, known: Iterable[str]):
+        self._bits: Dict[str, int] = {}
+        self._names: List[str] = []
+        for name in known:
+            self.bit(name)
+
+    def bit(self, name: str) -> int:
+        """名前のビット位置（未登録なら割り当て）"""
+        position = self._bits.get(name)
+        if position is None:
+            position = len(self._names)
+            self._bits[name] = position
+            self._names.append(name)
+        return position
+
+    def mask(self, names: Iterable[str]) -> int:
+        """名前の集合をマスクに変換（未登録の名前も割り当てる）"""
+        mask = 0
+        for name in names:
+            mask |= 1 << self.bit(name)
+        return mask
+
+    def lookup_mask(self, names: Iterable[str]) -> Optional[int]:
+        """登録済みの名前だけでマスクを作る（1つでも未登録ならNone）"""
+        mask = 0
+        for name in names:
+            position = self._bits.get(name)
+            if position is None:
+                return None
+            mask |= 1 << position
+        return mask
+
+    def names(self, mask: int) -> List[str]:
+        """マスクに含まれる名前（ビット位置順）"""
+        names = []
+        while mask:
+            low = mask & -mask
+            names.append(self._names[low.bit_length() - 1])
+            mask ^= low
+        return names
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+class CapabilityIndex:
+    """表示順に並べた動画と、必要機能・カテゴリのマスク配列"""
+
+    def __init__(self):
+        self.capabilities = BitRegistry(EFFECT_TYPES)
+        self.categories = BitRegistry(VIDEO_CATEGORIES)
+        self._generation: Optional[int] = None
+        # 表示順に並べた配列（同じ添字が同じ動画）
+        self._videos: List[EnhancedVideo] = []
+        self._keys: List[SortKey] = []
+        self._required: List[int] = []
+        self._category: List[int] = []
+        # (デバイスマスク | None, カテゴリマスク | None) → 一致した動画の添字（昇順）
+        self._selections: "OrderedDict[Tuple[Optional[int], Optional[int]], List[int]]" = OrderedDict()
+        # デバイス機能リスト → マスク
+        self._device_masks: Dict[Tuple[str, ...], int] = {}
+        # 統計
+        self.rebuild_count = 0
+        self.selection_hits = 0
+        self.selection_misses = 0
+
+    def ensure(self, catalog: "VideoCatalogIndex"):
+        """カタログが更新されていれば配列を作り直す"""
+        if self._generation == catalog.generation:
+            return
+        videos = sorted(catalog.videos(), key=_sort_key)
+        self._videos = videos
+        self._keys = [_sort_key(video) for video in videos]
+        self._required = [self.capabilities.mask(v.compatibility.required_capabilities) for v in videos]
+        self._category = [self.categories.mask(v.video_info.categories) for v in videos]
+        self._selections.clear()
+        self._generation = catalog.generation
+        self.rebuild_count += 1
+        logger.debug(f"機能ビットマスクインデックス再構築: {len(videos)}件 (generation {catalog.generation})")
+
+    def device_mask(self, device_capabilities: List[str]) -> int:
+        """デバイス機能リストのマスク（機能リストごとに1度だけ計算）"""
+        key = tuple(device_capabilities)
+        mask = self._device_masks.get(key)
+        if mask is None:
+            mask = self.capabilities.mask(device_capabilities)
+            self._device_masks[key] = mask
+        return mask
+
+    def select(self, device_mask: Optional[int] = None, category: Optional[str] = None) -> List[int]:
+        """
+        条件に一致する動画の添字（表示順）
+
+        Args:
+            device_mask: 必要機能をすべて満たすデバイスのマスク（Noneならフィルタなし）
+            category: カテゴリ名（Noneならフィルタなし）
+        """
+        category_mask = None
+        if category is not None:
+            category_mask = self.categories.lookup_mask([category])
+            if category_mask is None:
+                return []
+
+        key = (device_mask, category_mask)
+        selection = self._selections.get(key)
+        if selection is not None:
+            self._selections.move_to_end(key)
+            self.selection_hits += 1
+            return selection
+
+        self.selection_misses += 1
+        required, categories = self._required, self._category
+        indices = range(len(self._videos))
+        if device_mask is not None:
+            missing = ~device_mask
+            indices = [i for i in indices if not required[i] & missing]
+        if category_mask is not None:
+            indices = [i for i in indices if categories[i] & category_mask]
+        selection = list(indices)
+
+        self._selections[key] = selection
+        if len(self._selections) > MAX_CACHED_SELECTIONS:
+            self._selections.popitem(last=False)
+        return selection
+
+    def page(self, selection: List[int], after: Optional[SortKey] = None, limit: Optional[int] = None) -> Tuple[List[int], Optional[SortKey]]:
+        """
+        絞り込み結果からカーソル以降の1ページを切り出す
+
+        Args:
+            after: 前ページ最後の動画のソートキー（Noneなら先頭から）
+            limit: 件数（Noneなら残り全件）
+
+        Returns:
+            (ページ内の添字, 次ページがあれば最後の動画のソートキー)
+        """
+        start = 0
+        if after is not None:
+            # ソートキー配列上の位置に変換してから、絞り込み結果（添字の昇順）上の位置を求める
+            start = bisect_right(selection, bisect_right(self._keys, after) - 1)
+        end = len(selection) if limit is None else min(len(selection), start + limit)
+        page = selection[start:end]
+        next_key = self._keys[page[-1]] if page and end < len(selection) else None
+        return page, next_key
+
+    def video(self, index: int) -> EnhancedVideo:
+        return self._videos[index]
+
+    def missing_capabilities(self, index: int, device_mask: int) -> List[str]:
+        """不足機能の名前"""
+        return self.capabilities.names(self._required[index] & ~device_mask)
+
+    def is_compatible(self, index: int, device_mask: int) -> bool:
+        return not self._required[index] & ~device_mask
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'videos': len(self._videos),
+            'generation': self._generation,
+            'capability_bits': len(self.capabilities),
+            'category_bits': len(self.categories),
+            'cached_selections': len(self._selections),
+            'rebuilds': self.rebuild_count,
+            'selection_hits': self.selection_hits,
+            'selection_misses': self.selection_misses
+        }
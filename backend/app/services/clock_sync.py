@@ -0,0 +1,59 @@
+"""
+クロック同期 - 接続ごとの遅延・時計オフセット推定
+
+フロントエンドの sync メッセージはクライアント時刻 ts（ミリ秒）を持つ。
+サーバー受信時刻との差 (受信時刻 - ts) は「時計オフセット + 片道遅延」なので、
+直近ウィンドウの最小値を「時計オフセット + 最小遅延」とみなし、
+各メッセージの遅延 = 最小遅延 + (今回の差 - 最小値) として推定する。
+"""
+
+from collections import deque
+from typing import Deque, Dict, Optional, Any
+
+from app.config.settings import settings
+
+class OneWayClockEstimator:
+    """片道メッセージの送信時刻から遅延を推定（接続ごと）"""
+
+    def __init__(self, window: Optional[int] = None, base_delay_ms: Optional[float] = None):
+        self.samples: Deque[float] = deque(maxlen=window or settings.sync_latency_window)
+        # 最小遅延の仮定値（片道のみでは時計オフセットと分離できないため）
+        self.base_delay_ms = settings.sync_assumed_min_delay_ms if base_delay_ms is None else base_delay_ms
+        self.last_delay_ms: Optional[float] = None
+
+    def observe(self, client_ts_ms: float, server_receive_ms: float) -> float:
+        """
+        サンプルを追加して今回のメッセージの片道遅延（ミリ秒）を返す
+
+        Args:
+            client_ts_ms: クライアント送信時刻（クライアント時計・ミリ秒）
+            server_receive_ms: サーバー受信時刻（ミリ秒）
+        """
+        sample = server_receive_ms - client_ts_ms
+        self.samples.append(sample)
+        self.last_delay_ms = self.base_delay_ms + (sample - min(self.samples))
+        return self.last_delay_ms
+
+    @property
+    def clock_offset_ms(self) -> Optional[float]:
+        """サーバー時計 - クライアント時計（ミリ秒）"""
+        if not self.samples:
+            return None
+        return min(self.samples) - self.base_delay_ms
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'samples': len(self.samples),
+            'clock_offset_ms': round(self.clock_offset_ms, 1) if self.clock_offset_ms is not None else None,
+            'last_delay_ms': round(self.last_delay_ms, 1) if self.last_delay_ms is not None else None
+        }
+
+def compensate_media_time(media_time: float, state: str, delay_ms: float) -> float:
+    """
+    送信時点のメディア時刻を受信時点の値に補正
+
+    再生中のみ遅延分だけ進める（補正量は settings.sync_max_compensation_ms で上限）。
+    """
+    if state != "play":
+        return media_time
+    return media_time + min(max(delay_ms, 0.0), settings.sync_max_compensation_ms) / 1000
@@ -0,0 +1,245 @@
+"""
+コンパイル済みタイムライン - 動画ごとに1度だけ構築する列指向のイベント表現
+
+タイムラインJSON（イベント辞書のリスト）を時刻順に並べ替え、
+時刻・強度・長さは数値配列、effect / mode / action はインターン済みコード配列、
+キャプション等の文字列は別領域に保持する。
+同じ動画を視聴する全セッションが読み取り専用で共有する。
+"""
+
+import bisect
+import logging
+import math
+import sys
+from array import array
+from collections import Counter
+from typing import Dict, Optional, Any, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 列として保持するイベントキー（それ以外は extras に退避）
+_COLUMN_KEYS = {"t", "time", "effect", "type", "mode", "action", "intensity", "duration", "text"}
+
+class SymbolTable:
+    """文字列のインターン表（コード0は「値なし」）"""
+
+    def __init__(self):
+        self._codes: Dict[str, int] = {}
+        self._symbols: List[Optional[str]] = [None]
+
+    def code(self, value: Optional[str]) -> int:
+        if value is None:
+            return 0
+        code = self._codes.get(value)
+        if code is None:
+            code = len(self._symbols)
+            self._codes[value] = code
+            self._symbols.append(value)
+        return code
+
+    def symbol(self, code: int) -> Optional[str]:
+        return self._symbols[code]
+
+    def __len__(self) -> int:
+        return len(self._symbols) - 1
+
+# 全タイムラインで共有（effect / mode / action の語彙は小さい）
+symbols = SymbolTable()
+
+class CompiledTimeline:
+    """列指向のコンパイル済みタイムライン（読み取り専用）"""
+
+    __slots__ = (
+        "video_id", "time_key", "effect_key", "times", "effects", "modes", "actions",
+        "intensities", "durations", "captions", "extras"
+    )
+
+    def __init__(self, video_id: str, events: List[Dict[str, Any]]):
+        self.video_id = video_id
+        # 元データのキー名（"events" 形式は t/effect、"sync_events" 形式は time/type の場合がある）
+        sample = events[0] if events else {}
+        self.time_key = "t" if "t" in sample or "time" not in sample else "time"
+        self.effect_key = "effect" if "effect" in sample or "type" not in sample else "type"
+
+        ordered = sorted(events, key=lambda event: float(event.get(self.time_key, 0) or 0))
+
+        self.times = array("d")
+        self.effects = array("H")
+        self.modes = array("H")
+        self.actions = array("H")
+        # 値なしは NaN
+        self.intensities = array("d")
+        self.durations = array("d")
+        # イベント番号 → キャプション等の文字列 / 列にないキー
+        self.captions: Dict[int, str] = {}
+        self.extras: Dict[int, Dict[str, Any]] = {}
+
+        for index, event in enumerate(ordered):
+            self.times.append(float(event.get(self.time_key, 0) or 0))
+            self.effects.append(symbols.code(event.get(self.effect_key)))
+            self.modes.append(symbols.code(event.get("mode")))
+            self.actions.append(symbols.code(event.get("action")))
+            intensity = event.get("intensity")
+            self.intensities.append(math.nan if intensity is None else float(intensity))
+            duration = event.get("duration")
+            self.durations.append(math.nan if duration is None else float(duration))
+            if "text" in event:
+                self.captions[index] = event["text"]
+            extra = {key: value for key, value in event.items() if key not in _COLUMN_KEYS}
+            if extra:
+                self.extras[index] = extra
+
+    @classmethod
+    def from_timeline_data(cls, video_id: str, timeline_data: Dict[str, Any]) -> "CompiledTimeline":
+        """タイムラインJSON（"events" または "sync_events"）からコンパイル"""
+        events = timeline_data.get("events")
+        if events is None:
+            events = timeline_data.get("sync_events", [])
+        return cls(video_id, events)
+
+    @property
+    def event_count(self) -> int:
+        return len(self.times)
+
+    @property
+    def duration(self) -> float:
+        """最後のイベント時刻（秒）"""
+        return self.times[-1] if self.times else 0.0
+
+    def window(self, start: Optional[float], end: float, include_start: bool = False) -> Tuple[int, int]:
+        """
+        区間 (start, end]（include_start なら [start, end]）のイベント番号範囲 [lo, hi)
+
+        Args:
+            start: 開始時刻（Noneなら先頭から）
+            end: 終了時刻
+        """
+        if start is None:
+            lo = 0
+        elif include_start:
+            lo = bisect.bisect_left(self.times, start)
+        else:
+            lo = bisect.bisect_right(self.times, start)
+        hi = bisect.bisect_right(self.times, end)
+        return lo, max(lo, hi)
+
+    def next_time_after(self, position: float) -> Optional[float]:
+        """position より後の最初のイベント時刻（無ければNone）"""
+        index = bisect.bisect_right(self.times, position)
+        return self.times[index] if index < len(self.times) else None
+
+    def event(self, index: int) -> Dict[str, Any]:
+        """イベント辞書を復元（配信時に必要な分だけ生成）"""
+        event: Dict[str, Any] = {self.time_key: self.times[index]}
+        for key, code in ((self.effect_key, self.effects[index]), ("mode", self.modes[index]), ("action", self.actions[index])):
+            if code:
+                event[key] = symbols.symbol(code)
+        if not math.isnan(self.intensities[index]):
+            event["intensity"] = self.intensities[index]
+        if not math.isnan(self.durations[index]):
+            event["duration"] = self.durations[index]
+        if index in self.captions:
+            event["text"] = self.captions[index]
+        if index in self.extras:
+            event.update(self.extras[index])
+        return event
+
+    def events(self, lo: int = 0, hi: Optional[int] = None) -> List[Dict[str, Any]]:
+        """イベント番号範囲 [lo, hi) のイベント辞書"""
+        hi = self.event_count if hi is None else hi
+        return [self.event(index) for index in range(lo, hi)]
+
+    def effect_counts(self) -> Dict[str, int]:
+        """エフェクト別イベント数"""
+        return {
+            symbols.symbol(code): count
+            for code, count in Counter(self.effects).items() if code
+        }
+
+    def effect_stats(self, default_intensity: float = 0.5, default_duration_ms: float = 1000.0) -> Dict[str, Dict[str, float]]:
+        """
+        エフェクト別統計（件数・平均強度・合計時間[秒]）
+
+        Args:
+            default_intensity: 強度が無いイベントの値
+            default_duration_ms: 長さが無いイベントの値（ミリ秒）
+        """
+        stats: Dict[int, List[float]] = {}
+        for code, intensity, duration in zip(self.effects, self.intensities, self.durations):
+            if not code:
+                continue
+            entry = stats.setdefault(code, [0, 0.0, 0.0])
+            entry[0] += 1
+            entry[1] += default_intensity if math.isnan(intensity) else intensity
+            entry[2] += (default_duration_ms if math.isnan(duration) else duration) / 1000
+        return {
+            symbols.symbol(code): {
+                "count": count,
+                "intensity_avg": total_intensity / count,
+                "duration_total": total_duration
+            }
+            for code, (count, total_intensity, total_duration) in stats.items()
+        }
+
+    def density(self, bucket_seconds: float = 1.0) -> List[int]:
+        """一定間隔ごとのイベント数（ヒストグラム）"""
+        if not self.times or bucket_seconds <= 0:
+            return []
+        buckets = int(self.duration // bucket_seconds) + 1
+        edges = [bisect.bisect_left(self.times, bucket * bucket_seconds) for bucket in range(buckets + 1)]
+        edges[-1] = self.event_count
+        return [edges[bucket + 1] - edges[bucket] for bucket in range(buckets)]
+
+    def memory_footprint(self) -> Dict[str, int]:
+        """概算メモリ使用量（バイト）"""
+        columns = sum(
+            column.buffer_info()[1] * column.itemsize
+            for column in (self.times, self.effects, self.modes, self.actions, self.intensities, self.durations)
+        )
+        captions = sys.getsizeof(self.captions) + sum(sys.getsizeof(text) for text in self.captions.values())
+        extras = sys.getsizeof(self.extras) + sum(sys.getsizeof(extra) for extra in self.extras.values())
+        return {
+            "columns_bytes": columns,
+            "captions_bytes": captions,
+            "extras_bytes": extras,
+            "total_bytes": columns + captions + extras
+        }
+
+class CompiledTimelineStore:
+    """video_id ごとのコンパイル済みタイムライン（全セッション・全サービスで共有）"""
+
+    def __init__(self):
+        self._timelines: Dict[str, CompiledTimeline] = {}
+
+    def compile(self, video_id: str, timeline_data: Dict[str, Any]) -> CompiledTimeline:
+        """コンパイルして登録（同じ動画の既存分は置き換え）"""
+        compiled = CompiledTimeline.from_timeline_data(video_id, timeline_data)
+        self._timelines[video_id] = compiled
+        logger.debug(f"[TIMELINE] コンパイル: {video_id}, {compiled.event_count}イベント, {compiled.memory_footprint()['total_bytes']}B")
+        return compiled
+
+    def get(self, video_id: str) -> Optional[CompiledTimeline]:
+        return self._timelines.get(video_id)
+
+    def get_or_compile(self, video_id: str, timeline_data: Dict[str, Any]) -> CompiledTimeline:
+        compiled = self._timelines.get(video_id)
+        return compiled if compiled is not None else self.compile(video_id, timeline_data)
+
+    def invalidate(self, video_id: str):
+        self._timelines.pop(video_id, None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """登録数・イベント数・メモリ使用量"""
+        return {
+            "timelines": len(self._timelines),
+            "symbols": len(symbols),
+            "total_events": sum(t.event_count for t in self._timelines.values()),
+            "total_bytes": sum(t.memory_footprint()["total_bytes"] for t in self._timelines.values()),
+            "per_video": {
+                video_id: {"events": t.event_count, **t.memory_footprint()}
+                for video_id, t in self._timelines.items()
+            }
+        }
+
+# 共有インスタンス
+compiled_timeline_store = CompiledTimelineStore()
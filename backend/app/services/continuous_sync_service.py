@@ -1,33 +1,58 @@
 """
 リアルタイム同期サービス - ラズパイ連続送信パターン実装
 
-0.5秒ごとのcurrentTime連続送信とループ再生対応
+currentTime連続送信とループ再生対応
 ラズパイデバッグコードの連続送信ループを再現
+送信間隔は固定（interval指定時）またはタイムラインのイベント配置に合わせた可変間隔
 """
 
 import asyncio
+import heapq
 import logging
-from typing import Dict, Optional, Callable, Any
+import math
+from typing import Dict, List, Optional, Callable, Any, Tuple
 from datetime import datetime
 import time
 
+from app.config.settings import settings
 from app.services.sync_data_service import sync_data_service
 
 logger = logging.getLogger(__name__)
 
 class ContinuousSyncService:
-    """連続時間同期サービス"""
+    """
+    連続時間同期サービス
+
+    全セッションを1つのスケジューラタスクで駆動する。
+    各セッションの次回送信時刻（monotonic）をヒープで管理し、
+    期限が来たセッションだけを処理するため1ティックのコストは O(期限到来セッション数)。
+    
+    固定間隔: 次回時刻は「前回の予定時刻 + interval」で決めるため、コールバックの処理時間で周期がずれない。
+    可変間隔（interval=None）: コンパイル済みタイムラインから次のイベント時刻を引き、
+    イベントの lead_time 前とイベント時刻ちょうどに送る。イベントの無い区間は max_interval ごとの
+    キープアライブのみ、密集区間は min_interval ごと。一時停止・再開・シークは即時送信する。
+    """
     
     def __init__(self):
         self.active_syncs: Dict[str, Dict[str, Any]] = {}
-        self.sync_tasks: Dict[str, asyncio.Task] = {}
         self.sync_callbacks: Dict[str, Callable] = {}
+        self.min_interval = settings.sync_tick_min_interval
+        self.max_interval = settings.sync_tick_max_interval
+        self.lead_time = settings.sync_tick_lead_time
+        # (次回送信時刻, 世代, セッションID) のヒープ。停止・再開済みの古い世代は取り出し時に捨てる
+        self._schedule: List[Tuple[float, int, str]] = []
+        self._generation = 0
+        self._scheduler_task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        # 統計
+        self.ticks_sent = 0
+        self.ticks_skipped = 0
     
     async def start_continuous_sync(
         self, 
         session_id: str,
         callback: Callable[[Dict[str, Any]], None],
-        interval: float = 0.5  # ラズパイと同じ0.5秒間隔
+        interval: Optional[float] = None
     ):
         """
         連続同期開始（ラズパイパターン）
@@ -35,9 +60,9 @@ class ContinuousSyncService:
         Args:
             session_id: セッションID
             callback: 時間更新時のコールバック関数
-            interval: 送信間隔（秒）
+            interval: 固定送信間隔（秒）。Noneならタイムラインに合わせた可変間隔
         """
-        if session_id in self.sync_tasks:
+        if session_id in self.active_syncs:
             logger.warning(f"[CONTINUOUS_SYNC] 既に開始済み: {session_id}")
             return
         
@@ -47,103 +72,205 @@ class ContinuousSyncService:
             logger.error(f"[CONTINUOUS_SYNC] タイムライン状態が見つかりません: {session_id}")
             return
         
+        now = time.monotonic()
+        self._generation += 1
+        
         # 同期状態初期化
         self.active_syncs[session_id] = {
-            'start_time': time.time(),
+            'start_time': now,
             'current_time': 0.0,
             'is_playing': True,
             'interval': interval,
+            # 可変間隔時に直近で選んだ間隔（統計用）
+            'last_interval': interval,
             'total_duration': timeline_state.get('total_duration', 0.0),
-            'loop_count': 0
+            'loop_count': 0,
+            'generation': self._generation
         }
         
         self.sync_callbacks[session_id] = callback
         
-        # 連続同期タスク開始
-        task = asyncio.create_task(self._continuous_sync_loop(session_id))
-        self.sync_tasks[session_id] = task
+        # 初回は即時送信
+        self._schedule_at(now, self._generation, session_id)
+        self._ensure_scheduler()
         
-        logger.info(f"[CONTINUOUS_SYNC] 連続同期開始: {session_id}, interval={interval}s")
+        logger.info(
+            f"[CONTINUOUS_SYNC] 連続同期開始: {session_id}, "
+            f"interval={f'{interval}s' if interval else 'adaptive'}, duration={self.active_syncs[session_id]['total_duration']}s"
+        )
+    
+    def _schedule_at(self, deadline: float, generation: int, session_id: str):
+        heapq.heappush(self._schedule, (deadline, generation, session_id))
+        if self._wakeup is not None:
+            self._wakeup.set()
+    
+    def _push_now(self, session_id: str):
+        """予定を破棄して即時送信（一時停止・再開・シーク）"""
+        sync_state = self.active_syncs[session_id]
+        self._generation += 1
+        sync_state['generation'] = self._generation
+        self._schedule_at(time.monotonic(), self._generation, session_id)
+        self._ensure_scheduler()
     
-    async def _continuous_sync_loop(self, session_id: str):
+    def _next_deadline(self, session_id: str, sync_state: Dict[str, Any], deadline: float) -> float:
         """
-        連続同期ループ（ラズパイのメイン処理を再現）
+        次回送信時刻（monotonic）
         
-        ラズパイデバッグコードのwhile Trueループに対応
+        Args:
+            deadline: 今回の予定時刻
         """
-        try:
-            sync_state = self.active_syncs[session_id]
-            interval = sync_state['interval']
+        current = time.monotonic()
+        interval = sync_state['interval']
+        
+        if interval:
+            # 固定間隔：予定時刻基準（処理遅延を周期に持ち込まない）。
+            # 大きく遅れた場合は取りこぼした回をまとめて送らず、位相を保ったまま次の枠へ
+            next_deadline = deadline + interval
+            if next_deadline <= current:
+                missed = math.ceil((current - next_deadline) / interval)
+                self.ticks_skipped += missed
+                next_deadline += missed * interval
+                if next_deadline <= current:
+                    next_deadline += interval
+            return next_deadline
+        
+        next_deadline = current + self.max_interval
+        timeline_state = sync_data_service.get_timeline_state(session_id)
+        if sync_state['is_playing'] and timeline_state and timeline_state.get('compiled') is not None:
+            # 再生位置は monotonic と1対1（start_time + メディア時刻 = 実時刻）
             start_time = sync_state['start_time']
+            media_now = current - start_time
+            next_event = timeline_state['compiled'].next_time_after(media_now)
+            if next_event is not None:
+                event_deadline = start_time + next_event
+                preroll_deadline = event_deadline - self.lead_time
+                # 先行ティックがまだ先なら先行ティック、過ぎていればイベント時刻ちょうど
+                next_deadline = min(next_deadline, preroll_deadline if preroll_deadline > current + self.min_interval else event_deadline)
             total_duration = sync_state['total_duration']
-            
-            logger.info(f"[CONTINUOUS_SYNC] ループ開始: {session_id}, duration={total_duration}s")
-            
-            while session_id in self.active_syncs:
-                # 現在時刻計算
-                elapsed = time.time() - start_time
-                current_time = elapsed
-                
-                # ループ再生チェック（ラズパイと同様）
-                if current_time > total_duration and total_duration > 0:
-                    sync_state['loop_count'] += 1
-                    logger.info(f"[CONTINUOUS_SYNC] ループ再生リセット: {session_id}, loop#{sync_state['loop_count']}")
-                    
-                    # 時間をリセット（ラズパイパターン）
-                    start_time = time.time()
-                    sync_state['start_time'] = start_time
-                    current_time = 0.0
-                
-                # 状態更新
-                sync_state['current_time'] = current_time
-                
-                # 同期データサービスに時刻更新
-                time_state = sync_data_service.update_current_time(
-                    session_id, current_time, sync_state['is_playing']
-                )
-                
-                # 時刻周辺のイベント検索
-                events = sync_data_service.find_events_at_time(session_id, current_time)
-                
-                # 送信データ作成（ラズパイのtime_update_data形式）
-                time_update_data = {
-                    'type': 'currentTime',
-                    'session_id': session_id,
-                    'currentTime': round(current_time, 2),
-                    'total_duration': total_duration,
-                    'is_playing': sync_state['is_playing'],
-                    'loop_count': sync_state['loop_count'],
-                    'events': events,
-                    'timestamp': datetime.now().isoformat()
-                }
-                
-                logger.debug(f"[CONTINUOUS_SYNC] 時刻送信: {current_time:.2f}s, events={len(events)}")
+            if total_duration > 0:
+                # ループ境界を過ぎた直後に送ってループを検出する
+                next_deadline = min(next_deadline, start_time + total_duration + 0.001)
+        
+        next_deadline = max(next_deadline, current + self.min_interval)
+        sync_state['last_interval'] = round(next_deadline - current, 3)
+        return next_deadline
+    
+    def _ensure_scheduler(self):
+        """スケジューラタスクが動いていなければ起動"""
+        if self._scheduler_task is None or self._scheduler_task.done():
+            self._wakeup = asyncio.Event()
+            self._scheduler_task = asyncio.create_task(self._scheduler_loop())
+    
+    async def _scheduler_loop(self):
+        """
+        全セッション共通のスケジューラ（ラズパイのwhile Trueループを集約）
+        
+        最も早い期限まで待機し、期限が来たセッションをまとめて処理する。
+        """
+        try:
+            while self._schedule:
+                deadline, generation, session_id = self._schedule[0]
+                sync_state = self.active_syncs.get(session_id)
+                if sync_state is None or sync_state['generation'] != generation:
+                    # 停止済み・再開始済みの古いエントリ
+                    heapq.heappop(self._schedule)
+                    continue
                 
-                # コールバック実行
-                callback = self.sync_callbacks.get(session_id)
-                if callback:
+                delay = deadline - time.monotonic()
+                if delay > 0:
+                    # 新しいセッションが先頭に入った場合は待機を打ち切る
+                    self._wakeup.clear()
                     try:
-                        await callback(time_update_data)
-                    except Exception as e:
-                        logger.error(f"[CONTINUOUS_SYNC] コールバックエラー: {e}")
+                        await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
                 
-                # インターバル待機
-                await asyncio.sleep(interval)
+                # 期限到来分をまとめて処理（ウォールクロック時刻は1回だけ取得）
+                now = time.monotonic()
+                timestamp = datetime.now().isoformat()
+                due: List[Tuple[float, int, str]] = []
+                while self._schedule and self._schedule[0][0] <= now:
+                    due.append(heapq.heappop(self._schedule))
                 
+                for deadline, generation, session_id in due:
+                    sync_state = self.active_syncs.get(session_id)
+                    if sync_state is None or sync_state['generation'] != generation:
+                        continue
+                    
+                    await self._tick(session_id, sync_state, timestamp)
+                    
+                    if session_id in self.active_syncs and sync_state['generation'] == generation:
+                        self._schedule_at(self._next_deadline(session_id, sync_state, deadline), generation, session_id)
+                        
         except asyncio.CancelledError:
-            logger.info(f"[CONTINUOUS_SYNC] 同期ループキャンセル: {session_id}")
+            logger.info("[CONTINUOUS_SYNC] スケジューラ停止")
             
         except Exception as e:
-            logger.error(f"[CONTINUOUS_SYNC] ループエラー: {e}")
+            logger.error(f"[CONTINUOUS_SYNC] スケジューラエラー: {e}")
+    
+    async def _tick(self, session_id: str, sync_state: Dict[str, Any], timestamp: str):
+        """1セッション分の時刻送信"""
+        try:
+            total_duration = sync_state['total_duration']
             
-        finally:
-            # クリーンアップ
-            await self._cleanup_sync(session_id)
+            # 現在時刻計算（一時停止中は停止位置のまま）
+            if sync_state['is_playing']:
+                current_time = time.monotonic() - sync_state['start_time']
+            else:
+                current_time = sync_state['current_time']
+            
+            # ループ再生チェック（ラズパイと同様）
+            if current_time > total_duration and total_duration > 0:
+                sync_state['loop_count'] += 1
+                logger.info(f"[CONTINUOUS_SYNC] ループ再生リセット: {session_id}, loop#{sync_state['loop_count']}")
+                
+                # 時間をリセット（ラズパイパターン）
+                sync_state['start_time'] = time.monotonic()
+                current_time = 0.0
+            
+            # 状態更新
+            sync_state['current_time'] = current_time
+            
+            # 同期データサービスに時刻更新
+            sync_data_service.update_current_time(
+                session_id, current_time, sync_state['is_playing']
+            )
+            
+            # 前回ティックから現在時刻までに到来したイベント（取りこぼし・重複なし。一時停止中は取得しない）
+            events = sync_data_service.collect_due_events(session_id, current_time) if sync_state['is_playing'] else []
+            
+            # 送信データ作成（ラズパイのtime_update_data形式）
+            time_update_data = {
+                'type': 'currentTime',
+                'session_id': session_id,
+                'currentTime': round(current_time, 2),
+                'total_duration': total_duration,
+                'is_playing': sync_state['is_playing'],
+                'loop_count': sync_state['loop_count'],
+                'events': events,
+                'timestamp': timestamp
+            }
+            
+            logger.debug(f"[CONTINUOUS_SYNC] 時刻送信: {current_time:.2f}s, events={len(events)}")
+            
+            # コールバック実行
+            callback = self.sync_callbacks.get(session_id)
+            if callback:
+                await callback(time_update_data)
+                self.ticks_sent += 1
+                
+        except Exception as e:
+            logger.error(f"[CONTINUOUS_SYNC] コールバックエラー: {e}")
     
     def pause_sync(self, session_id: str):
-        """同期一時停止"""
+        """同期一時停止（停止状態を即時送信）"""
         if session_id in self.active_syncs:
-            self.active_syncs[session_id]['is_playing'] = False
+            sync_state = self.active_syncs[session_id]
+            if sync_state['is_playing']:
+                sync_state['current_time'] = time.monotonic() - sync_state['start_time']
+            sync_state['is_playing'] = False
+            self._push_now(session_id)
             logger.info(f"[CONTINUOUS_SYNC] 一時停止: {session_id}")
     
     def resume_sync(self, session_id: str):
@@ -152,8 +279,11 @@ class ContinuousSyncService:
             # 時間をリセットして再開
             self.active_syncs[session_id].update({
                 'is_playing': True,
-                'start_time': time.time()
+                'start_time': time.monotonic()
             })
+            # 再生位置が先頭に戻るため、ループ扱いで残りイベントを送らないよう起点も戻す
+            sync_data_service.reset_event_cursor(session_id, 0.0)
+            self._push_now(session_id)
             logger.info(f"[CONTINUOUS_SYNC] 再開: {session_id}")
     
     def seek_sync(self, session_id: str, seek_time: float):
@@ -166,36 +296,27 @@ class ContinuousSyncService:
         """
         if session_id in self.active_syncs:
             # シーク時刻に合わせて開始時刻を調整
-            current_real_time = time.time()
+            current_real_time = time.monotonic()
             self.active_syncs[session_id].update({
                 'start_time': current_real_time - seek_time,
                 'current_time': seek_time
             })
             
-            # 同期データサービスも更新
+            # 同期データサービスも更新（イベント取得の起点もシーク先へ）
             sync_data_service.update_current_time(session_id, seek_time, True)
+            sync_data_service.reset_event_cursor(session_id, seek_time)
+            self._push_now(session_id)
             
             logger.info(f"[CONTINUOUS_SYNC] シーク: {session_id} -> {seek_time}s")
     
     async def stop_sync(self, session_id: str):
-        """同期停止"""
-        if session_id in self.sync_tasks:
-            task = self.sync_tasks[session_id]
-            task.cancel()
-            
-            try:
-                await task
-            except asyncio.CancelledError:
-                pass
-            
+        """同期停止（ヒープ上の予定は次回取り出し時に破棄される）"""
+        if session_id in self.active_syncs:
+            await self._cleanup_sync(session_id)
             logger.info(f"[CONTINUOUS_SYNC] 同期停止: {session_id}")
     
     async def _cleanup_sync(self, session_id: str):
         """同期状態クリーンアップ"""
-        # タスク削除
-        if session_id in self.sync_tasks:
-            del self.sync_tasks[session_id]
-        
         # 状態削除
         if session_id in self.active_syncs:
             del self.active_syncs[session_id]
@@ -214,12 +335,24 @@ class ContinuousSyncService:
         sync_state = self.active_syncs[session_id]
         return {
             'session_id': session_id,
-            'is_active': session_id in self.sync_tasks,
+            'is_active': True,
             'is_playing': sync_state.get('is_playing', False),
             'current_time': sync_state.get('current_time', 0.0),
             'total_duration': sync_state.get('total_duration', 0.0),
             'loop_count': sync_state.get('loop_count', 0),
-            'interval': sync_state.get('interval', 0.5)
+            'interval': sync_state.get('interval'),
+            'adaptive': not sync_state.get('interval'),
+            'last_interval': sync_state.get('last_interval')
+        }
+    
+    def get_scheduler_stats(self) -> Dict[str, Any]:
+        """スケジューラ統計"""
+        return {
+            'running': self._scheduler_task is not None and not self._scheduler_task.done(),
+            'active_sessions': len(self.active_syncs),
+            'scheduled_entries': len(self._schedule),
+            'ticks_sent': self.ticks_sent,
+            'ticks_skipped': self.ticks_skipped
         }
     
     def get_all_active_syncs(self) -> Dict[str, Dict[str, Any]]:
@@ -0,0 +1,165 @@
+"""
+デバイスレジストリ - 製品情報と登録済みデバイスのメモリ内インデックス
+
+devices.json を起動時に1度読み込んで検証し、製品コードで引けるようにする。
+ファイルの (サイズ, mtime) はアクセス時に reload_interval 秒おきに確認し、変わっていれば読み直す
+（読み直しに失敗した場合は直前の内容を使い続ける）。
+登録で発行した device_id → 機能リストはセッションタイムアウトまで保持し、動画フィルタリングで使用する。
+"""
+
+import json
+import logging
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional, Any, List
+
+from app.config.settings import settings
+from app.models.device import DeviceInfo, VALID_CAPABILITIES
+
+logger = logging.getLogger(__name__)
+
+# validation_rules に指定が無い場合のセッションタイムアウト（分）
+DEFAULT_SESSION_TIMEOUT_MINUTES = 60
+
+class DeviceRegistry:
+    """製品コード・デバイスIDで引けるデバイス情報（ファイル変更時に再読み込み）"""
+
+    def __init__(self, devices_path: Optional[Path] = None):
+        self.devices_path = devices_path or settings.get_device_data_path()
+        self.reload_interval = settings.device_registry_reload_interval
+        # 製品コード → 検証済みデバイス情報
+        self._products: Dict[str, DeviceInfo] = {}
+        self._validation_rules: Dict[str, Any] = {}
+        self._signature: Optional[List[int]] = None
+        # 読み込みに失敗したファイルの署名（変更されるまで再試行しない）
+        self._failed_signature: Optional[List[int]] = None
+        self._loaded = False
+        self._last_check: Optional[float] = None
+        # device_id → {'product_code', 'capabilities', 'expires_at'}（登録順 = 期限順）
+        self._registered: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        # 統計
+        self.load_count = 0
+        self.invalid_count = 0
+        self.reload_failures = 0
+
+    def load(self) -> int:
+        """
+        devices.json を読み込んで検証（不正なエントリは除外して警告）
+
+        Returns:
+            読み込んだ製品数
+
+        Raises:
+            FileNotFoundError: ファイルが無い
+            ValueError: JSONとして不正
+        """
+        stat = self.devices_path.stat()
+        with open(self.devices_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if not isinstance(data, dict) or not isinstance(data.get('devices', {}), dict):
+            raise ValueError("devices が製品コードをキーとするオブジェクトではありません")
+
+        products: Dict[str, DeviceInfo] = {}
+        invalid = 0
+        for product_code, entry in data.get('devices', {}).items():
+            try:
+                device_info = DeviceInfo(**entry)
+            except Exception as e:
+                invalid += 1
+                logger.warning(f"devices.json の不正なエントリを除外: {product_code}: {e}")
+                continue
+            unknown = [cap for cap in device_info.capabilities if cap not in VALID_CAPABILITIES]
+            if unknown:
+                logger.warning(f"未知の機能を含むデバイス: {product_code}: {unknown}")
+            products[product_code] = device_info
+
+        self._products = products
+        self._validation_rules = data.get('validation_rules', {}) or {}
+        self._signature = [stat.st_size, stat.st_mtime_ns]
+        self._loaded = True
+        self._last_check = time.monotonic()
+        self.load_count += 1
+        self.invalid_count = invalid
+        logger.info(f"デバイス情報読み込み完了: {len(products)}件 (除外 {invalid}件, {self.devices_path})")
+        return len(products)
+
+    def _refresh(self):
+        """未読み込みなら読み込み、確認間隔を過ぎていればファイル変更を確認"""
+        if not self._loaded:
+            self.load()
+            return
+        now = time.monotonic()
+        if now - self._last_check < self.reload_interval:
+            return
+        self._last_check = now
+        signature = None
+        try:
+            stat = self.devices_path.stat()
+            signature = [stat.st_size, stat.st_mtime_ns]
+            if signature != self._signature and signature != self._failed_signature:
+                logger.info("devices.json の変更を検出したため再読み込みします")
+                self.load()
+        except (OSError, ValueError) as e:
+            self._failed_signature = signature
+            self.reload_failures += 1
+            logger.warning(f"devices.json の再読み込みに失敗しました（直前の内容を使用）: {e}")
+
+    def get_product(self, product_code: str) -> Optional[DeviceInfo]:
+        """
+        製品コードからデバイス情報を取得（未登録ならNone）
+
+        Raises:
+            FileNotFoundError / ValueError: 初回読み込みに失敗
+        """
+        self._refresh()
+        return self._products.get(product_code)
+
+    def session_timeout_minutes(self) -> int:
+        self._refresh()
+        return self._validation_rules.get('session_timeout_minutes', DEFAULT_SESSION_TIMEOUT_MINUTES)
+
+    def register(self, device_id: str, device_info: DeviceInfo, timeout_minutes: int):
+        """発行した device_id と機能リストを記録（期限切れの登録はここで破棄）"""
+        now = time.monotonic()
+        while self._registered:
+            oldest_id, oldest = next(iter(self._registered.items()))
+            if oldest['expires_at'] > now:
+                break
+            del self._registered[oldest_id]
+        self._registered[device_id] = {
+            'product_code': device_info.product_code,
+            'capabilities': list(device_info.capabilities),
+            'expires_at': now + timeout_minutes * 60
+        }
+
+    def get_capabilities(self, device_id: str) -> Optional[List[str]]:
+        """
+        デバイスの機能リスト（登録済み device_id、または製品コード。不明ならNone）
+        """
+        registered = self._registered.get(device_id)
+        if registered is not None:
+            if registered['expires_at'] > time.monotonic():
+                return registered['capabilities']
+            del self._registered[device_id]
+        try:
+            device_info = self.get_product(device_id)
+        except (OSError, ValueError) as e:
+            logger.warning(f"デバイス情報を読み込めません: {e}")
+            return None
+        return device_info.capabilities if device_info else None
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'devices_path': str(self.devices_path),
+            'loaded': self._loaded,
+            'products': len(self._products),
+            'registered_devices': len(self._registered),
+            'loads': self.load_count,
+            'invalid_entries': self.invalid_count,
+            'reload_failures': self.reload_failures,
+            'reload_interval': self.reload_interval
+        }
+
+# 共有インスタンス
+device_registry = DeviceRegistry()
@@ -0,0 +1,268 @@
+"""
+メディアプローブ - 動画ファイルの実メタデータ取得（バックグラウンド）
+
+再生時間・解像度・fps・音声の有無をコンテナヘッダーから読み取り、カタログの VideoInfo に反映する。
+読み取りは ffprobe（無ければ cv2）を有界のプロセスプールで実行し、APIはプローブの完了を待たない。
+結果は (ファイル名, サイズ, mtime) ごとにキャッシュし、一覧APIが返した動画を優先して処理する。
+"""
+
+import asyncio
+import heapq
+import json
+import logging
+import shutil
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Optional, Any, List, Tuple, Iterable, Set, TYPE_CHECKING
+
+from app.config.settings import settings
+
+if TYPE_CHECKING:
+    from app.services.video_catalog import VideoCatalogIndex
+
+logger = logging.getLogger(__name__)
+
+# 優先度（小さいほど先に処理）
+PRIORITY_VISIBLE = 0     # 一覧APIが返した動画
+PRIORITY_BACKGROUND = 1  # スキャンで見つかった未プローブの動画
+
+def _probe_with_ffprobe(path: str, timeout: float) -> Optional[Dict[str, Any]]:
+    ffprobe = shutil.which("ffprobe")
+    if ffprobe is None:
+        return None
+    completed = subprocess.run(
+        [ffprobe, "-v", "error", "-print_format", "json", "-show_format", "-show_streams", path],
+        capture_output=True, timeout=timeout, check=True
+    )
+    info = json.loads(completed.stdout or b"{}")
+    streams = info.get("streams", [])
+    video = next((s for s in streams if s.get("codec_type") == "video"), {})
+    fps = None
+    if video.get("avg_frame_rate") and video["avg_frame_rate"] != "0/0":
+        numerator, _, denominator = video["avg_frame_rate"].partition("/")
+        fps = float(numerator) / float(denominator or 1)
+    duration = info.get("format", {}).get("duration") or video.get("duration")
+    return {
+        "duration_seconds": float(duration) if duration else None,
+        "width": video.get("width"),
+        "height": video.get("height"),
+        "fps": round(fps, 3) if fps else None,
+        "has_audio": any(s.get("codec_type") == "audio" for s in streams),
+        "prober": "ffprobe"
+    }
+
+def _probe_with_cv2(path: str) -> Optional[Dict[str, Any]]:
+    try:
+        import cv2
+    except ImportError:
+        return None
+    capture = cv2.VideoCapture(path)
+    try:
+        if not capture.isOpened():
+            raise ValueError(f"動画を開けません: {path}")
+        fps = capture.get(cv2.CAP_PROP_FPS) or None
+        frames = capture.get(cv2.CAP_PROP_FRAME_COUNT) or 0
+        return {
+            "duration_seconds": frames / fps if fps and frames else None,
+            "width": int(capture.get(cv2.CAP_PROP_FRAME_WIDTH)) or None,
+            "height": int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT)) or None,
+            "fps": round(fps, 3) if fps else None,
+            # cv2 は音声ストリームを扱わない
+            "has_audio": None,
+            "prober": "cv2"
+        }
+    finally:
+        capture.release()
+
+def probe_media_file(path: str, timeout: float) -> Optional[Dict[str, Any]]:
+    """
+    動画ファイルのヘッダーを読み取る（プロセスプールで実行）
+
+    Returns:
+        duration_seconds / width / height / fps / has_audio / prober（利用できるプローブが無ければNone）
+    """
+    result = _probe_with_ffprobe(path, timeout)
+    if result is None:
+        result = _probe_with_cv2(path)
+    return result
+
+class MediaProbeService:
+    """優先度付きキューと有界プロセスプールによるバックグラウンドプローブ"""
+
+    def __init__(self):
+        self.enabled = settings.media_probe_enabled
+        self.workers = max(1, settings.media_probe_workers)
+        self.timeout = settings.media_probe_timeout
+        # (ファイル名, サイズ, mtime_ns) → 結果
+        self._results: Dict[Tuple[str, int, int], Dict[str, Any]] = {}
+        # (優先度, 投入順, video_id) のヒープ。優先度を上げた場合は再投入し古い方は取り出し時に捨てる
+        self._heap: List[Tuple[int, int, str]] = []
+        self._queued: Dict[str, int] = {}
+        # 実行中の video_id と、失敗したファイル（変更されるまで再試行しない）
+        self._running: Set[str] = set()
+        self._failed: Set[Tuple[str, int, int]] = set()
+        self._seq = 0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._catalog: Optional["VideoCatalogIndex"] = None
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._tasks: List[asyncio.Task] = []
+        self._persist_task: Optional[asyncio.Task] = None
+        self._unavailable = False
+        # 統計
+        self.probed_count = 0
+        self.cache_hits = 0
+        self.failed_count = 0
+
+    def enqueue(self, catalog: "VideoCatalogIndex", video_ids: Iterable[str], priority: int = PRIORITY_BACKGROUND):
+        """
+        プローブ対象を投入（ノンブロッキング）
+
+        キャッシュ済みの結果はその場で反映し、実行済み・実行中の動画は投入しない。
+        """
+        if not self.enabled or self._unavailable:
+            return
+        self._catalog = catalog
+        for video_id in video_ids:
+            video = catalog.get(video_id)
+            key = self._key(catalog, video_id)
+            if video is None or key is None or video.video_info.metadata_probed:
+                continue
+            if video_id in self._running or key in self._failed:
+                continue
+            cached = self._results.get(key)
+            if cached is not None:
+                self.cache_hits += 1
+                self._apply(video_id, key, cached)
+                continue
+            current = self._queued.get(video_id)
+            if current is not None and current <= priority:
+                continue
+            self._queued[video_id] = priority
+            self._seq += 1
+            heapq.heappush(self._heap, (priority, self._seq, video_id))
+        if self._heap:
+            self._start()
+            self._wakeup.set()
+
+    async def stop(self):
+        """ワーカーとプロセスプールを停止（未保存の反映結果は保存する）"""
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+        if self._persist_task is not None and not self._persist_task.done():
+            self._persist_task.cancel()
+            try:
+                await self._catalog.persist()
+            except OSError as e:
+                logger.warning(f"[MEDIA_PROBE] カタログ保存失敗: {e}")
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'enabled': self.enabled and not self._unavailable,
+            'workers': self.workers,
+            'queued': len(self._queued),
+            'running': len(self._running),
+            'cached_results': len(self._results),
+            'probed': self.probed_count,
+            'cache_hits': self.cache_hits,
+            'failed': self.failed_count
+        }
+
+    @staticmethod
+    def _key(catalog: "VideoCatalogIndex", video_id: str) -> Optional[Tuple[str, int, int]]:
+        signature = catalog.signature(video_id)
+        if signature is None:
+            return None
+        size, mtime_ns = signature['video']
+        return signature['file_name'], size, mtime_ns
+
+    def _start(self):
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+            self._wakeup = asyncio.Event()
+        self._tasks = [task for task in self._tasks if not task.done()]
+        while len(self._tasks) < self.workers:
+            self._tasks.append(asyncio.create_task(self._worker()))
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            if not self._heap:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            priority, _, video_id = heapq.heappop(self._heap)
+            if self._queued.get(video_id) != priority:
+                continue  # 優先度を上げて再投入済みの古いエントリ
+            del self._queued[video_id]
+
+            catalog = self._catalog
+            key = self._key(catalog, video_id)
+            if key is None:
+                continue
+            path = str(catalog.videos_path / key[0])
+            self._running.add(video_id)
+            try:
+                result = await loop.run_in_executor(self._pool, probe_media_file, path, self.timeout)
+            except Exception as e:
+                self.failed_count += 1
+                self._failed.add(key)
+                logger.warning(f"[MEDIA_PROBE] プローブ失敗: {video_id}: {e}")
+                continue
+            finally:
+                self._running.discard(video_id)
+
+            if result is None:
+                # ffprobe も cv2 も利用できない環境では以降の投入を止める
+                if self._unavailable:
+                    continue
+                self._unavailable = True
+                self._heap.clear()
+                self._queued.clear()
+                logger.warning("[MEDIA_PROBE] ffprobe / cv2 が見つからないため動画メタデータの取得を無効化します")
+                continue
+
+            self.probed_count += 1
+            self._results[key] = result
+            self._apply(video_id, key, result)
+
+    def _apply(self, video_id: str, key: Tuple[str, int, int], result: Dict[str, Any]):
+        """カタログの動画情報に反映（プローブ中にファイルが変わっていれば捨てる）"""
+        catalog = self._catalog
+        video = catalog.get(video_id) if catalog else None
+        if video is None or self._key(catalog, video_id) != key:
+            return
+        info = video.video_info
+        if result.get("duration_seconds") and result["duration_seconds"] > 0:
+            info.duration_seconds = round(result["duration_seconds"], 3)
+        info.width = result.get("width")
+        info.height = result.get("height")
+        info.fps = result.get("fps")
+        info.has_audio = result.get("has_audio")
+        info.metadata_probed = True
+        logger.debug(f"[MEDIA_PROBE] {video_id}: {result}")
+        self._schedule_persist()
+
+    def _schedule_persist(self):
+        """反映結果をまとめてカタログインデックスに保存"""
+        if self._persist_task is None or self._persist_task.done():
+            self._persist_task = asyncio.create_task(self._persist_later())
+
+    async def _persist_later(self):
+        await asyncio.sleep(1.0)
+        try:
+            await self._catalog.persist()
+        except OSError as e:
+            logger.warning(f"[MEDIA_PROBE] カタログ保存失敗: {e}")
+
+# 共有インスタンス
+media_probe_service = MediaProbeService()
@@ -0,0 +1,162 @@
+"""
+準備ステージキャッシュ - 再視聴時のウォームスタート
+
+(デバイスID, 動画ID) ごとに準備ワークフローの各ステージの結果を記録し、
+条件を満たすステージは次回の準備処理で実行を省略する。
+デバイス通信・アクチュエーターテストは動画に依存しないため、デバイスIDだけで記録する（他の動画でも再利用）。
+期限切れのステージは記録時に掃除し、エントリ数は preparation_cache_max_entries で上限を設ける（LRU）。
+
+- video_preload: TTL内であれば省略
+- sync_data: タイムラインのsha256と対応アクチュエータが同じで、
+  セッション内の全デバイス接続が配信済みタイムラインと同じダイジェストを保持していれば省略
+- device_comm: TTL内でセッションにデバイス接続があれば省略
+- actuator_tests: TTL内に最小要件を満たすテストに成功しており、対応アクチュエータが同じなら省略
+"""
+
+import logging
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Any, Tuple
+
+from app.config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+STAGE_VIDEO_PRELOAD = "video_preload"
+STAGE_SYNC_DATA = "sync_data"
+STAGE_DEVICE_COMM = "device_comm"
+STAGE_ACTUATOR_TESTS = "actuator_tests"
+
+# キャッシュ対象の全ステージ（すべて復元できれば準備処理は待機なしで完了する）
+CACHEABLE_STAGES = frozenset({STAGE_VIDEO_PRELOAD, STAGE_SYNC_DATA, STAGE_DEVICE_COMM, STAGE_ACTUATOR_TESTS})
+
+# 動画に依存しないステージ（デバイスIDだけで記録する）
+DEVICE_SCOPED_STAGES = frozenset({STAGE_DEVICE_COMM, STAGE_ACTUATOR_TESTS})
+
+def _stage_ttls() -> Dict[str, float]:
+    return {
+        STAGE_VIDEO_PRELOAD: settings.preparation_cache_video_ttl,
+        STAGE_SYNC_DATA: settings.preparation_cache_sync_ttl,
+        STAGE_DEVICE_COMM: settings.preparation_cache_device_comm_ttl,
+        STAGE_ACTUATOR_TESTS: settings.preparation_cache_actuator_ttl
+    }
+
+def held_timeline_digest(session_id: str, video_id: str) -> Optional[str]:
+    """セッション内の全デバイス接続が保持しているタイムラインのsha256（接続なし・不一致・未保持ならNone）"""
+    from app.api.playback_control import ws_manager, ROLE_DEVICE
+
+    digests = set()
+    for connection_id in ws_manager.get_connections(session_id, ROLE_DEVICE):
+        sender = ws_manager.senders.get(connection_id)
+        digests.add(sender.timeline_digests.get(video_id) if sender else None)
+    return digests.pop() if len(digests) == 1 else None
+
+CacheKey = Tuple[str, Optional[str]]
+
+def _cache_key(device_id: str, video_id: str, stage: str) -> CacheKey:
+    """ステージ結果の記録先（動画に依存しないステージは video_id を None にする）"""
+    return (device_id, None if stage in DEVICE_SCOPED_STAGES else video_id)
+
+class PreparationStageCache:
+    """(device_id, video_id) ごとのステージ結果（TTL付き・LRU）"""
+
+    def __init__(self, max_entries: Optional[int] = None):
+        # (device_id, video_id | None) → ステージ名 → {'recorded_at', 'fingerprint', 'result'}（末尾が最近使用）
+        self._entries: "OrderedDict[CacheKey, Dict[str, Dict[str, Any]]]" = OrderedDict()
+        self.max_entries = max(1, max_entries if max_entries is not None else settings.preparation_cache_max_entries)
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evicted = 0
+
+    def _sweep(self, now: float):
+        """期限切れのステージを破棄し、空になったエントリを削除"""
+        ttls = _stage_ttls()
+        for key in list(self._entries):
+            stages = self._entries[key]
+            for stage in [s for s, entry in stages.items() if now - entry['recorded_at'] > ttls[s]]:
+                del stages[stage]
+                self.expired += 1
+            if not stages:
+                del self._entries[key]
+
+    def record(
+        self, device_id: str, video_id: str, stage: str,
+        result: Any, fingerprint: Optional[Dict[str, Any]] = None
+    ):
+        """
+        ステージ結果を記録
+
+        Args:
+            result: 復元用のステージ結果（準備情報モデルのコピー等）
+            fingerprint: 次回一致を確認する値（タイムラインのsha256・対応アクチュエータ等）
+        """
+        now = time.monotonic()
+        self._sweep(now)
+        key = _cache_key(device_id, video_id, stage)
+        self._entries.setdefault(key, {})[stage] = {
+            'recorded_at': now,
+            'fingerprint': fingerprint or {},
+            'result': result
+        }
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evicted += 1
+
+    def lookup(
+        self, device_id: str, video_id: str, stage: str,
+        fingerprint: Optional[Dict[str, Any]] = None
+    ) -> Optional[Any]:
+        """
+        有効なステージ結果を取得（期限切れ・条件不一致ならNone）
+
+        Args:
+            fingerprint: 現在の値（記録時と一致しなければ無効）
+        """
+        key = _cache_key(device_id, video_id, stage)
+        stages = self._entries.get(key, {})
+        entry = stages.get(stage)
+        if entry is None:
+            self.misses += 1
+            return None
+        if time.monotonic() - entry['recorded_at'] > _stage_ttls()[stage]:
+            del stages[stage]
+            if not stages:
+                del self._entries[key]
+            self.expired += 1
+            self.misses += 1
+            return None
+        if fingerprint is not None and entry['fingerprint'] != fingerprint:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry['result']
+
+    def invalidate(self, device_id: Optional[str] = None, video_id: Optional[str] = None):
+        """指定デバイス・動画のキャッシュを破棄（両方Noneなら全件。動画指定ではデバイス単位の結果は残す）"""
+        for key in list(self._entries):
+            if (device_id is None or key[0] == device_id) and (video_id is None or key[1] == video_id):
+                del self._entries[key]
+
+    def get_stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        return {
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'expired': self.expired,
+            'evicted': self.evicted,
+            'ttls': _stage_ttls(),
+            'cached': {
+                f"{device_id}/{video_id or '*'}": {
+                    stage: round(now - entry['recorded_at'], 1) for stage, entry in stages.items()
+                }
+                for (device_id, video_id), stages in self._entries.items()
+            }
+        }
+
+# 共有インスタンス
+preparation_stage_cache = PreparationStageCache()
@@ -13,15 +13,21 @@ from pathlib import Path
 from typing import Dict, List, Optional, Set, Any
 from datetime import datetime, timedelta
 import aiohttp
-from aiofiles import open as aopen
 
 from app.config.settings import settings
 from app.models.preparation import (
     PreparationState, PreparationStatus, ActuatorTestResult, ActuatorTestStatus,
     VideoPreparationInfo, SyncDataPreparationInfo, DeviceCommunicationInfo,
-    PreparationProgress, ActuatorType, ACTUATOR_TEST_DEFAULTS,
+    PreparationProgress, ActuatorType, ACTUATOR_TEST_DEFAULTS, ACTUATOR_DEVICE_GROUPS,
     SyncDataTransmissionResult
 )
+from app.services.compiled_timeline import compiled_timeline_store
+from app.services.timeline_repository import timeline_repository
+from app.services.session_lifecycle import session_lifecycle
+from app.services.preparation_cache import (
+    preparation_stage_cache, held_timeline_digest, CACHEABLE_STAGES,
+    STAGE_VIDEO_PRELOAD, STAGE_SYNC_DATA, STAGE_DEVICE_COMM, STAGE_ACTUATOR_TESTS
+)
 # Mockデバイス情報（テスト用）
 MOCK_DEVICE_INFO = {
     "test_device_basic": {
@@ -88,12 +94,13 @@ class PreparationService:
             session_id: セッションID
             video_id: 動画ID
             device_id: デバイスID
-            force_restart: 強制再開始フラグ
+            force_restart: 強制再開始フラグ（前回結果のキャッシュも使わない）
             
         Returns:
             準備処理状態
         """
         logger.info(f"準備処理開始: session={session_id}, video={video_id}, device={device_id}")
+        session_lifecycle.touch(session_id)
         
         # デバッグモードチェック
         from app.config.settings import settings
@@ -131,7 +138,7 @@ class PreparationService:
             # 準備処理開始
             self.active_preparations[session_id] = prep_state
             self.preparation_tasks[session_id] = asyncio.create_task(
-                self._execute_preparation_workflow(prep_state)
+                self._execute_preparation_workflow(prep_state, warm_start=not force_restart)
             )
             
             logger.info(f"準備処理タスク開始: {session_id}")
@@ -176,6 +183,14 @@ class PreparationService:
             self.progress_callbacks[session_id] = []
         self.progress_callbacks[session_id].append(callback)
     
+    def remove_progress_callback(self, session_id: str, callback: callable):
+        """進捗コールバック削除（WebSocket切断時）"""
+        callbacks = self.progress_callbacks.get(session_id)
+        if callbacks and callback in callbacks:
+            callbacks.remove(callback)
+            if not callbacks:
+                del self.progress_callbacks[session_id]
+    
     async def _initialize_preparation_state(
         self, session_id: str, video_id: str, device_id: str, video: Any, device_info: Any
     ) -> PreparationState:
@@ -196,7 +211,7 @@ class PreparationService:
         sync_data_url = f"/assets/sync-data/{video_id}.json"
         
         # 同期データファイル情報取得
-        sync_file_path = settings.get_sync_data_path() / f"{video_id}.json"
+        sync_file_path = timeline_repository.path_for(video_id)
         sync_file_size = 0
         effects_count = 0
         required_actuators = []
@@ -206,17 +221,16 @@ class PreparationService:
             
             # 同期データ解析
             try:
-                async with aopen(sync_file_path, 'r', encoding='utf-8') as f:
-                    sync_data = json.loads(await f.read())
+                sync_data = await timeline_repository.get(video_id)
                 
-                effects_count = len(sync_data.get('events', []))
+                compiled = compiled_timeline_store.get_or_compile(video_id, sync_data)
+                effects_count = compiled.event_count
                 
                 # エフェクトタイプを抽出してアクチュエータタイプにマッピング
                 effect_types = set()
-                for event in sync_data.get('events', []):
-                    effect = event.get('effect', '').upper()
+                for effect in compiled.effect_counts():
                     if effect:
-                        effect_types.add(self._map_effect_to_actuator(effect))
+                        effect_types.add(self._map_effect_to_actuator(effect.upper()))
                 
                 required_actuators = [act for act in effect_types if act]
                 
@@ -283,8 +297,8 @@ class PreparationService:
         }
         return mapping.get(effect)
     
-    async def _execute_preparation_workflow(self, prep_state: PreparationState):
-        """準備処理ワークフロー実行"""
+    async def _execute_preparation_workflow(self, prep_state: PreparationState, warm_start: bool = True):
+        """準備処理ワークフロー実行（warm_start なら前回の結果が有効なステージを省略）"""
         session_id = prep_state.session_id
         logger.info(f"準備ワークフロー開始: {session_id}")
         
@@ -292,14 +306,24 @@ class PreparationService:
             prep_state.overall_status = PreparationStatus.IN_PROGRESS
             await self._notify_progress(session_id, "overall", 5, PreparationStatus.IN_PROGRESS, "準備処理を開始しました")
             
+            cached = await self._restore_cached_stages(prep_state) if warm_start else set()
+            
             # Phase 1: 並行準備開始
-            await self._execute_parallel_preparation(prep_state)
+            await self._execute_parallel_preparation(prep_state, cached)
             
             # Phase 2: デバイス通信テスト
-            await self._execute_device_communication_test(prep_state)
+            if STAGE_DEVICE_COMM in cached:
+                prep_state.overall_progress = 60
+                await self._notify_progress(session_id, "device_comm", 100, PreparationStatus.COMPLETED, "デバイス通信テスト完了（キャッシュ済み）")
+            else:
+                await self._execute_device_communication_test(prep_state)
             
             # Phase 3: アクチュエーターテスト
-            await self._execute_actuator_tests(prep_state)
+            if STAGE_ACTUATOR_TESTS in cached:
+                prep_state.overall_progress = 90
+                await self._notify_progress(session_id, "actuator_tests", 90, PreparationStatus.COMPLETED, "アクチュエーターテスト完了（キャッシュ済み）")
+            else:
+                await self._execute_actuator_tests(prep_state)
             
             # Phase 4: 最終検証
             await self._execute_final_validation(prep_state)
@@ -309,6 +333,7 @@ class PreparationService:
             prep_state.overall_progress = 100
             prep_state.completed_at = datetime.now()
             prep_state.ready_for_playback = True
+            await self._record_stage_cache(prep_state, cached)
             
             await self._notify_progress(
                 session_id, "overall", 100, PreparationStatus.COMPLETED, 
@@ -329,16 +354,21 @@ class PreparationService:
                 PreparationStatus.FAILED, f"準備処理エラー: {str(e)}"
             )
     
-    async def _execute_parallel_preparation(self, prep_state: PreparationState):
+    async def _execute_parallel_preparation(self, prep_state: PreparationState, cached: Set[str] = frozenset()):
         """並行準備処理実行"""
         session_id = prep_state.session_id
         logger.info(f"並行準備処理開始: {session_id}")
         
-        # 動画プリロードとシンクデータ処理を並行実行
-        tasks = [
-            self._simulate_video_preload(prep_state),
-            self._process_sync_data(prep_state)
-        ]
+        # 動画プリロードとシンクデータ処理を並行実行（キャッシュ済みは省略）
+        tasks = []
+        if STAGE_VIDEO_PRELOAD in cached:
+            await self._notify_progress(session_id, "video_preload", 100, PreparationStatus.COMPLETED, "動画プリロード完了（キャッシュ済み）")
+        else:
+            tasks.append(self._simulate_video_preload(prep_state))
+        if STAGE_SYNC_DATA in cached:
+            await self._notify_progress(session_id, "sync_data", 100, PreparationStatus.COMPLETED, "同期データ処理完了（デバイス保持済み）")
+        else:
+            tasks.append(self._process_sync_data(prep_state))
         
         await asyncio.gather(*tasks)
         
@@ -449,27 +479,54 @@ class PreparationService:
         await self._notify_progress(session_id, "device_comm", 100, PreparationStatus.COMPLETED, "デバイス通信テスト完了")
     
     async def _execute_actuator_tests(self, prep_state: PreparationState):
-        """アクチュエーターテスト実行"""
+        """
+        アクチュエーターテスト実行
+        
+        物理デバイス（ESP）ごとにグループ化し、同じESPのアクチュエータは順番に、
+        異なるESPは並行してテストする。進捗は完了したテスト数で集計して通知する。
+        """
         session_id = prep_state.session_id
         device_comm = prep_state.device_communication
         
-        logger.info(f"アクチュエーターテスト開始: {session_id}")
-        
         total_actuators = len(device_comm.supported_actuators)
         if total_actuators == 0:
             prep_state.overall_progress = 90
             return
         
-        for i, actuator_type in enumerate(device_comm.supported_actuators):
-            await self._test_single_actuator(prep_state, actuator_type)
-            
-            # 進捗更新
-            progress = 60 + (30 * (i + 1) // total_actuators)
-            prep_state.overall_progress = progress
-            await self._notify_progress(
-                session_id, "actuator_tests", progress, PreparationStatus.IN_PROGRESS,
-                f"アクチュエーターテスト進行中: {i+1}/{total_actuators}"
-            )
+        groups: Dict[str, List[ActuatorType]] = {}
+        for actuator_type in device_comm.supported_actuators:
+            device = ACTUATOR_DEVICE_GROUPS.get(actuator_type, actuator_type.value)
+            groups.setdefault(device, []).append(actuator_type)
+        
+        logger.info(f"アクチュエーターテスト開始: {session_id}, {total_actuators}件 / {len(groups)}デバイス並行")
+        
+        completed = 0
+        
+        async def test_device_group(device: str, actuators: List[ActuatorType]):
+            nonlocal completed
+            for actuator_type in actuators:
+                try:
+                    await self._test_single_actuator(prep_state, actuator_type)
+                except Exception as e:
+                    # 1台の失敗で他デバイスのテストを止めない
+                    logger.error(f"アクチュエーターテストエラー: {session_id}, {device}/{actuator_type.value}, {e}")
+                    test_result = device_comm.actuator_tests.get(actuator_type.value)
+                    if test_result:
+                        test_result.status = ActuatorTestStatus.FAILED
+                        test_result.error_message = str(e)
+                
+                # 進捗更新（全デバイス合計の完了数）
+                completed += 1
+                progress = 60 + (30 * completed // total_actuators)
+                prep_state.overall_progress = max(prep_state.overall_progress, progress)
+                await self._notify_progress(
+                    session_id, "actuator_tests", progress, PreparationStatus.IN_PROGRESS,
+                    f"アクチュエーターテスト進行中: {completed}/{total_actuators}"
+                )
+        
+        await asyncio.gather(*(
+            test_device_group(device, actuators) for device, actuators in groups.items()
+        ))
         
         # 準備完了判定
         self._evaluate_readiness(prep_state)
@@ -560,7 +617,9 @@ class PreparationService:
             prep_state.min_required_actuators_ready
         ]
         
-        await asyncio.sleep(0.5)
+        # 全ステージがキャッシュ済みなら待機しない
+        if not CACHEABLE_STAGES.issubset(prep_state.cached_stages):
+            await asyncio.sleep(0.5)
         
         if all(checks):
             await self._notify_progress(session_id, "validation", 100, PreparationStatus.COMPLETED, "最終検証完了")
@@ -568,21 +627,114 @@ class PreparationService:
             await self._notify_progress(session_id, "validation", 100, PreparationStatus.FAILED, "最終検証失敗")
             raise Exception("最終検証に失敗しました")
     
-    async def _load_sync_data(self, video_id: str) -> Dict[str, Any]:
-        """同期データファイル読み込み"""
-        sync_file_path = settings.get_sync_data_path() / f"{video_id}.json"
+    async def _restore_cached_stages(self, prep_state: PreparationState) -> Set[str]:
+        """
+        前回の準備結果から有効なステージを復元
         
-        if not sync_file_path.exists():
-            raise FileNotFoundError(f"同期データファイルが見つかりません: {sync_file_path}")
+        Returns:
+            省略するステージ名
+        """
+        session_id = prep_state.session_id
+        video_id = prep_state.video_preparation.video_id
+        device_comm = prep_state.device_communication
+        device_id = device_comm.device_id
+        capabilities = sorted(act.value for act in device_comm.supported_actuators)
         
         try:
-            async with aopen(sync_file_path, 'r', encoding='utf-8') as f:
-                content = await f.read()
-                return json.loads(content)
-        except json.JSONDecodeError as e:
-            raise ValueError(f"同期データファイルの解析に失敗しました: {e}")
+            content = await timeline_repository.get_content(video_id)
+        except ValueError:
+            content = None
+        timeline_sha256 = content['sha256'] if content else None
+        
+        cached = set()
+        
+        video_prep = preparation_stage_cache.lookup(device_id, video_id, STAGE_VIDEO_PRELOAD)
+        if video_prep is not None:
+            prep_state.video_preparation = video_prep.copy(deep=True)
+            cached.add(STAGE_VIDEO_PRELOAD)
+        
+        # タイムライン・対応アクチュエータが同じで、デバイスが送信済みの内容を保持していること
+        sync_result = preparation_stage_cache.lookup(
+            device_id, video_id, STAGE_SYNC_DATA,
+            {'timeline_sha256': timeline_sha256, 'capabilities': capabilities}
+        )
+        if sync_result is not None and held_timeline_digest(session_id, video_id) == sync_result['content_sha256']:
+            prep_state.sync_data_preparation = sync_result['preparation'].copy(deep=True)
+            cached.add(STAGE_SYNC_DATA)
+        
+        comm_result = preparation_stage_cache.lookup(device_id, video_id, STAGE_DEVICE_COMM)
+        if comm_result is not None and await self._get_device_connections(session_id):
+            device_comm.websocket_connected = comm_result['websocket_connected']
+            device_comm.last_ping_ms = comm_result['last_ping_ms']
+            device_comm.connection_status = PreparationStatus.COMPLETED
+            cached.add(STAGE_DEVICE_COMM)
+        
+        actuator_tests = preparation_stage_cache.lookup(
+            device_id, video_id, STAGE_ACTUATOR_TESTS, {'capabilities': capabilities}
+        )
+        if actuator_tests is not None:
+            device_comm.actuator_tests = {key: test.copy(deep=True) for key, test in actuator_tests.items()}
+            self._evaluate_readiness(prep_state)
+            cached.add(STAGE_ACTUATOR_TESTS)
+        
+        prep_state.cached_stages = sorted(cached)
+        if cached:
+            logger.info(f"準備キャッシュ使用: {session_id}, device={device_id}, video={video_id}, stages={prep_state.cached_stages}")
+        return cached
+    
+    async def _record_stage_cache(self, prep_state: PreparationState, cached: Set[str]):
+        """今回実行したステージの結果を次回用に記録（キャッシュから復元したステージは期限を延長しない）"""
+        video_id = prep_state.video_preparation.video_id
+        device_comm = prep_state.device_communication
+        device_id = device_comm.device_id
+        capabilities = sorted(act.value for act in device_comm.supported_actuators)
+        
+        if STAGE_VIDEO_PRELOAD not in cached:
+            preparation_stage_cache.record(
+                device_id, video_id, STAGE_VIDEO_PRELOAD, prep_state.video_preparation.copy(deep=True)
+            )
+        
+        if STAGE_SYNC_DATA not in cached:
+            try:
+                entry = await timeline_repository.get_content(video_id)
+            except ValueError:
+                entry = None
+            content_sha256 = held_timeline_digest(prep_state.session_id, video_id)
+            if entry is not None and content_sha256:
+                preparation_stage_cache.record(
+                    device_id, video_id, STAGE_SYNC_DATA,
+                    {
+                        'content_sha256': content_sha256,
+                        'preparation': prep_state.sync_data_preparation.copy(deep=True)
+                    },
+                    {'timeline_sha256': entry['sha256'], 'capabilities': capabilities}
+                )
+        
+        if STAGE_DEVICE_COMM not in cached:
+            preparation_stage_cache.record(device_id, video_id, STAGE_DEVICE_COMM, {
+                'websocket_connected': device_comm.websocket_connected,
+                'last_ping_ms': device_comm.last_ping_ms
+            })
+        
+        if STAGE_ACTUATOR_TESTS not in cached and prep_state.min_required_actuators_ready:
+            preparation_stage_cache.record(
+                device_id, video_id, STAGE_ACTUATOR_TESTS,
+                {key: test.copy(deep=True) for key, test in device_comm.actuator_tests.items()},
+                {'capabilities': capabilities}
+            )
+    
+    async def _load_sync_data(self, video_id: str) -> Dict[str, Any]:
+        """同期データファイル読み込み（共通リポジトリ経由・変更しないこと）"""
+        try:
+            sync_data = await timeline_repository.get(video_id)
+        except ValueError:
+            raise
         except Exception as e:
             raise Exception(f"同期データファイル読み込みエラー: {e}")
+        
+        if sync_data is None:
+            raise FileNotFoundError(f"同期データファイルが見つかりません: {timeline_repository.path_for(video_id)}")
+        return sync_data
     
     async def _validate_and_process_sync_data(self, sync_data: Dict[str, Any], prep_state: PreparationState) -> Dict[str, Any]:
         """同期データ検証・処理"""
@@ -755,7 +907,7 @@ class PreparationService:
         """本番環境WebSocket送信実装（マイコン統合用）"""
         try:
             # マイコンが準備処理APIから同期データを事前送信する新しいフロー
-            from app.api.playback_control import ws_manager
+            from app.api.playback_control import deliver_timeline
             
             # セッション内のデバイス接続を確認
             device_connections = await self._get_device_connections(session_id)
@@ -764,28 +916,24 @@ class PreparationService:
                 logger.warning(f"セッション {session_id} にアクティブなデバイス接続がありません")
                 return False
             
-            # アクティブなマイコンに同期データ送信
-            success_count = 0
-            for connection_id in device_connections:
-                if connection_id.startswith("device_"):
-                    websocket = ws_manager.active_connections.get(connection_id)
-                    if websocket:
-                        try:
-                            # sync_data_bulk_transmission メッセージとして送信
-                            bulk_message = {
-                                "type": "sync_data_bulk_transmission",
-                                "session_id": session_id,
-                                "video_id": payload.get("sync_data", {}).get("video_id", "demo1"),
-                                "transmission_metadata": payload.get("metadata", {}),
-                                "sync_data": payload.get("sync_data", {})
-                            }
-                            
-                            await websocket.send_text(json.dumps(bulk_message))
-                            success_count += 1
-                            logger.info(f"マイコンへ同期データ送信成功: {connection_id}")
-                            
-                        except Exception as e:
-                            logger.error(f"マイコン送信エラー ({connection_id}): {e}")
+            # 処理時刻は内容ハッシュを不安定にするため本体から外してメタデータへ
+            sync_data = dict(payload.get("sync_data", {}))
+            metadata = dict(payload.get("metadata", {}))
+            processing_timestamp = sync_data.pop("processing_timestamp", None)
+            if processing_timestamp:
+                metadata["processing_timestamp"] = processing_timestamp
+            
+            # キャッシュ済みのデバイスには通知のみ、未保持のデバイスにだけ本体を送信
+            bulk_message = {
+                "type": "sync_data_bulk_transmission",
+                "session_id": session_id,
+                "video_id": sync_data.get("video_id", "demo1"),
+                "transmission_metadata": metadata,
+                "sync_data": sync_data
+            }
+            
+            success_count = await deliver_timeline(session_id, bulk_message, tag="PREPARATION")
+            logger.info(f"マイコンへ同期データ配信: {success_count}/{len(device_connections)}台")
             
             return success_count > 0
             
@@ -796,14 +944,9 @@ class PreparationService:
     async def _get_device_connections(self, session_id: str) -> List[str]:
         """セッション内のマイコン接続一覧取得"""
         try:
-            from app.api.playback_control import ws_manager
-            
-            device_connections = []
-            if session_id in ws_manager.session_connections:
-                for connection_id in ws_manager.session_connections[session_id]:
-                    if connection_id.startswith("device_"):
-                        if connection_id in ws_manager.active_connections:
-                            device_connections.append(connection_id)
+            from app.api.playback_control import ws_manager, ROLE_DEVICE
+            
+            device_connections = list(ws_manager.get_connections(session_id, ROLE_DEVICE))
             
             return device_connections
         except Exception as e:
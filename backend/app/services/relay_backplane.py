@@ -0,0 +1,318 @@
+"""
+リレーバックプレーン - インスタンス間のセッション中継
+
+フロントエンドとデバイスが別のCloud Runインスタンス（またはワーカー）に接続した場合でも
+中継が届くよう、セッション単位のメッセージを pub/sub で同セッションの接続を持つインスタンスに配る。
+各インスタンスはセッションの最初のローカル接続で join()、最後の切断で leave() し、
+接続の無いセッションの中継は受信しない。
+
+- RedisBackplane: settings.redis_url が設定されている場合（本番・複数インスタンス）
+- InMemoryBackplane: 同一プロセス内で複数インスタンスを模擬する試験用
+
+redis_url が未設定の場合はバックプレーンを作らない（単一インスタンスでは中継先が無く、
+発行のためのエンベロープ化は無駄なシリアライズになるため）。
+
+各インスタンスは自分が発行したメッセージを受信時に無視する（ローカル配信は発行側で済んでいるため）。
+
+タイムライン本体など大きなデータは body として「エンベロープJSON + 改行 + 本体」の形で発行し、
+エンベロープ内の文字列としてエスケープ（再シリアライズ）しない。
+json.dumps の出力は改行を含まないため、最初の改行が区切りになる。
+"""
+
+import asyncio
+import json
+import logging
+import uuid
+from typing import Dict, Optional, Callable, Awaitable, Any, List, Union, Set
+
+from app.config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+CHANNEL_PREFIX = "4dx:session:"
+
+# Redis受信の再接続待ち（秒・失敗ごとに倍増）
+RECONNECT_MIN_DELAY = 0.5
+RECONNECT_MAX_DELAY = 30.0
+
+EnvelopeHandler = Callable[[Dict[str, Any]], Awaitable[None]]
+
+# 発行・受信する1メッセージ（Redis は decode_responses のため受信時は str）
+RawEnvelope = Union[str, bytes]
+
+class RelayBackplane:
+    """
+    バックプレーン共通処理
+
+    publish() はノンブロッキングで内部キューに積み、常駐タスクが順に発行する。
+    受信したエンベロープは start() で渡されたハンドラーに渡す。
+    購読はセッション単位（join / leave）。
+    """
+    def __init__(self, max_pending: int = 1024):
+        self.instance_id = uuid.uuid4().hex
+        self._handler: Optional[EnvelopeHandler] = None
+        self._outbox: asyncio.Queue = asyncio.Queue(maxsize=max_pending)
+        self._tasks: List[asyncio.Task] = []
+        # 購読中のチャネル（接続断の間も保持し、再接続時に購読し直す）
+        self._channels: Set[str] = set()
+        # 統計
+        self.published_count = 0
+        self.received_count = 0
+        self.dropped_count = 0
+        # 受信側の状態（Redis のみ変化する）
+        self.listener_healthy = True
+        self.listener_errors = 0
+        self.listener_last_error: Optional[str] = None
+        self.reconnect_count = 0
+
+    async def start(self, handler: EnvelopeHandler):
+        """受信開始（購読はセッションごとに join() で追加）"""
+        self._handler = handler
+        await self._connect()
+        self._tasks.append(asyncio.create_task(self._publisher_loop()))
+        logger.info(f"[BACKPLANE] 開始: {type(self).__name__} (instance: {self.instance_id[:8]})")
+
+    async def stop(self):
+        """購読停止"""
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks.clear()
+        await self._disconnect()
+        self._channels.clear()
+        logger.info(f"[BACKPLANE] 停止: {type(self).__name__}")
+
+    async def join(self, session_id: str):
+        """セッションのチャネルを購読（購読済みなら何もしない）"""
+        channel = CHANNEL_PREFIX + session_id
+        if channel in self._channels:
+            return
+        self._channels.add(channel)
+        try:
+            await self._subscribe_channel(channel)
+        except Exception as e:
+            # 受信ループが接続断を検出して再接続し、記録済みのチャネルを購読し直す
+            logger.warning(f"[BACKPLANE] 購読失敗（再接続時に購読）: {channel}: {e}")
+
+    async def leave(self, session_id: str):
+        """セッションのチャネルの購読を解除"""
+        channel = CHANNEL_PREFIX + session_id
+        if channel not in self._channels:
+            return
+        self._channels.discard(channel)
+        try:
+            await self._unsubscribe_channel(channel)
+        except Exception as e:
+            logger.warning(f"[BACKPLANE] 購読解除失敗: {channel}: {e}")
+
+    def publish(self, session_id: str, kind: str, data: Dict[str, Any], body: Optional[RawEnvelope] = None) -> bool:
+        """
+        セッションチャネルへ発行（ノンブロッキング）
+
+        Args:
+            session_id: セッションID
+            kind: エンベロープ種別（受信側の処理を選択）
+            data: 種別ごとのデータ
+            body: エンコード済みの本体（受信側では envelope["body"]。エスケープせずそのまま送る）
+        """
+        envelope = {
+            "origin": self.instance_id,
+            "session_id": session_id,
+            "kind": kind,
+            "data": data
+        }
+        raw: RawEnvelope = json.dumps(envelope, ensure_ascii=False)
+        if body is not None:
+            raw = raw.encode("utf-8") + b"\n" + body if isinstance(body, bytes) else raw + "\n" + body
+        try:
+            self._outbox.put_nowait((session_id, raw))
+            return True
+        except asyncio.QueueFull:
+            self.dropped_count += 1
+            logger.warning(f"[BACKPLANE] 発行キュー満杯のため破棄: session={session_id} kind={kind}")
+            return False
+
+    async def _publisher_loop(self):
+        while True:
+            session_id, raw = await self._outbox.get()
+            try:
+                await self._publish(CHANNEL_PREFIX + session_id, raw)
+                self.published_count += 1
+            except Exception as e:
+                logger.error(f"[BACKPLANE] 発行エラー: {e}")
+
+    async def _dispatch(self, raw: RawEnvelope):
+        """受信エンベロープをハンドラーへ（自インスタンス発行分は無視）"""
+        try:
+            head, separator, body = raw.partition(b"\n" if isinstance(raw, bytes) else "\n")
+            envelope = json.loads(head)
+            if separator:
+                envelope["body"] = body
+        except (TypeError, ValueError) as e:
+            logger.warning(f"[BACKPLANE] 不正なエンベロープ: {e}")
+            return
+        if envelope.get("origin") == self.instance_id or not self._handler:
+            return
+        self.received_count += 1
+        try:
+            await self._handler(envelope)
+        except Exception as e:
+            logger.error(f"[BACKPLANE] 受信処理エラー: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "backend": type(self).__name__,
+            "instance_id": self.instance_id,
+            "pending": self._outbox.qsize(),
+            "published": self.published_count,
+            "received": self.received_count,
+            "dropped": self.dropped_count,
+            "subscribed_sessions": len(self._channels),
+            "listener": {
+                "healthy": self.listener_healthy,
+                "errors": self.listener_errors,
+                "last_error": self.listener_last_error,
+                "reconnects": self.reconnect_count
+            }
+        }
+
+    async def _connect(self):
+        raise NotImplementedError
+
+    async def _disconnect(self):
+        raise NotImplementedError
+
+    async def _subscribe_channel(self, channel: str):
+        raise NotImplementedError
+
+    async def _unsubscribe_channel(self, channel: str):
+        raise NotImplementedError
+
+    async def _publish(self, channel: str, raw: RawEnvelope):
+        raise NotImplementedError
+
+class InMemoryBackplane(RelayBackplane):
+    """
+    プロセス内バックプレーン（試験用）
+
+    同一プロセス内の全インスタンスで購読者一覧を共有し、チャネルを購読しているものにだけ届ける。
+    複数の SimpleWebSocketManager を立ててインスタンス間中継を試験する用途に使う。
+    create_backplane() からは生成しない。
+    """
+    _subscribers: List["InMemoryBackplane"] = []
+
+    async def _connect(self):
+        InMemoryBackplane._subscribers.append(self)
+
+    async def _disconnect(self):
+        if self in InMemoryBackplane._subscribers:
+            InMemoryBackplane._subscribers.remove(self)
+
+    async def _subscribe_channel(self, channel: str):
+        pass
+
+    async def _unsubscribe_channel(self, channel: str):
+        pass
+
+    async def _publish(self, channel: str, raw: RawEnvelope):
+        for subscriber in list(InMemoryBackplane._subscribers):
+            if subscriber is not self and channel in subscriber._channels:
+                await subscriber._dispatch(raw)
+
+class RedisBackplane(RelayBackplane):
+    """
+    Redis pub/sub バックプレーン（settings.redis_url）
+
+    受信ループは接続エラーを検出すると待機（指数バックオフ）してから pub/sub を作り直し、
+    記録済みのチャネルを購読し直す。状態は get_stats() の listener に出す。
+    """
+
+    def __init__(self, redis_url: str, max_pending: int = 1024):
+        super().__init__(max_pending)
+        self.redis_url = redis_url
+        self._redis = None
+        self._pubsub = None
+        # 購読が0件から増えたことを受信ループに知らせる
+        self._wakeup = asyncio.Event()
+
+    async def _connect(self):
+        try:
+            import redis.asyncio as aioredis
+        except ImportError as e:
+            raise RuntimeError("RedisBackplane には redis パッケージ（redis>=5）が必要です") from e
+
+        # 無通信のまま切れた接続も検出できるようヘルスチェックを有効にする
+        self._redis = aioredis.from_url(self.redis_url, decode_responses=True, health_check_interval=30)
+        self._pubsub = self._redis.pubsub()
+        self._tasks.append(asyncio.create_task(self._listen_loop()))
+
+    async def _subscribe_channel(self, channel: str):
+        # 再接続待ちの間は記録だけ（再接続時にまとめて購読）
+        if self._pubsub is not None:
+            await self._pubsub.subscribe(channel)
+        self._wakeup.set()
+
+    async def _unsubscribe_channel(self, channel: str):
+        if self._pubsub is not None:
+            await self._pubsub.unsubscribe(channel)
+
+    async def _listen_loop(self):
+        from redis.exceptions import RedisError
+
+        delay = RECONNECT_MIN_DELAY
+        while True:
+            try:
+                if self._pubsub is None:
+                    self._pubsub = self._redis.pubsub()
+                    if self._channels:
+                        await self._pubsub.subscribe(*self._channels)
+                    self.reconnect_count += 1
+                    logger.info(f"[BACKPLANE] 再接続: {len(self._channels)}チャネルを再購読")
+
+                # 購読が無い間は受信できないため、join() を待つ
+                self._wakeup.clear()
+                if not self._pubsub.subscribed:
+                    await self._wakeup.wait()
+                    continue
+
+                message = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                self.listener_healthy = True
+                delay = RECONNECT_MIN_DELAY
+                if message and message.get("type") == "message":
+                    await self._dispatch(message.get("data"))
+            except (RedisError, OSError) as e:
+                self.listener_healthy = False
+                self.listener_errors += 1
+                self.listener_last_error = str(e)
+                logger.error(f"[BACKPLANE] 受信エラー（{delay:.1f}秒後に再接続）: {e}")
+                await self._close_pubsub()
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, RECONNECT_MAX_DELAY)
+
+    async def _close_pubsub(self):
+        pubsub, self._pubsub = self._pubsub, None
+        if pubsub is None:
+            return
+        try:
+            await pubsub.close()
+        except Exception as e:
+            logger.debug(f"[BACKPLANE] pub/sub クローズ時のエラー: {e}")
+
+    async def _disconnect(self):
+        await self._close_pubsub()
+        if self._redis is not None:
+            await self._redis.close()
+        self._redis = None
+
+    async def _publish(self, channel: str, raw: RawEnvelope):
+        await self._redis.publish(channel, raw)
+
+def create_backplane() -> Optional[RelayBackplane]:
+    """設定に応じたバックプレーンを生成（redis_url 未設定ならNone = 単一インスタンス動作）"""
+    if settings.redis_url:
+        return RedisBackplane(settings.redis_url)
+    return None
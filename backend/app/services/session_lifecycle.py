@@ -0,0 +1,209 @@
+"""
+セッションライフサイクル管理 - 放置セッションの回収
+
+各サービスがセッションIDごとに持つ状態（タイムライン状態・配信候補・分割転送・
+準備処理・連続同期）の最終アクティビティを記録し、
+WebSocket接続が無いまま settings.session_idle_ttl 秒経過したセッションを全サービスから削除する。
+"""
+
+import asyncio
+import logging
+import sys
+import time
+from typing import Dict, Optional, Any, List, Set
+
+from app.config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# メモリ概算で辿る最大深さ（巨大な入れ子での走査コストを抑える）
+_SIZEOF_MAX_DEPTH = 8
+
+def _deep_sizeof(obj: Any, seen: Set[int], depth: int = 0) -> int:
+    """オブジェクトの概算メモリ使用量（共有済み・走査済みのオブジェクトは数えない）"""
+    if id(obj) in seen or depth > _SIZEOF_MAX_DEPTH:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj, 0)
+    if isinstance(obj, dict):
+        size += sum(_deep_sizeof(k, seen, depth + 1) + _deep_sizeof(v, seen, depth + 1) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(_deep_sizeof(item, seen, depth + 1) for item in obj)
+    elif hasattr(obj, "__dict__") and not isinstance(obj, type):
+        size += _deep_sizeof(vars(obj), seen, depth + 1)
+    return size
+
+class SessionLifecycleManager:
+    """セッションごとの最終アクティビティ管理とアイドル回収"""
+
+    def __init__(self):
+        self.idle_ttl = settings.session_idle_ttl
+        self.sweep_interval = settings.session_gc_interval
+        # セッションID → 最終アクティビティ（monotonic秒）
+        self.last_activity: Dict[str, float] = {}
+        self.evicted_count = 0
+        # 状態を持たずアクティビティ記録だけが残っていたため記録を削除したセッション数
+        self.pruned_count = 0
+        self.last_sweep: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def touch(self, session_id: Optional[str]):
+        """セッションのアクティビティを記録"""
+        if session_id:
+            self.last_activity[session_id] = time.monotonic()
+
+    def start(self):
+        """定期回収タスクを開始"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._sweep_loop())
+            logger.info(f"[SESSION_GC] 開始: idle_ttl={self.idle_ttl}s, interval={self.sweep_interval}s")
+
+    async def stop(self):
+        """定期回収タスクを停止"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _sweep_loop(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                await self.sweep()
+            except Exception as e:
+                logger.error(f"[SESSION_GC] 回収エラー: {e}")
+
+    def known_sessions(self) -> Set[str]:
+        """アクティビティ記録があるか、いずれかのサービスが状態を持っているセッションID"""
+        return set(self.last_activity) | self.sessions_with_state()
+
+    def sessions_with_state(self) -> Set[str]:
+        """いずれかのサービスが状態を持っているセッションID"""
+        from app.services.sync_data_service import sync_data_service
+        from app.services.continuous_sync_service import continuous_sync_service
+        from app.services.preparation_service import preparation_service
+        from app.services.timeline_transfer_service import timeline_transfer_service
+
+        sessions = set(sync_data_service.timeline_states)
+        sessions.update(sync_data_service.timeline_contents)
+        sessions.update(continuous_sync_service.active_syncs)
+        sessions.update(preparation_service.active_preparations)
+        sessions.update(preparation_service.progress_callbacks)
+        sessions.update(t['session_id'] for t in timeline_transfer_service.transfers.values())
+        return sessions
+
+    async def sweep(self) -> List[str]:
+        """
+        アイドルセッションを回収
+
+        接続中のセッションはアクティブとみなす。
+        記録の無いセッション（本機能導入前から残る状態）は初回検出時点を起点にする。
+        どのサービスも状態を持たないセッションはアクティビティ記録だけを削除し、回収数には数えない。
+
+        Returns:
+            回収した（状態を解放した）セッションID
+        """
+        from app.api.playback_control import ws_manager
+
+        now = time.monotonic()
+        self.last_sweep = now
+        stateful = self.sessions_with_state()
+        evicted = []
+        pruned = 0
+        for session_id in stateful | set(self.last_activity):
+            if ws_manager.has_session(session_id):
+                self.last_activity[session_id] = now
+                continue
+            last = self.last_activity.setdefault(session_id, now)
+            if now - last < self.idle_ttl:
+                continue
+            if session_id in stateful:
+                await self.evict(session_id)
+                evicted.append(session_id)
+            else:
+                del self.last_activity[session_id]
+                pruned += 1
+
+        self.pruned_count += pruned
+        if evicted:
+            logger.info(f"[SESSION_GC] アイドルセッション回収: {len(evicted)}件 (累計 {self.evicted_count}件)")
+        if pruned:
+            logger.debug(f"[SESSION_GC] 状態の無いセッションのアクティビティ記録を削除: {pruned}件")
+        return evicted
+
+    async def evict(self, session_id: str):
+        """セッションの状態を全サービスから削除"""
+        from app.services.sync_data_service import sync_data_service
+        from app.services.continuous_sync_service import continuous_sync_service
+        from app.services.preparation_service import preparation_service
+        from app.services.timeline_transfer_service import timeline_transfer_service
+
+        if session_id in continuous_sync_service.active_syncs:
+            await continuous_sync_service.stop_sync(session_id)
+        await preparation_service.stop_preparation(session_id)
+        sync_data_service.cleanup_session(session_id)
+        timeline_transfer_service.cleanup_session(session_id)
+        self.last_activity.pop(session_id, None)
+        self.evicted_count += 1
+
+    def session_memory(self, session_id: str, shared: Set[int]) -> Dict[str, int]:
+        """
+        セッション単位の概算メモリ（バイト）
+
+        Args:
+            shared: 数えないオブジェクトのid（動画単位で共有されるタイムライン本体など）
+        """
+        from app.services.sync_data_service import sync_data_service
+        from app.services.continuous_sync_service import continuous_sync_service
+        from app.services.preparation_service import preparation_service
+        from app.services.timeline_transfer_service import timeline_transfer_service
+
+        parts = {
+            'timeline_state': sync_data_service.timeline_states.get(session_id),
+            'timeline_contents': sync_data_service.timeline_contents.get(session_id),
+            'continuous_sync': continuous_sync_service.active_syncs.get(session_id),
+            'preparation': preparation_service.active_preparations.get(session_id),
+            'transfers': [t for t in timeline_transfer_service.transfers.values() if t['session_id'] == session_id]
+        }
+        memory = {name: _deep_sizeof(value, set(shared)) if value else 0 for name, value in parts.items()}
+        memory['total'] = sum(memory.values())
+        return memory
+
+    def get_stats(self) -> Dict[str, Any]:
+        """セッション数・回収数・セッションごとのメモリ概算"""
+        from app.api.playback_control import ws_manager
+        from app.services.compiled_timeline import compiled_timeline_store
+        from app.services.timeline_repository import timeline_repository
+
+        # 動画単位で共有されるオブジェクトはセッションのメモリに含めない
+        shared = {id(compiled) for compiled in compiled_timeline_store._timelines.values()}
+        for entry in timeline_repository._entries.values():
+            shared.update((id(entry['data']), id(entry['canonical_json'])))
+
+        now = time.monotonic()
+        sessions = {}
+        for session_id in sorted(self.known_sessions()):
+            last = self.last_activity.get(session_id)
+            sessions[session_id] = {
+                'connected': ws_manager.has_session(session_id),
+                'idle_seconds': round(now - last, 1) if last is not None else None,
+                'memory_bytes': self.session_memory(session_id, shared)
+            }
+
+        return {
+            'idle_ttl': self.idle_ttl,
+            'sweep_interval': self.sweep_interval,
+            'running': self._task is not None and not self._task.done(),
+            'tracked_sessions': len(sessions),
+            'evicted_total': self.evicted_count,
+            'pruned_activity_total': self.pruned_count,
+            'last_sweep_seconds_ago': round(now - self.last_sweep, 1) if self.last_sweep is not None else None,
+            'total_memory_bytes': sum(s['memory_bytes']['total'] for s in sessions.values()),
+            'sessions': sessions
+        }
+
+# 共有インスタンス
+session_lifecycle = SessionLifecycleManager()
@@ -6,15 +6,15 @@ demo1.jsonなどのタイムラインファイルの読み込み・送信・時
 """
 
 import asyncio
-import json
+import hashlib
 import logging
-from pathlib import Path
 from typing import Dict, Optional, Any, List
 from datetime import datetime
-import aiofiles
 
-from app.config.settings import settings
 from app.models.preparation import PreparationStatus
+from app.services.compiled_timeline import CompiledTimeline, compiled_timeline_store
+from app.services.timeline_repository import timeline_repository, canonical_timeline_json
+from app.services.session_lifecycle import session_lifecycle
 
 logger = logging.getLogger(__name__)
 
@@ -22,9 +22,9 @@ class SyncDataService:
     """同期データサービス - ラズパイパターン対応"""
     
     def __init__(self):
-        self.sync_data_cache: Dict[str, Dict[str, Any]] = {}
         self.timeline_states: Dict[str, Dict[str, Any]] = {}
-        self.sync_data_path = settings.get_sync_data_path()
+        # セッション → sha256 → 配信可能なタイムライン本体（"need" 応答時に送信）
+        self.timeline_contents: Dict[str, Dict[str, Dict[str, Any]]] = {}
     
     async def send_timeline_data_bulk(self, session_id: str, video_id: str) -> Dict[str, Any]:
         """
@@ -33,21 +33,27 @@ class SyncDataService:
         ラズパイデバッグコードの最初のタイムライン全体送信に対応
         """
         logger.info(f"[SYNC_DATA] タイムライン事前送信開始: {video_id} (session: {session_id})")
+        session_lifecycle.touch(session_id)
         
         try:
-            # タイムラインファイル読み込み
-            timeline_data = await self._load_timeline_file(video_id)
-            if not timeline_data:
+            # タイムラインファイル読み込み（正規化JSONとsha256は読み込み時に計算済み）
+            digest = await self._load_timeline_file(video_id)
+            if not digest:
                 raise FileNotFoundError(f"タイムラインファイルが見つかりません: {video_id}")
+            timeline_data = digest['data']
             
-            # 総再生時間を計算
-            total_duration = self._calculate_total_duration(timeline_data)
-            events_count = len(timeline_data.get('events', []))
+            # 総再生時間を計算（コンパイル済みタイムラインは同じ動画の全セッションで共有）
+            compiled = compiled_timeline_store.get_or_compile(video_id, timeline_data)
+            total_duration = self._calculate_total_duration(compiled)
+            events_count = compiled.event_count
             
             # タイムライン状態を管理に追加
             self.timeline_states[session_id] = {
                 'video_id': video_id,
-                'timeline_data': timeline_data,
+                'compiled': compiled,
+                # 前回イベントを返した時刻（None は先頭から）
+                'event_cursor': None,
+                'event_cursor_inclusive': True,
                 'total_duration': total_duration,
                 'events_count': events_count,
                 'current_time': 0.0,
@@ -56,16 +62,19 @@ class SyncDataService:
                 'loop_count': 0
             }
             
-            # メタデータ作成
+            # メタデータ作成（チェックサムは正規化JSONのsha256）
+            content = self.register_timeline_content(session_id, video_id, timeline_data, digest=digest)
             transmission_metadata = {
                 'video_id': video_id,
                 'total_duration': total_duration,
                 'events_count': events_count,
-                'file_size_kb': self._estimate_file_size(timeline_data),
+                'file_size_kb': round(content['size'] / 1024, 2),
                 'transmission_timestamp': datetime.now().isoformat(),
-                'checksum': self._calculate_checksum(timeline_data),
+                'checksum': content['sha256'],
+                'sha256': content['sha256'],
                 'format': 'demo_json'
             }
+            content['transmission_metadata'] = transmission_metadata
             
             # 送信データ構築
             bulk_data = {
@@ -84,57 +93,57 @@ class SyncDataService:
             raise
     
     async def _load_timeline_file(self, video_id: str) -> Optional[Dict[str, Any]]:
-        """タイムラインJSONファイル読み込み"""
-        if video_id in self.sync_data_cache:
-            logger.debug(f"[SYNC_DATA] キャッシュから取得: {video_id}")
-            return self.sync_data_cache[video_id]
-        
-        timeline_file = self.sync_data_path / f"{video_id}.json"
-        
-        if not timeline_file.exists():
-            logger.warning(f"[SYNC_DATA] ファイルが見つかりません: {timeline_file}")
-            return None
-        
+        """タイムラインJSONファイル読み込み（共通リポジトリ経由。data / canonical_json / sha256 / size）"""
         try:
-            async with aiofiles.open(timeline_file, 'r', encoding='utf-8') as f:
-                content = await f.read()
-                timeline_data = json.loads(content)
-                
-            # キャッシュに保存
-            self.sync_data_cache[video_id] = timeline_data
-            logger.info(f"[SYNC_DATA] タイムラインファイル読み込み完了: {timeline_file}")
-            return timeline_data
-            
+            return await timeline_repository.get_content(video_id)
         except Exception as e:
-            logger.error(f"[SYNC_DATA] ファイル読み込みエラー {timeline_file}: {e}")
+            logger.error(f"[SYNC_DATA] ファイル読み込みエラー {video_id}: {e}")
             return None
     
-    def _calculate_total_duration(self, timeline_data: Dict[str, Any]) -> float:
-        """タイムラインの総再生時間を計算"""
-        events = timeline_data.get('events', [])
-        if not events:
-            return 0.0
-        
-        # 最後のイベント時刻を取得
-        max_time = max(event.get('t', 0) for event in events)
-        return float(max_time)
+    def _calculate_total_duration(self, compiled: CompiledTimeline) -> float:
+        """タイムラインの総再生時間を計算（最後のイベント時刻）"""
+        return float(compiled.duration)
     
-    def _estimate_file_size(self, timeline_data: Dict[str, Any]) -> float:
-        """ファイルサイズ推定（KB）"""
-        try:
-            json_str = json.dumps(timeline_data)
-            size_bytes = len(json_str.encode('utf-8'))
-            return round(size_bytes / 1024, 2)
-        except:
-            return 0.0
+    def register_timeline_content(
+        self,
+        session_id: str,
+        video_id: str,
+        timeline_data: Dict[str, Any],
+        transmission_metadata: Optional[Dict[str, Any]] = None,
+        digest: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """
+        配信候補のタイムラインをコンテンツハッシュで登録
+        
+        デバイスにはまず {video_id, sha256, size} のみを通知し、
+        キャッシュを持たないデバイスから "need" が返った場合にここから本体を送る。
+        
+        Args:
+            digest: リポジトリで計算済みの canonical_json / sha256 / size（あれば再計算しない）
+        """
+        if digest is None:
+            canonical_json = canonical_timeline_json(timeline_data)
+            canonical_bytes = canonical_json.encode('utf-8')
+            digest = {
+                'canonical_json': canonical_json,
+                'sha256': hashlib.sha256(canonical_bytes).hexdigest(),
+                'size': len(canonical_bytes)
+            }
+        content = {
+            'video_id': video_id,
+            'sha256': digest['sha256'],
+            'size': digest['size'],
+            'canonical_json': digest['canonical_json'],
+            'transmission_metadata': dict(transmission_metadata or {}),
+            'registered_at': datetime.now()
+        }
+        content['transmission_metadata'].setdefault('sha256', content['sha256'])
+        self.timeline_contents.setdefault(session_id, {})[content['sha256']] = content
+        return content
     
-    def _calculate_checksum(self, timeline_data: Dict[str, Any]) -> str:
-        """簡易チェックサム計算"""
-        try:
-            json_str = json.dumps(timeline_data, sort_keys=True)
-            return f"md5_{hash(json_str) & 0xffffffff:08x}"
-        except:
-            return "checksum_error"
+    def get_timeline_content(self, session_id: str, sha256: str) -> Optional[Dict[str, Any]]:
+        """登録済みタイムライン本体を取得"""
+        return self.timeline_contents.get(session_id, {}).get(sha256)
     
     def get_timeline_state(self, session_id: str) -> Optional[Dict[str, Any]]:
         """タイムライン状態取得"""
@@ -152,6 +161,7 @@ class SyncDataService:
         
         state = self.timeline_states[session_id]
         total_duration = state.get('total_duration', 0.0)
+        session_lifecycle.touch(session_id)
         
         # ループ再生チェック
         if current_time > total_duration and total_duration > 0:
@@ -179,26 +189,76 @@ class SyncDataService:
         """
         指定時刻のイベント検索
         
-        ラズパイのタイムライン処理に対応
+        ラズパイのタイムライン処理に対応。コンパイル済み時刻列の二分探索で O(log n + k)
         """
         if session_id not in self.timeline_states:
             return []
         
-        state = self.timeline_states[session_id]
-        timeline_data = state.get('timeline_data', {})
-        events = timeline_data.get('events', [])
-        
-        matching_events = []
-        for event in events:
-            event_time = event.get('t', 0)
-            if abs(event_time - target_time) <= tolerance:
-                matching_events.append(event)
+        compiled = self.timeline_states[session_id]['compiled']
+        matching_events = compiled.events(*compiled.window(target_time - tolerance, target_time + tolerance, include_start=True))
         
         if matching_events:
             logger.debug(f"[SYNC_DATA] {len(matching_events)}イベント発見 at {target_time}s (session: {session_id})")
         
         return matching_events
     
+    def find_events_in_window(self, session_id: str, start: Optional[float], end: float, include_start: bool = False) -> List[Dict[str, Any]]:
+        """
+        半開区間 (start, end] のイベントを取得（include_start=True なら [start, end]）
+        
+        Args:
+            start: 区間の開始時刻（Noneなら先頭から）
+            end: 区間の終了時刻
+        """
+        if session_id not in self.timeline_states:
+            return []
+        
+        compiled = self.timeline_states[session_id]['compiled']
+        return compiled.events(*compiled.window(start, end, include_start))
+    
+    def collect_due_events(self, session_id: str, now: float) -> List[Dict[str, Any]]:
+        """
+        前回呼び出し時刻から now までに発生したイベントを取得（各イベントは1度だけ）
+        
+        ティック間隔やトレランスに関係なく、区間 (前回, now] のイベントを漏れなく返す。
+        now が前回より前に戻った場合はループ再生とみなし、前回以降の残りと先頭から now までを返す。
+        シーク時は reset_event_cursor() で起点を移すこと。
+        """
+        state = self.timeline_states.get(session_id)
+        if state is None:
+            return []
+        
+        cursor = state.get('event_cursor')
+        inclusive = state.get('event_cursor_inclusive', False)
+        
+        if cursor is not None and now < cursor:
+            # ループ再生：前周の残り + 先頭から now まで
+            tail = self.find_events_in_window(session_id, cursor, state['compiled'].duration, inclusive)
+            due = tail + self.find_events_in_window(session_id, None, now)
+        else:
+            due = self.find_events_in_window(session_id, cursor, now, inclusive)
+        
+        state['event_cursor'] = now
+        state['event_cursor_inclusive'] = False
+        
+        if due:
+            logger.debug(f"[SYNC_DATA] {len(due)}イベント到来 ({cursor}, {now}] (session: {session_id})")
+        
+        return due
+    
+    def reset_event_cursor(self, session_id: str, position: Optional[float]):
+        """
+        イベント取得の起点を移動（シーク時）
+        
+        Args:
+            position: 新しい起点時刻。この時刻ちょうどのイベントも次回取得対象に含める（Noneなら先頭から）
+        """
+        state = self.timeline_states.get(session_id)
+        if state is None:
+            return
+        state['event_cursor'] = position
+        state['event_cursor_inclusive'] = True
+    
     def get_timeline_info(self, session_id: str) -> Dict[str, Any]:
         """タイムライン情報取得"""
         if session_id not in self.timeline_states:
@@ -217,6 +277,7 @@ class SyncDataService:
     
     def cleanup_session(self, session_id: str):
         """セッション状態クリーンアップ"""
+        self.timeline_contents.pop(session_id, None)
         if session_id in self.timeline_states:
             del self.timeline_states[session_id]
             logger.info(f"[SYNC_DATA] セッション状態削除: {session_id}")
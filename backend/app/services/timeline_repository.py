@@ -0,0 +1,209 @@
+"""
+タイムラインリポジトリ - 同期データJSONの共通読み込み口
+
+settings.get_sync_data_path() 配下の {video_id}.json を全サービスがここから読む。
+
+- LRU: 元ファイル・正規化JSON・gzipの合計サイズが settings.timeline_cache_max_bytes を超えたら古いものから破棄
+- 更新検知: mtime / サイズが変わっていれば再読み込み（確認は timeline_mtime_check_interval 秒ごと）
+- 単一飛行: 同じ動画の同時読み込みは1回のディスク読み込みにまとめる
+- 読み込み時に正規化JSONとsha256を1度だけ計算（配信・ETag・キャッシュ照合に共通で使う）
+- 読み込み・破棄に合わせてコンパイル済みタイムラインも再構築・破棄する
+"""
+
+import asyncio
+import gzip
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional, Any
+
+import aiofiles
+
+from app.config.settings import settings
+from app.services.compiled_timeline import compiled_timeline_store
+
+logger = logging.getLogger(__name__)
+
+def canonical_timeline_json(timeline_data: Dict[str, Any]) -> str:
+    """
+    コンテンツハッシュ用の正規化JSON
+
+    キー順・区切り文字を固定し、同じ内容なら常に同じバイト列になる。
+    ラズパイ側のキャッシュも同じ規則でハッシュを計算する。
+    """
+    return json.dumps(timeline_data, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+
+def _parse_timeline(raw: str) -> Dict[str, Any]:
+    """JSON解析と正規化・ダイジェスト計算（スレッドで実行）"""
+    data = json.loads(raw)
+    canonical_json = canonical_timeline_json(data)
+    canonical_bytes = canonical_json.encode('utf-8')
+    return {
+        'data': data,
+        'canonical_json': canonical_json,
+        'sha256': hashlib.sha256(canonical_bytes).hexdigest(),
+        'size': len(canonical_bytes)
+    }
+
+class TimelineRepository:
+    """動画IDごとのタイムラインJSONキャッシュ（有界LRU・mtime無効化・単一飛行）"""
+
+    def __init__(self, base_path: Optional[Path] = None, max_bytes: Optional[int] = None):
+        self.base_path = base_path or settings.get_sync_data_path()
+        self.max_bytes = max_bytes if max_bytes is not None else settings.timeline_cache_max_bytes
+        self.check_interval = settings.timeline_mtime_check_interval
+        # video_id → {'data', 'canonical_json', 'sha256', 'size', 'gzip', 'file_size', 'mtime_ns', 'checked_at'}（末尾が最近使用）
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        # 読み込み中の video_id → 完了待ちFuture
+        self._loading: Dict[str, asyncio.Future] = {}
+        self.total_bytes = 0
+        # 統計
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+        self.evictions = 0
+
+    def path_for(self, video_id: str) -> Path:
+        return self.base_path / f"{video_id}.json"
+
+    async def get(self, video_id: str) -> Optional[Dict[str, Any]]:
+        """
+        タイムラインJSONを取得（ファイルが無ければNone）
+
+        返すdictはキャッシュと共有されるため変更しないこと。
+
+        Raises:
+            ValueError: JSONの解析に失敗した場合
+        """
+        entry = await self.get_content(video_id)
+        return entry['data'] if entry is not None else None
+
+    async def get_content(self, video_id: str) -> Optional[Dict[str, Any]]:
+        """
+        タイムラインのキャッシュエントリを取得（data / canonical_json / sha256 / size）
+
+        Raises:
+            ValueError: JSONの解析に失敗した場合
+        """
+        entry = self._entries.get(video_id)
+        if entry is not None and time.monotonic() - entry['checked_at'] < self.check_interval:
+            self._entries.move_to_end(video_id)
+            self.hits += 1
+            return entry
+
+        stat = self._stat(video_id)
+        if stat is None:
+            self.invalidate(video_id)
+            return None
+
+        if entry is not None and (entry['mtime_ns'], entry['file_size']) == (stat.st_mtime_ns, stat.st_size):
+            entry['checked_at'] = time.monotonic()
+            self._entries.move_to_end(video_id)
+            self.hits += 1
+            return entry
+
+        loading = self._loading.get(video_id)
+        if loading is not None:
+            # 他のリクエストが読み込み中 → 結果を共有
+            return await asyncio.shield(loading)
+
+        future = asyncio.get_running_loop().create_future()
+        self._loading[video_id] = future
+        try:
+            entry = await self._load(video_id, stat, reload=entry is not None)
+            future.set_result(entry)
+            return entry
+        except BaseException as e:
+            future.set_exception(e)
+            # 待機者がいない場合の「未取得例外」警告を抑止
+            future.exception()
+            raise
+        finally:
+            del self._loading[video_id]
+
+    def gzip_body(self, entry: Dict[str, Any]) -> bytes:
+        """正規化JSONのgzip圧縮（エントリごとに1度だけ圧縮）"""
+        if entry['gzip'] is None:
+            entry['gzip'] = gzip.compress(entry['canonical_json'].encode('utf-8'), compresslevel=6)
+            if self._entries.get(entry['video_id']) is entry:
+                self.total_bytes += len(entry['gzip'])
+                self._evict()
+        return entry['gzip']
+
+    def invalidate(self, video_id: str):
+        """キャッシュを破棄（ファイル書き換え・削除時）"""
+        entry = self._entries.pop(video_id, None)
+        if entry is not None:
+            self.total_bytes -= self._entry_bytes(entry)
+        compiled_timeline_store.invalidate(video_id)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'entries': len(self._entries),
+            'total_bytes': self.total_bytes,
+            'max_bytes': self.max_bytes,
+            'loading': len(self._loading),
+            'hits': self.hits,
+            'misses': self.misses,
+            'reloads': self.reloads,
+            'evictions': self.evictions
+        }
+
+    def _stat(self, video_id: str) -> Optional[os.stat_result]:
+        try:
+            return self.path_for(video_id).stat()
+        except FileNotFoundError:
+            return None
+
+    @staticmethod
+    def _entry_bytes(entry: Dict[str, Any]) -> int:
+        """上限計算に使うサイズ（元ファイル + 正規化JSON + gzip）"""
+        return entry['file_size'] + entry['size'] + len(entry['gzip'] or b'')
+
+    async def _load(self, video_id: str, stat: os.stat_result, reload: bool) -> Dict[str, Any]:
+        timeline_file = self.path_for(video_id)
+        async with aiofiles.open(timeline_file, 'r', encoding='utf-8') as f:
+            content = await f.read()
+        try:
+            # 大きなファイルの解析・正規化・ハッシュ計算でイベントループを止めない
+            entry = await asyncio.to_thread(_parse_timeline, content)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"同期データファイルの解析に失敗しました: {timeline_file}: {e}") from e
+
+        self.invalidate(video_id)
+        entry.update({
+            'video_id': video_id,
+            'gzip': None,
+            'file_size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'checked_at': time.monotonic()
+        })
+        self._entries[video_id] = entry
+        self.total_bytes += self._entry_bytes(entry)
+        compiled_timeline_store.compile(video_id, entry['data'])
+
+        if reload:
+            self.reloads += 1
+            logger.info(f"[TIMELINE_REPO] 更新を検知して再読み込み: {timeline_file}")
+        else:
+            self.misses += 1
+            logger.info(f"[TIMELINE_REPO] 読み込み: {timeline_file} ({stat.st_size}B)")
+
+        self._evict()
+        return entry
+
+    def _evict(self):
+        """上限を超えた分を最近使われていない順に破棄（最新の1件は残す）"""
+        while self.total_bytes > self.max_bytes and len(self._entries) > 1:
+            video_id, entry = self._entries.popitem(last=False)
+            self.total_bytes -= self._entry_bytes(entry)
+            compiled_timeline_store.invalidate(video_id)
+            self.evictions += 1
+            logger.info(f"[TIMELINE_REPO] キャッシュ上限により破棄: {video_id}")
+
+# 共有インスタンス
+timeline_repository = TimelineRepository()
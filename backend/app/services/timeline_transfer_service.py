@@ -0,0 +1,159 @@
+"""
+タイムライン分割転送サービス
+
+大きなタイムラインをgzip圧縮してチャンクに分割し、連番付きでデバイスへ送る。
+デバイスは受信済みの連番をACKし、再接続後は未受信の連番から再開を要求できる。
+最後に非圧縮ペイロードのsha256（payload_sha256）で完全性を検証する。
+これは転送したバイト列の検証用で、offer / have / need で使うタイムライン内容のsha256
+（正規化JSONのsha256。transmission_metadata['sha256']）とは別の値として扱う。
+"""
+
+import asyncio
+import base64
+import gzip
+import hashlib
+import logging
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Any, List
+
+from app.config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+TRANSFER_ENCODING = "gzip"
+
+class TimelineTransferService:
+    """タイムライン分割転送の状態管理"""
+
+    def __init__(self):
+        # 転送ID → 転送状態（圧縮済みチャンクを保持し、再開時に再送する）
+        self.transfers: Dict[str, Dict[str, Any]] = {}
+        self.chunk_size = settings.timeline_chunk_size
+        self.transfer_ttl = timedelta(seconds=settings.timeline_transfer_ttl)
+
+    async def create_transfer(
+        self,
+        session_id: str,
+        video_id: str,
+        payload: bytes,
+        transmission_metadata: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """
+        ペイロードを圧縮・分割して転送を登録（圧縮はワーカースレッドで行う）
+
+        Args:
+            session_id: セッションID
+            video_id: 動画ID
+            payload: タイムラインJSONのUTF-8バイト列
+            transmission_metadata: 完了時にデバイスへ渡すメタデータ（'sha256' があれば内容のsha256）
+        """
+        self._expire_transfers()
+
+        # 最大16MBの圧縮でイベントループを止めない
+        compressed = await asyncio.to_thread(gzip.compress, payload, 6)
+        metadata = dict(transmission_metadata or {})
+        chunks = [
+            compressed[offset:offset + self.chunk_size]
+            for offset in range(0, len(compressed), self.chunk_size)
+        ] or [b""]
+
+        transfer_id = uuid.uuid4().hex
+        transfer = {
+            'transfer_id': transfer_id,
+            'session_id': session_id,
+            'video_id': video_id,
+            'payload_sha256': hashlib.sha256(payload).hexdigest(),
+            'content_sha256': metadata.get('sha256'),
+            'size': len(payload),
+            'compressed_size': len(compressed),
+            'chunks': chunks,
+            'transmission_metadata': metadata,
+            'acked': {},
+            'completed': set(),
+            'created_at': datetime.now()
+        }
+        self.transfers[transfer_id] = transfer
+
+        logger.info(
+            f"[TRANSFER] 分割転送作成: {transfer_id[:8]} video={video_id}, "
+            f"{len(payload)}B → {len(compressed)}B ({len(chunks)}チャンク)"
+        )
+        return transfer
+
+    def get_transfer(self, session_id: str, transfer_id: str) -> Optional[Dict[str, Any]]:
+        """セッションに属する転送を取得"""
+        transfer = self.transfers.get(transfer_id)
+        if not transfer or transfer['session_id'] != session_id:
+            return None
+        return transfer
+
+    def begin_message(self, transfer: Dict[str, Any]) -> Dict[str, Any]:
+        """転送開始メッセージ"""
+        return {
+            'type': 'timeline_chunk_begin',
+            'session_id': transfer['session_id'],
+            'transfer_id': transfer['transfer_id'],
+            'video_id': transfer['video_id'],
+            'encoding': TRANSFER_ENCODING,
+            'payload_sha256': transfer['payload_sha256'],
+            'size': transfer['size'],
+            'compressed_size': transfer['compressed_size'],
+            'total_chunks': len(transfer['chunks']),
+            'transmission_metadata': transfer['transmission_metadata']
+        }
+
+    def chunk_message(self, transfer: Dict[str, Any], seq: int) -> Dict[str, Any]:
+        """チャンクメッセージ（圧縮データはbase64）"""
+        return {
+            'type': 'timeline_chunk',
+            'transfer_id': transfer['transfer_id'],
+            'seq': seq,
+            'data': base64.b64encode(transfer['chunks'][seq]).decode('ascii')
+        }
+
+    def end_message(self, transfer: Dict[str, Any]) -> Dict[str, Any]:
+        """転送終了メッセージ（最終ダイジェスト付き）"""
+        return {
+            'type': 'timeline_chunk_end',
+            'transfer_id': transfer['transfer_id'],
+            'total_chunks': len(transfer['chunks']),
+            'payload_sha256': transfer['payload_sha256']
+        }
+
+    def record_ack(self, transfer: Dict[str, Any], device_key: str, next_seq: int):
+        """デバイスの受信済み位置を記録"""
+        current = transfer['acked'].get(device_key, 0)
+        transfer['acked'][device_key] = max(current, min(next_seq, len(transfer['chunks'])))
+
+    def record_complete(self, transfer: Dict[str, Any], device_key: str):
+        """デバイスの受信完了を記録"""
+        transfer['completed'].add(device_key)
+        transfer['acked'][device_key] = len(transfer['chunks'])
+
+    def get_stats(self) -> Dict[str, Any]:
+        """転送統計"""
+        return {
+            'active_transfers': len(self.transfers),
+            'buffered_bytes': sum(t['compressed_size'] for t in self.transfers.values())
+        }
+
+    def cleanup_session(self, session_id: str):
+        """セッションの転送を破棄"""
+        for transfer_id in [tid for tid, t in self.transfers.items() if t['session_id'] == session_id]:
+            del self.transfers[transfer_id]
+
+    def _expire_transfers(self):
+        """期限切れの転送を破棄（再開できる期間を過ぎたもの）"""
+        now = datetime.now()
+        expired = [
+            transfer_id for transfer_id, transfer in self.transfers.items()
+            if now - transfer['created_at'] > self.transfer_ttl
+        ]
+        for transfer_id in expired:
+            del self.transfers[transfer_id]
+        if expired:
+            logger.info(f"[TRANSFER] 期限切れ転送を破棄: {len(expired)}件")
+
+# サービスインスタンス
+timeline_transfer_service = TimelineTransferService()
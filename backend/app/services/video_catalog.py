@@ -0,0 +1,207 @@
+"""
+動画カタログインデックス - 動画一覧の永続化と差分更新
+
+動画ファイルと同期データJSONの (サイズ, mtime) をキーに、生成済みの動画情報をディスクに保存する。
+再スキャンではディレクトリ走査と stat のみをワーカースレッドで行い、
+追加・変更されたファイルだけ動画情報を作り直す（削除されたファイルは一覧から外す）。
+起動直後もインデックスを読み込むだけで全件の再解析は行わない。
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Dict, Optional, Any, List, Callable, Awaitable, Iterable
+
+from app.config.settings import settings
+from app.models.video import EnhancedVideo
+from app.services.timeline_repository import timeline_repository
+
+logger = logging.getLogger(__name__)
+
+# インデックスファイルの形式バージョン（変更時は既存インデックスを破棄して再構築）
+INDEX_VERSION = 1
+
+def _signature(path: Path) -> Optional[List[int]]:
+    """ファイルの [サイズ, mtime_ns]（存在しなければNone）"""
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+class VideoCatalogIndex:
+    """動画IDごとの動画情報インデックス（永続化・差分更新）"""
+
+    def __init__(self, videos_path: Path, supported_formats: Iterable[str], index_path: Optional[Path] = None):
+        self.videos_path = videos_path
+        self.supported_formats = {fmt.lower() for fmt in supported_formats}
+        self.index_path = index_path or settings.get_data_path() / settings.video_catalog_index_file
+        self.refresh_interval = settings.video_catalog_refresh_interval
+        # video_id → 動画情報 / {'file_name', 'video': [size, mtime_ns], 'sync': [size, mtime_ns] | None}
+        self._videos: Dict[str, EnhancedVideo] = {}
+        self._signatures: Dict[str, Dict[str, Any]] = {}
+        self._loaded = False
+        self._lock = asyncio.Lock()
+        self.last_refresh: Optional[float] = None
+        # 動画の追加・変更・削除ごとに増える（派生インデックスの再構築判定用）
+        self.generation = 0
+        # 統計
+        self.processed_count = 0
+        self.reused_count = 0
+        self.removed_count = 0
+        self.last_refresh_ms: Optional[float] = None
+
+    def get(self, video_id: str) -> Optional[EnhancedVideo]:
+        return self._videos.get(video_id)
+
+    def videos(self) -> List[EnhancedVideo]:
+        return list(self._videos.values())
+
+    def signature(self, video_id: str) -> Optional[Dict[str, Any]]:
+        """{'file_name', 'video': [size, mtime_ns], 'sync': ...}（未登録ならNone）"""
+        return self._signatures.get(video_id)
+
+    async def persist(self):
+        """現在の内容を保存（プローブ結果の反映など、スキャン以外で動画情報を更新した場合）"""
+        async with self._lock:
+            await asyncio.to_thread(self._save_index, dict(self._signatures), dict(self._videos))
+
+    def is_stale(self) -> bool:
+        """前回の差分更新から refresh_interval 秒以上経過しているか"""
+        return self.last_refresh is None or time.monotonic() - self.last_refresh >= self.refresh_interval
+
+    async def refresh(self, create_video: Callable[[Path], Awaitable[Optional[EnhancedVideo]]]) -> Dict[str, int]:
+        """
+        ディレクトリを走査して差分を反映（同時呼び出しは1回にまとめる）
+
+        Args:
+            create_video: 追加・変更された動画ファイルから動画情報を作る関数
+
+        Returns:
+            処理件数（processed / reused / removed）
+        """
+        async with self._lock:
+            started = time.monotonic()
+            first_load = not self._loaded
+            if first_load:
+                self._signatures, self._videos = await asyncio.to_thread(self._load_index)
+                self._loaded = True
+
+            scanned = await asyncio.to_thread(self._scan)
+
+            videos: Dict[str, EnhancedVideo] = {}
+            signatures: Dict[str, Dict[str, Any]] = {}
+            processed = 0
+            for video_id, signature in scanned.items():
+                video = self._videos.get(video_id)
+                if video is None or self._signatures.get(video_id) != signature:
+                    video = await create_video(self.videos_path / signature['file_name'])
+                    processed += 1
+                    if video is None:
+                        continue
+                    logger.info(f"動画を検出: {video.video_id} - {video.title}")
+                videos[video_id] = video
+                signatures[video_id] = signature
+
+            removed = len(set(self._signatures) - set(scanned))
+            reused = len(videos) - processed
+            changed = processed > 0 or removed > 0 or not self.index_path.exists()
+            self._videos, self._signatures = videos, signatures
+            if first_load or processed > 0 or removed > 0:
+                self.generation += 1
+
+            if changed:
+                try:
+                    await asyncio.to_thread(self._save_index, dict(signatures), dict(videos))
+                except OSError as e:
+                    logger.warning(f"動画カタログインデックスの保存に失敗しました: {e}")
+
+            self.processed_count += processed
+            self.reused_count += reused
+            self.removed_count += removed
+            self.last_refresh = time.monotonic()
+            self.last_refresh_ms = round((self.last_refresh - started) * 1000, 1)
+            logger.info(
+                f"動画カタログ更新: {len(videos)}件 (再処理 {processed} / 再利用 {reused} / 削除 {removed}, "
+                f"{self.last_refresh_ms}ms)"
+            )
+            return {'processed': processed, 'reused': reused, 'removed': removed}
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'videos': len(self._videos),
+            'generation': self.generation,
+            'index_path': str(self.index_path),
+            'refresh_interval': self.refresh_interval,
+            'last_refresh_seconds_ago': round(time.monotonic() - self.last_refresh, 1) if self.last_refresh is not None else None,
+            'last_refresh_ms': self.last_refresh_ms,
+            'processed': self.processed_count,
+            'reused': self.reused_count,
+            'removed': self.removed_count
+        }
+
+    def _scan(self) -> Dict[str, Dict[str, Any]]:
+        """動画ファイルと同期データの署名を収集（スレッドで実行）"""
+        scanned: Dict[str, Dict[str, Any]] = {}
+        with os.scandir(self.videos_path) as entries:
+            files = sorted(
+                (entry for entry in entries
+                 if entry.is_file() and os.path.splitext(entry.name)[1].lower() in self.supported_formats),
+                key=lambda entry: entry.name
+            )
+        for entry in files:
+            # 動画IDはファイル名（拡張子なし）。同名の別形式は先に見つかった方を使う
+            video_id = os.path.splitext(entry.name)[0]
+            if video_id in scanned:
+                continue
+            stat = entry.stat()
+            scanned[video_id] = {
+                'file_name': entry.name,
+                'video': [stat.st_size, stat.st_mtime_ns],
+                'sync': _signature(timeline_repository.path_for(video_id))
+            }
+        return scanned
+
+    def _load_index(self):
+        """保存済みインデックスを読み込み（スレッドで実行。無効なら空）"""
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+        except FileNotFoundError:
+            return {}, {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"動画カタログインデックスを読み込めません（再構築します）: {e}")
+            return {}, {}
+
+        if index.get('version') != INDEX_VERSION or index.get('videos_path') != str(self.videos_path.resolve()):
+            logger.info("動画カタログインデックスの形式・対象が異なるため再構築します")
+            return {}, {}
+
+        signatures, videos = {}, {}
+        for video_id, entry in index.get('entries', {}).items():
+            try:
+                videos[video_id] = EnhancedVideo(**entry['video'])
+                signatures[video_id] = entry['signature']
+            except Exception as e:
+                logger.warning(f"動画カタログインデックスの不正なエントリを破棄: {video_id}: {e}")
+        logger.info(f"動画カタログインデックス読み込み: {len(videos)}件 ({self.index_path})")
+        return signatures, videos
+
+    def _save_index(self, signatures: Dict[str, Dict[str, Any]], videos: Dict[str, EnhancedVideo]):
+        """インデックスを一時ファイル経由で置き換え保存（スレッドで実行）"""
+        index = {
+            'version': INDEX_VERSION,
+            'videos_path': str(self.videos_path.resolve()),
+            'entries': {
+                video_id: {'signature': signatures[video_id], 'video': json.loads(video.json())}
+                for video_id, video in videos.items()
+            }
+        }
+        self.index_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.index_path.with_suffix(self.index_path.suffix + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(index, f, ensure_ascii=False)
+        os.replace(tmp_path, self.index_path)
@@ -5,7 +5,6 @@ Video Service - 動画管理ビジネスロジック
 """
 
 import os
-import json
 import logging
 from pathlib import Path
 from typing import List, Dict, Any, Optional, Tuple
@@ -17,6 +16,11 @@ from app.models.video import (
     VideoStatus, EffectComplexity, ContentRating,
     VIDEO_CATEGORIES, EFFECT_TYPES
 )
+from app.services.compiled_timeline import compiled_timeline_store
+from app.services.timeline_repository import timeline_repository
+from app.services.video_catalog import VideoCatalogIndex
+from app.services.capability_index import CapabilityIndex, encode_cursor, decode_cursor
+from app.services.media_probe import media_probe_service, PRIORITY_VISIBLE, PRIORITY_BACKGROUND
 
 logger = logging.getLogger(__name__)
 
@@ -25,16 +29,16 @@ class VideoService:
     
     def __init__(self):
         self.videos_path = settings.get_video_assets_path()
-        self.sync_data_path = settings.get_sync_data_path()
         
         # 対応動画形式
         self.supported_formats = [".mp4", ".webm", ".avi"]
         
-        # キャッシュ
-        self._video_cache: Dict[str, EnhancedVideo] = {}
-        self._last_scan_time: Optional[datetime] = None
+        # 永続化・差分更新する動画カタログ（video_id で引ける）
+        self.catalog = VideoCatalogIndex(self.videos_path, self.supported_formats)
+        # 必要機能・カテゴリのビットマスク（カタログ更新時に再構築）
+        self.capability_index = CapabilityIndex()
     
-    def scan_video_files(self, force_rescan: bool = False) -> List[EnhancedVideo]:
+    async def scan_video_files(self, force_rescan: bool = False) -> List[EnhancedVideo]:
         """
         動画ディレクトリをスキャンして動画一覧を生成
         
@@ -44,41 +48,27 @@ class VideoService:
         Returns:
             List[EnhancedVideo]: 検出された動画リスト
         """
-        current_time = datetime.now()
-        
-        # キャッシュチェック（5分間有効）
-        if (not force_rescan and 
-            self._last_scan_time and 
-            (current_time - self._last_scan_time).seconds < 300 and
-            self._video_cache):
-            logger.info("動画リストをキャッシュから取得")
-            return list(self._video_cache.values())
-        
-        logger.info(f"動画ディレクトリをスキャン中: {self.videos_path}")
+        # 再スキャン間隔内はカタログをそのまま返す
+        if not force_rescan and not self.catalog.is_stale():
+            logger.debug("動画リストをカタログから取得")
+            return self.catalog.videos()
         
         if not self.videos_path.exists():
             logger.warning(f"動画ディレクトリが存在しません: {self.videos_path}")
             return []
         
-        videos = []
-        
-        for file_path in self.videos_path.iterdir():
-            if file_path.is_file() and file_path.suffix.lower() in self.supported_formats:
-                try:
-                    video = self._create_video_from_file(file_path)
-                    if video:
-                        videos.append(video)
-                        self._video_cache[video.video_id] = video
-                        logger.info(f"動画を検出: {video.video_id} - {video.title}")
-                except Exception as e:
-                    logger.error(f"動画ファイル処理エラー {file_path}: {e}")
-        
-        self._last_scan_time = current_time
-        logger.info(f"動画スキャン完了: {len(videos)}件")
+        # 走査・statはワーカースレッドで行い、追加・変更されたファイルのみ処理
+        logger.info(f"動画ディレクトリを差分スキャン中: {self.videos_path}")
+        await self.catalog.refresh(self._create_video_from_file)
         
+        # 実メタデータ未取得の動画をバックグラウンドでプローブ（完了を待たない）
+        videos = self.catalog.videos()
+        media_probe_service.enqueue(
+            self.catalog, [v.video_id for v in videos if not v.video_info.metadata_probed], PRIORITY_BACKGROUND
+        )
         return videos
     
-    def _create_video_from_file(self, file_path: Path) -> Optional[EnhancedVideo]:
+    async def _create_video_from_file(self, file_path: Path) -> Optional[EnhancedVideo]:
         """
         ファイルパスから動画オブジェクトを生成
         
@@ -112,7 +102,7 @@ class VideoService:
             )
             
             # 同期データ読み込み
-            sync_data = self._load_sync_data(video_id)
+            sync_data = await self._load_sync_data(video_id)
             compatibility = self._create_compatibility_info(video_id, sync_data)
             
             # 動画オブジェクト作成
@@ -179,22 +169,17 @@ class VideoService:
         }
         return rating_map.get(video_id, ContentRating.G)
     
-    def _load_sync_data(self, video_id: str) -> Optional[Dict[str, Any]]:
-        """同期データJSONファイルを読み込み"""
-        sync_file = self.sync_data_path / f"{video_id}.json"
-        
-        if not sync_file.exists():
-            logger.info(f"同期データファイルが見つかりません: {sync_file}")
-            return None
-        
+    async def _load_sync_data(self, video_id: str) -> Optional[Dict[str, Any]]:
+        """同期データJSONファイルを読み込み（共通リポジトリ経由）"""
         try:
-            with open(sync_file, 'r', encoding='utf-8') as f:
-                sync_data = json.load(f)
-                logger.info(f"同期データ読み込み成功: {video_id}")
-                return sync_data
+            sync_data = await timeline_repository.get(video_id)
         except Exception as e:
-            logger.error(f"同期データ読み込みエラー {sync_file}: {e}")
+            logger.error(f"同期データ読み込みエラー {video_id}: {e}")
             return None
+        
+        if sync_data is None:
+            logger.info(f"同期データファイルが見つかりません: {timeline_repository.path_for(video_id)}")
+        return sync_data
     
     def _create_compatibility_info(self, video_id: str, sync_data: Optional[Dict[str, Any]]) -> VideoCompatibility:
         """同期データから互換性情報を生成"""
@@ -205,28 +190,20 @@ class VideoService:
                 effect_complexity=EffectComplexity.LOW
             )
         
-        # 同期データから使用エフェクトを解析
-        effects_used = set()
+        # 同期データから使用エフェクトを解析（コンパイル済みタイムラインの列を集計）
+        compiled = compiled_timeline_store.get_or_compile(video_id, sync_data)
         effect_stats = {}
         
-        events = sync_data.get('sync_events', [])
+        for effect, stats in compiled.effect_stats().items():
+            effect_type = effect.upper()
+            if effect_type not in EFFECT_TYPES:
+                continue
+            merged = effect_stats.setdefault(effect_type, {'count': 0, 'total_intensity': 0, 'total_duration': 0})
+            merged['count'] += stats['count']
+            merged['total_intensity'] += stats['intensity_avg'] * stats['count']
+            merged['total_duration'] += stats['duration_total']
         
-        for event in events:
-            effect_type = event.get('effect', '').upper()
-            if effect_type in EFFECT_TYPES:
-                effects_used.add(effect_type)
-                
-                # 統計情報収集
-                if effect_type not in effect_stats:
-                    effect_stats[effect_type] = {
-                        'count': 0,
-                        'total_intensity': 0,
-                        'total_duration': 0
-                    }
-                
-                effect_stats[effect_type]['count'] += 1
-                effect_stats[effect_type]['total_intensity'] += event.get('intensity', 0.5)
-                effect_stats[effect_type]['total_duration'] += event.get('duration', 1000) / 1000  # ms to s
+        effects_used = set(effect_stats)
         
         # エフェクト情報生成
         supported_effects = []
@@ -253,42 +230,90 @@ class VideoService:
             effect_complexity=complexity
         )
     
-    def get_video_by_id(self, video_id: str) -> Optional[EnhancedVideo]:
+    async def get_video_by_id(self, video_id: str) -> Optional[EnhancedVideo]:
         """IDで動画を取得"""
-        # キャッシュから確認
-        if video_id in self._video_cache:
-            return self._video_cache[video_id]
+        video = self.catalog.get(video_id)
+        if video is not None:
+            return video
         
-        # スキャンして再検索
-        videos = self.scan_video_files()
-        return next((v for v in videos if v.video_id == video_id), None)
+        # 未登録なら（再スキャン間隔を過ぎていれば）差分スキャンして再検索
+        await self.scan_video_files()
+        return self.catalog.get(video_id)
+    
+    def prioritize_media_probe(self, videos: List[EnhancedVideo]):
+        """表示対象の動画のメタデータ取得を優先（ノンブロッキング）"""
+        media_probe_service.enqueue(
+            self.catalog, [v.video_id for v in videos if not v.video_info.metadata_probed], PRIORITY_VISIBLE
+        )
     
     def filter_videos_by_device(self, videos: List[EnhancedVideo], device_capabilities: List[str]) -> List[EnhancedVideo]:
-        """デバイス機能でフィルタリング"""
-        compatible_videos = []
-        
-        for video in videos:
-            if video.is_compatible_with_device(device_capabilities):
-                compatible_videos.append(video)
-            else:
-                missing = video.get_missing_capabilities(device_capabilities)
-                logger.info(f"動画 {video.video_id} は非対応 (不足機能: {missing})")
+        """デバイス機能でフィルタリング（必要機能マスクのビット演算）"""
+        index = self.capability_index
+        device_mask = index.device_mask(device_capabilities)
+        missing = ~device_mask
+        compatible_videos = [
+            video for video in videos
+            if not index.capabilities.mask(video.compatibility.required_capabilities) & missing
+        ]
         
         logger.info(f"デバイスフィルタ結果: {len(compatible_videos)}/{len(videos)} 動画が対応")
         
         return compatible_videos
     
-    def get_video_url(self, video_id: str) -> Optional[str]:
+    def list_catalog_videos(
+        self,
+        device_capabilities: Optional[List[str]] = None,
+        category: Optional[str] = None,
+        cursor: Optional[str] = None,
+        limit: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """
+        カタログから表示順の動画一覧を1ページ取得（ビットマスクインデックスを使用）
+        
+        Args:
+            device_capabilities: デバイス機能（指定時は必要機能をすべて満たす動画のみ）
+            category: カテゴリ
+            cursor: 前ページの next_cursor
+            limit: 件数（Noneなら残り全件）
+            
+        Returns:
+            {'videos': [(動画, 互換性 | None, 不足機能 | None)], 'matched': 件数, 'next_cursor': str | None}
+            
+        Raises:
+            ValueError: 不正なカーソル
+        """
+        index = self.capability_index
+        index.ensure(self.catalog)
+        after = decode_cursor(cursor) if cursor else None
+        
+        device_mask = index.device_mask(device_capabilities) if device_capabilities else None
+        selection = index.select(device_mask, category)
+        page, next_key = index.page(selection, after, limit)
+        
+        videos = []
+        for i in page:
+            if device_mask is None:
+                videos.append((index.video(i), None, None))
+            else:
+                videos.append((index.video(i), index.is_compatible(i, device_mask), index.missing_capabilities(i, device_mask)))
+        
+        return {
+            'videos': videos,
+            'matched': len(selection),
+            'next_cursor': encode_cursor(next_key) if next_key else None
+        }
+    
+    async def get_video_url(self, video_id: str) -> Optional[str]:
         """動画のアクセスURLを生成"""
-        video = self.get_video_by_id(video_id)
+        video = await self.get_video_by_id(video_id)
         if not video:
             return None
         
         return f"/assets/videos/{video.video_info.file_name}"
     
-    def get_sync_data_url(self, video_id: str) -> Optional[str]:
+    async def get_sync_data_url(self, video_id: str) -> Optional[str]:
         """同期データのアクセスURLを生成"""
-        video = self.get_video_by_id(video_id)
+        video = await self.get_video_by_id(video_id)
         if not video or not video.sync_data_file:
             return None
         
@@ -0,0 +1,57 @@
+"""
+Asset Streaming API のテスト
+
+配信枠（stream_limiter）がオープン失敗・条件付きレスポンスでも解放されることを確認する。
+カタログを介さないよう _resolve_asset を差し替え、ルーターだけを載せたアプリで試験する。
+"""
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.api import asset_streaming
+from app.api.asset_streaming import router, stream_limiter
+
+@pytest.fixture
+def asset_path(tmp_path, monkeypatch):
+    """配信対象のパス（ファイルはテスト側で作成する）"""
+    path = tmp_path / "clip.mp4"
+
+    async def resolve(kind: str, file_name: str) -> str:
+        return str(path)
+
+    monkeypatch.setattr(asset_streaming, "_resolve_asset", resolve)
+    # 配信枠を1つにして、解放漏れがあれば次のGETが503になるようにする
+    monkeypatch.setattr(stream_limiter, "limit", 1)
+    monkeypatch.setattr(stream_limiter, "active", 0)
+    return path
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    app.include_router(router)
+    return TestClient(app)
+
+def test_missing_file_releases_slot(client, asset_path):
+    response = client.get("/assets/videos/clip.mp4")
+    assert response.status_code == 404
+    assert stream_limiter.active == 0
+
+    asset_path.write_bytes(b"0123456789")
+    response = client.get("/assets/videos/clip.mp4")
+    assert response.status_code == 200
+    assert response.content == b"0123456789"
+    assert stream_limiter.active == 0
+
+def test_not_modified_and_unsatisfiable_release_slot(client, asset_path):
+    asset_path.write_bytes(b"0123456789")
+    etag = client.head("/assets/videos/clip.mp4").headers["etag"]
+
+    assert client.get("/assets/videos/clip.mp4", headers={"If-None-Match": etag}).status_code == 304
+    assert client.get("/assets/videos/clip.mp4", headers={"Range": "bytes=100-"}).status_code == 416
+    assert stream_limiter.active == 0
+
+    response = client.get("/assets/videos/clip.mp4", headers={"Range": "bytes=2-4"})
+    assert response.status_code == 206
+    assert response.content == b"234"
+    assert stream_limiter.active == 0
@@ -0,0 +1,118 @@
+"""
+リレーバックプレーンのテスト
+
+InMemoryBackplane で2インスタンスをつなぎ、フロントエンドとデバイスが別インスタンスに接続しても
+中継が届くこと（発行 → 受信側 receive_remote_fan_out → ローカル配信）を確認する。
+インスタンスAはアプリ本体（共有 ws_manager）、インスタンスBは別の SimpleWebSocketManager。
+"""
+
+import json
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.api.playback_control import SimpleWebSocketManager, ws_manager, handle_remote_envelope
+from app.services.relay_backplane import InMemoryBackplane
+
+SESSION_ID = "relay-test"
+
+class FakeWebSocket:
+    """インスタンスB側の接続（送信内容を記録する）"""
+
+    def __init__(self):
+        self.scope = {"subprotocols": []}
+        self.sent = []
+
+    async def accept(self, subprotocol=None):
+        pass
+
+    async def send_text(self, text: str):
+        self.sent.append(json.loads(text))
+
+    async def send_bytes(self, data: bytes):
+        self.sent.append(data)
+
+    async def close(self, code: int = 1000):
+        pass
+
+def wait_for(predicate, timeout: float = 2.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+@pytest.fixture
+def relays():
+    """(TestClient, インスタンスBのマネージャー, インスタンスBのバックプレーン, Bが受信したエンベロープ)"""
+    manager_b = SimpleWebSocketManager()
+    received_b = []
+
+    async def handle_b(envelope):
+        received_b.append(envelope)
+        session_id = envelope["session_id"]
+        if envelope["kind"] == "fan_out" and manager_b.has_session(session_id):
+            manager_b.receive_remote_fan_out(session_id, envelope["data"])
+
+    with TestClient(app) as client:
+        backplane_a, backplane_b = InMemoryBackplane(), InMemoryBackplane()
+        client.portal.call(ws_manager.attach_backplane, backplane_a, handle_remote_envelope)
+        client.portal.call(manager_b.attach_backplane, backplane_b, handle_b)
+        try:
+            yield client, manager_b, backplane_b, received_b
+        finally:
+            client.portal.call(manager_b.detach_backplane)
+            client.portal.call(ws_manager.detach_backplane)
+
+def connect_b(client, manager_b, role: str) -> FakeWebSocket:
+    websocket = FakeWebSocket()
+    connection_id = manager_b.new_connection_id(role, SESSION_ID)
+    client.portal.call(manager_b.connect, websocket, connection_id, SESSION_ID, role)
+    return websocket
+
+def test_frontend_sync_reaches_device_on_other_instance(relays):
+    client, manager_b, _, _ = relays
+    device = connect_b(client, manager_b, "device")
+
+    with client.websocket_connect(f"/api/playback/ws/sync/{SESSION_ID}") as frontend:
+        frontend.receive_json()
+        frontend.send_text(json.dumps({"type": "sync", "time": 1.5, "state": "play", "duration": 10, "ts": 123}))
+        assert wait_for(lambda: any(m.get("type") == "video_sync" for m in device.sent))
+
+    video_sync = next(m for m in device.sent if m.get("type") == "video_sync")
+    assert video_sync["video_state"] == "play"
+    assert video_sync["session_id"] == SESSION_ID
+
+def test_device_message_reaches_frontend_on_other_instance(relays):
+    client, manager_b, _, _ = relays
+    connect_b(client, manager_b, "device")
+
+    with client.websocket_connect(f"/api/playback/ws/sync/{SESSION_ID}") as frontend:
+        frontend.receive_json()
+        manager_b.fan_out(SESSION_ID, {"type": "device_status", "session_id": SESSION_ID, "status": "ready"}, role="frontend")
+        message = frontend.receive_json()
+
+    assert message == {"type": "device_status", "session_id": SESSION_ID, "status": "ready"}
+
+def test_only_sessions_with_local_connections_are_subscribed(relays):
+    client, manager_b, backplane_b, received_b = relays
+
+    # Bに接続が無いセッションの中継は届かない
+    with client.websocket_connect(f"/api/playback/ws/sync/{SESSION_ID}") as frontend:
+        frontend.receive_json()
+        frontend.send_text(json.dumps({"type": "sync", "time": 1.0, "state": "play", "duration": 10, "ts": 1}))
+        frontend.send_text(json.dumps({"type": "hello"}))
+        frontend.receive_json()
+    assert received_b == []
+    assert backplane_b.get_stats()["subscribed_sessions"] == 0
+
+    # 最初の接続で購読し、最後の切断で解除する
+    device = connect_b(client, manager_b, "device")
+    assert backplane_b.get_stats()["subscribed_sessions"] == 1
+    connection_id = next(iter(manager_b.get_connections(SESSION_ID)))
+    client.portal.call(manager_b.disconnect, connection_id, SESSION_ID)
+    assert backplane_b.get_stats()["subscribed_sessions"] == 0
+    assert device.sent == []
@@ -44,6 +44,7 @@ class Config:
     SYNC_TOLERANCE_MS: int = int(os.getenv("SYNC_TOLERANCE_MS", "100"))
     TIMELINE_CACHE_DIR: str = os.getenv("TIMELINE_CACHE_DIR", "data/timeline_cache")
     COMMUNICATION_LOG_DIR: str = os.getenv("COMMUNICATION_LOG_DIR", "data/communication_logs")
+    TIMELINE_CHUNK_ACK_INTERVAL: int = int(os.getenv("TIMELINE_CHUNK_ACK_INTERVAL", "4"))
     
     # === エフェクトクールダウン設定（秒） ===
     WATER_COOLDOWN_SEC: float = float(os.getenv("WATER_COOLDOWN_SEC", "3.0"))
@@ -64,7 +65,21 @@ class Config:
     WS_RECONNECT_DELAY: int = int(os.getenv("WS_RECONNECT_DELAY", "5"))
     WS_MAX_RECONNECT_ATTEMPTS: int = int(os.getenv("WS_MAX_RECONNECT_ATTEMPTS", "0"))
     WS_PING_INTERVAL: int = int(os.getenv("WS_PING_INTERVAL", "30"))
-    
+    # 時刻同期メッセージをバイナリフレームで受信する（サーバー非対応時はJSON）
+    WS_BINARY_TICKS: bool = os.getenv("WS_BINARY_TICKS", "True").lower() == "true"
+
+    # === サーバー時刻同期設定 ===
+    # 再同期の間隔（秒）と1回あたりのサンプル数・送信間隔（秒）
+    CLOCK_SYNC_INTERVAL: int = int(os.getenv("CLOCK_SYNC_INTERVAL", "60"))
+    CLOCK_SYNC_BURST: int = int(os.getenv("CLOCK_SYNC_BURST", "8"))
+    CLOCK_SYNC_BURST_SPACING: float = float(os.getenv("CLOCK_SYNC_BURST_SPACING", "0.05"))
+    # 最小往復遅延の選択対象とするサンプル数
+    CLOCK_SYNC_WINDOW: int = int(os.getenv("CLOCK_SYNC_WINDOW", "16"))
+    # 応答が無いリクエストを破棄するまでの時間（ミリ秒）
+    CLOCK_SYNC_TIMEOUT_MS: int = int(os.getenv("CLOCK_SYNC_TIMEOUT_MS", "5000"))
+    # サーバー時刻から補正する再生位置の上限（秒）
+    CLOCK_SYNC_MAX_COMPENSATION_SEC: float = float(os.getenv("CLOCK_SYNC_MAX_COMPENSATION_SEC", "1.0"))
+
     @classmethod
     def validate(cls) -> None:
         """設定値の妥当性を検証"""
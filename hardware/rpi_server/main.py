@@ -8,6 +8,7 @@ import logging
 import signal
 import sys
 import threading
+import time
 from datetime import datetime
 from typing import Optional, Dict, Any
 
@@ -21,6 +22,7 @@ from src.api.websocket_client import CloudRunWebSocketClient
 from src.api.message_handler import WebSocketMessageHandler
 from src.timeline.processor import TimelineProcessor
 from src.timeline.cache_manager import TimelineCacheManager
+from src.timeline.chunk_assembler import TimelineChunkAssembler
 from src.server.app import FlaskServer
 
 # ロガーセットアップ
@@ -43,19 +45,22 @@ class RaspberryPiServer:
         self.device_manager = DeviceManager()
         self.timeline_processor = TimelineProcessor(on_event_callback=self._on_timeline_event)
         self.cache_manager = TimelineCacheManager()
+        self.chunk_assembler = TimelineChunkAssembler()
         self.comm_logger = CommunicationLogger()
         
         # WebSocketクライアント初期化
         self.ws_client = CloudRunWebSocketClient(
             session_id=session_id,
-            on_message_callback=self._on_websocket_message
+            on_message_callback=self._on_websocket_message,
+            on_connected_callback=self._on_websocket_connected
         )
         
         # Flaskサーバー初期化
         self.flask_server = FlaskServer(
             device_manager=self.device_manager,
             timeline_processor=self.timeline_processor,
-            mqtt_client=self.mqtt_client
+            mqtt_client=self.mqtt_client,
+            clock_sync=self.ws_client.clock
         )
         
         # Flask用スレッド
@@ -154,7 +159,9 @@ class RaspberryPiServer:
             on_control_command=self._on_control_command_received,
             on_device_test=self._on_device_test_received,
             on_video_sync=self._on_video_sync_received,
-            on_stop_signal=self._on_stop_signal_received
+            on_stop_signal=self._on_stop_signal_received,
+            on_timeline_offer=self._on_timeline_offer_received,
+            on_timeline_chunk=self._on_timeline_chunk_received
         )
         
         handler.handle_message(message)
@@ -178,11 +185,98 @@ class RaspberryPiServer:
             # キャッシュに保存（完全なデータを保存）
             self.cache_manager.save_timeline(session_id, data)
             
+            # コンテンツハッシュでも保存（次回以降の通知で再ダウンロードを省略）
+            metadata = data.get("transmission_metadata") or {}
+            self.cache_manager.save_content(sync_data, expected_sha256=metadata.get("sha256"))
+            
             logger.info("タイムラインデータ処理完了")
         
         except Exception as e:
             logger.error(f"タイムラインデータ処理エラー: {e}", exc_info=True)
     
+    def _on_timeline_offer_received(self, offer: Dict) -> None:
+        """タイムライン通知受信時の処理
+        
+        キャッシュにあればそれをロードして "have"、無ければ "need" を応答する。
+        
+        Args:
+            offer: タイムライン通知（session_id, video_id, sha256, size, transmission_metadataを含む）
+        """
+        sha256 = offer.get("sha256", "")
+        video_id = offer.get("video_id", "unknown")
+        cached = self.cache_manager.load_content(sha256)
+        
+        if cached is not None:
+            logger.info(f"📦 キャッシュ済みタイムラインを使用: video_id={video_id}")
+            self.timeline_processor.load_timeline(cached)
+            status = "have"
+        else:
+            logger.info(f"📥 タイムライン本体を要求: video_id={video_id}, size={offer.get('size')}B")
+            status = "need"
+        
+        asyncio.create_task(self.ws_client.send_message({
+            "type": "timeline_offer_response",
+            "session_id": offer.get("session_id", self.session_id),
+            "video_id": video_id,
+            "sha256": sha256,
+            "status": status
+        }))
+    
+    async def _on_websocket_connected(self) -> None:
+        """WebSocket(再)接続時の処理（受信途中の分割転送を続きから再開）"""
+        for resume in self.chunk_assembler.pending_resumes():
+            logger.info(f"🔁 分割転送の再開要求: transfer={resume['transfer_id'][:8]}, seq={resume['next_seq']}")
+            await self.ws_client.send_message(resume)
+    
+    def _on_timeline_chunk_received(self, message: Dict) -> None:
+        """タイムライン分割転送メッセージ受信時の処理
+        
+        Args:
+            message: timeline_chunk_begin / timeline_chunk / timeline_chunk_end / timeline_transfer_error
+        """
+        message_type = message.get("type")
+        transfer_id = message.get("transfer_id", "")
+        reply = None
+        
+        try:
+            if message_type == "timeline_chunk_begin":
+                self.chunk_assembler.begin(message)
+            
+            elif message_type == "timeline_chunk":
+                reply = self.chunk_assembler.add_chunk(message)
+            
+            elif message_type == "timeline_chunk_end":
+                data = self.chunk_assembler.finish(message)
+                if data is None:
+                    reply = self.chunk_assembler.resume_message(transfer_id)
+                else:
+                    self._on_sync_data_received(data)
+                    reply = {
+                        "type": "timeline_transfer_complete",
+                        "transfer_id": transfer_id,
+                        "device_id": Config.DEVICE_HUB_ID,
+                        "status": "ok"
+                    }
+            
+            elif message_type == "timeline_transfer_error":
+                logger.warning(f"分割転送エラー通知: {transfer_id[:8]} {message.get('error')}")
+                self.chunk_assembler.discard(transfer_id)
+        
+        except Exception as e:
+            logger.error(f"分割転送処理エラー: {e}", exc_info=True)
+            # 状態を破棄して最初から再送を要求
+            self.chunk_assembler.discard(transfer_id)
+            reply = {
+                "type": "timeline_transfer_complete",
+                "transfer_id": transfer_id,
+                "device_id": Config.DEVICE_HUB_ID,
+                "status": "error",
+                "error": str(e)
+            }
+        
+        if reply:
+            asyncio.create_task(self.ws_client.send_message(reply))
+    
     def _on_sync_time_received(self, current_time: float) -> None:
         """同期時刻受信時の処理
         
@@ -196,11 +290,18 @@ class RaspberryPiServer:
         """動画同期メッセージ受信時の処理
         
         Args:
-            sync_data: 動画同期データ（video_time, video_state, video_duration, session_idを含む）
+            sync_data: 動画同期データ（video_time, video_state, video_duration, session_id,
+                local_monotonic を含む）
         """
         video_time = sync_data.get("video_time", 0)
         video_state = sync_data.get("video_state", "unknown")
         
+        # サーバー受信時点の再生位置を、到着までの経過分だけ進める（到着揺らぎの補正）
+        local_monotonic = sync_data.get("local_monotonic")
+        if video_state == "play" and local_monotonic is not None:
+            elapsed = time.monotonic() - local_monotonic
+            video_time += min(max(elapsed, 0.0), Config.CLOCK_SYNC_MAX_COMPENSATION_SEC)
+        
         logger.info(f"📺 動画同期処理: state={video_state}, time={video_time:.2f}秒")
         
         # 再生中の場合、タイムラインプロセッサーに時刻を更新
@@ -1,5 +1,7 @@
 """API module initialization"""
 from .websocket_client import CloudRunWebSocketClient
 from .message_handler import WebSocketMessageHandler
+from .tick_frame import TICK_SUBPROTOCOL, decode_tick_frame
+from .clock_sync import ClockSynchronizer
 
-__all__ = ["CloudRunWebSocketClient", "WebSocketMessageHandler"]
+__all__ = ["CloudRunWebSocketClient", "WebSocketMessageHandler", "TICK_SUBPROTOCOL", "decode_tick_frame", "ClockSynchronizer"]
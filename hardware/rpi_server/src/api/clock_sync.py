@@ -0,0 +1,144 @@
+"""
+4DX@HOME Clock Synchronizer
+Cloud Run APIとのNTP方式の時刻同期（時計オフセット・往復遅延の推定）
+
+デバイス → サーバー: time_sync_request  {seq, t0}            t0 = 送信時刻（ローカル単調時計）
+サーバー → デバイス: time_sync_response {seq, t0, t1, t2}    t1/t2 = サーバー受信/送信時刻（エポックミリ秒）
+デバイス受信時刻 t3 から
+    offset = ((t1 - t0) + (t2 - t3)) / 2   （サーバー時計 - ローカル時計）
+    rtt    = (t3 - t0) - (t2 - t1)
+を計算し、直近ウィンドウ内で往復遅延が最小のサンプルのオフセットを採用する
+（キュー待ち等で往復が非対称になったサンプルほど往復遅延が大きいため）。
+"""
+
+import logging
+import time
+from collections import deque
+from typing import Deque, Dict, Any, Optional, Tuple
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+def _local_ms() -> float:
+    """ローカル単調時計（ミリ秒）"""
+    return time.monotonic() * 1000
+
+
+class ClockSynchronizer:
+    """サーバー時計とローカル単調時計のオフセット推定"""
+
+    def __init__(self, window: Optional[int] = None):
+        """
+        Args:
+            window: 採用候補として保持するサンプル数（省略時は Config.CLOCK_SYNC_WINDOW）
+        """
+        # (rtt_ms, offset_ms, 計測時刻[ローカルms])
+        self.samples: Deque[Tuple[float, float, float]] = deque(
+            maxlen=window or Config.CLOCK_SYNC_WINDOW
+        )
+        # 応答待ちのリクエスト: seq → t0
+        self._pending: Dict[int, float] = {}
+        self._seq = 0
+        self.sample_count = 0
+        self.timeout_count = 0
+
+    def reset(self) -> None:
+        """サンプルを破棄（再接続時。接続先のサーバーインスタンスが変わる場合がある）"""
+        self.samples.clear()
+        self._pending.clear()
+
+    def make_request(self) -> Dict[str, Any]:
+        """time_sync_request メッセージを生成（送信直前に呼ぶ）"""
+        self._seq += 1
+        t0 = _local_ms()
+        # 応答が返らなかった古いリクエストを破棄
+        expired = [seq for seq, sent in self._pending.items() if t0 - sent > Config.CLOCK_SYNC_TIMEOUT_MS]
+        for seq in expired:
+            del self._pending[seq]
+        self.timeout_count += len(expired)
+        self._pending[self._seq] = t0
+        return {
+            "type": "time_sync_request",
+            "device_id": Config.DEVICE_HUB_ID,
+            "seq": self._seq,
+            "t0": t0
+        }
+
+    def handle_response(self, message: Dict[str, Any], received_ms: Optional[float] = None) -> bool:
+        """time_sync_response を取り込む
+
+        Args:
+            message: 受信したレスポンス
+            received_ms: 受信時刻（ローカルms。省略時は現在時刻）
+
+        Returns:
+            サンプルとして採用した場合True
+        """
+        t3 = _local_ms() if received_ms is None else received_ms
+        t0 = self._pending.pop(message.get("seq"), None)
+        t1 = message.get("t1")
+        t2 = message.get("t2")
+        if t0 is None or t1 is None or t2 is None:
+            logger.debug(f"不明な時刻同期レスポンス: seq={message.get('seq')}")
+            return False
+
+        rtt = (t3 - t0) - (t2 - t1)
+        if rtt < 0:
+            return False
+        offset = ((t1 - t0) + (t2 - t3)) / 2
+        self.samples.append((rtt, offset, t3))
+        self.sample_count += 1
+        return True
+
+    def _best(self) -> Optional[Tuple[float, float, float]]:
+        """往復遅延が最小のサンプル"""
+        return min(self.samples) if self.samples else None
+
+    @property
+    def is_synced(self) -> bool:
+        return bool(self.samples)
+
+    @property
+    def offset_ms(self) -> Optional[float]:
+        """サーバー時計 - ローカル単調時計（ミリ秒）"""
+        best = self._best()
+        return best[1] if best else None
+
+    @property
+    def rtt_ms(self) -> Optional[float]:
+        """採用サンプルの往復遅延（ミリ秒）"""
+        best = self._best()
+        return best[0] if best else None
+
+    def server_to_local(self, server_ms: float) -> Optional[float]:
+        """サーバー時刻（エポックミリ秒）をローカル単調時計（time.monotonic() と同じ秒）に変換
+
+        Returns:
+            未同期の場合None
+        """
+        offset = self.offset_ms
+        if offset is None:
+            return None
+        return (server_ms - offset) / 1000
+
+    def local_to_server(self, local_seconds: float) -> Optional[float]:
+        """ローカル単調時計（秒）をサーバー時刻（エポックミリ秒）に変換"""
+        offset = self.offset_ms
+        if offset is None:
+            return None
+        return local_seconds * 1000 + offset
+
+    def get_stats(self) -> Dict[str, Any]:
+        """推定値と統計"""
+        best = self._best()
+        return {
+            "synced": best is not None,
+            "offset_ms": round(best[1], 2) if best else None,
+            "rtt_ms": round(best[0], 2) if best else None,
+            "sample_age_sec": round((_local_ms() - best[2]) / 1000, 1) if best else None,
+            "window_samples": len(self.samples),
+            "total_samples": self.sample_count,
+            "timeouts": self.timeout_count
+        }
@@ -21,7 +21,9 @@ class WebSocketMessageHandler:
         on_control_command: Optional[Callable[[Dict], None]] = None,
         on_device_test: Optional[Callable[[Dict], None]] = None,
         on_video_sync: Optional[Callable[[Dict], None]] = None,
-        on_stop_signal: Optional[Callable[[Dict], None]] = None
+        on_stop_signal: Optional[Callable[[Dict], None]] = None,
+        on_timeline_offer: Optional[Callable[[Dict], None]] = None,
+        on_timeline_chunk: Optional[Callable[[Dict], None]] = None
     ):
         """
         Args:
@@ -31,6 +33,8 @@ class WebSocketMessageHandler:
             on_device_test: デバイステスト受信時のコールバック
             on_video_sync: 動画同期受信時のコールバック
             on_stop_signal: ストップ信号受信時のコールバック
+            on_timeline_offer: タイムライン通知（コンテンツハッシュ）受信時のコールバック
+            on_timeline_chunk: タイムライン分割転送メッセージ受信時のコールバック
         """
         self.on_sync_data = on_sync_data
         self.on_sync_time = on_sync_time
@@ -38,6 +42,8 @@ class WebSocketMessageHandler:
         self.on_device_test = on_device_test
         self.on_video_sync = on_video_sync
         self.on_stop_signal = on_stop_signal
+        self.on_timeline_offer = on_timeline_offer
+        self.on_timeline_chunk = on_timeline_chunk
     
     def handle_message(self, message: Dict[str, Any]) -> None:
         """受信メッセージを処理
@@ -53,6 +59,16 @@ class WebSocketMessageHandler:
         if message_type == "sync_data_bulk_transmission":
             self._handle_sync_data_bulk(message)
         
+        elif message_type == "timeline_offer":
+            self._handle_timeline_offer(message)
+        
+        elif message_type in (
+            "timeline_chunk_begin", "timeline_chunk", "timeline_chunk_end", "timeline_transfer_error"
+        ):
+            # 分割転送は順序依存のため1つのコールバックでまとめて処理
+            if self.on_timeline_chunk:
+                self.on_timeline_chunk(message)
+        
         elif message_type == "sync":
             self._handle_sync(message)
         
@@ -128,6 +144,33 @@ class WebSocketMessageHandler:
         except Exception as e:
             logger.error(f"sync_data_bulk処理エラー: {e}", exc_info=True)
     
+    def _handle_timeline_offer(self, message: Dict[str, Any]) -> None:
+        """タイムライン通知メッセージを処理
+        
+        本体は含まれず、キャッシュに無い場合のみ "need" 応答で送信される。
+        
+        メッセージ形式:
+        {
+            "type": "timeline_offer",
+            "session_id": "demo1",
+            "video_id": "demo1",
+            "sha256": "9f86d0...",
+            "size": 2048,
+            "transmission_metadata": {...}
+        }
+        """
+        try:
+            logger.info(
+                f"タイムライン通知受信: video_id={message.get('video_id')}, "
+                f"sha256={str(message.get('sha256'))[:12]}, size={message.get('size')}"
+            )
+            
+            if self.on_timeline_offer:
+                self.on_timeline_offer(message)
+        
+        except Exception as e:
+            logger.error(f"timeline_offer処理エラー: {e}", exc_info=True)
+    
     def _handle_sync(self, message: Dict[str, Any]) -> None:
         """同期時刻メッセージを処理
         
@@ -164,7 +207,8 @@ class WebSocketMessageHandler:
             "video_state": "play" | "pause" | "seeking" | "seeked",
             "video_duration": 120.0,
             "client_timestamp": 1234567890,
-            "server_timestamp": 1234567891
+            "server_timestamp": 1234567891,
+            "local_monotonic": 5321.42   # server_timestamp のローカル単調時計換算（時刻同期後に付与）
         }
         """
         try:
@@ -179,7 +223,8 @@ class WebSocketMessageHandler:
                     "video_time": video_time,
                     "video_state": video_state,
                     "video_duration": message.get("video_duration"),
-                    "session_id": message.get("session_id")
+                    "session_id": message.get("session_id"),
+                    "local_monotonic": message.get("local_monotonic")
                 })
             # なければon_sync_timeにフォールバック（既存の同期処理）
             elif self.on_sync_time and video_state == "play":
@@ -0,0 +1,68 @@
+"""
+4DX@HOME Tick Frame Decoder
+高頻度同期メッセージ（video_sync）のバイナリフレームをデコード
+
+レイアウトはバックエンド (backend/app/models/tick_frame.py) と同一に保つこと。
+currentTime 等その他のメッセージはJSONのまま受信する。
+"""
+
+import math
+import struct
+from typing import Any, Dict, Optional
+
+# サブプロトコル名（サーバーが合意しなければJSONのまま受信）
+TICK_SUBPROTOCOL = "4dx.tick.v2"
+
+TICK_MAGIC = 0xD4
+TICK_VERSION = 2
+
+KIND_VIDEO_SYNC = 1
+
+_HEADER = struct.Struct("<BBB")
+_VIDEO_SYNC = struct.Struct("<BBBBddqqdd")
+
+VIDEO_STATES = ("unknown", "play", "pause", "seeking", "seeked", "ended")
+
+
+def decode_tick_frame(data: bytes, session_id: Optional[str] = None) -> Dict[str, Any]:
+    """バイナリフレームをJSON版と同じ形式のdictにデコード
+
+    Args:
+        data: 受信したバイナリフレーム
+        session_id: 接続中のセッションID（フレームには含まれない）
+
+    Returns:
+        JSONメッセージと同じキーを持つdict（video_time_raw / estimated_delay_ms は値がある場合のみ）
+
+    Raises:
+        ValueError: 不正なフレーム
+    """
+    if len(data) < _HEADER.size:
+        raise ValueError("フレーム長が不足しています")
+
+    magic, version, kind = _HEADER.unpack_from(data)
+    if magic != TICK_MAGIC or version != TICK_VERSION:
+        raise ValueError(f"未対応のフレーム: magic={magic:#x}, version={version}")
+    if kind != KIND_VIDEO_SYNC:
+        raise ValueError(f"未知のフレーム種別: {kind}")
+
+    try:
+        (_, _, _, state, video_time, duration, client_ts, server_ts,
+         video_time_raw, estimated_delay_ms) = _VIDEO_SYNC.unpack(data)
+    except struct.error as e:
+        raise ValueError(f"フレーム解析エラー: {e}") from e
+
+    message = {
+        "type": "video_sync",
+        "session_id": session_id,
+        "video_time": video_time,
+        "video_state": VIDEO_STATES[state] if state < len(VIDEO_STATES) else "unknown",
+        "video_duration": None if math.isnan(duration) else duration,
+        "client_timestamp": None if client_ts < 0 else client_ts,
+        "server_timestamp": server_ts
+    }
+    if not math.isnan(video_time_raw):
+        message["video_time_raw"] = video_time_raw
+    if not math.isnan(estimated_delay_ms):
+        message["estimated_delay_ms"] = estimated_delay_ms
+    return message
@@ -6,12 +6,18 @@ Cloud Run APIとのWebSocket接続を管理し、タイムラインデータを
 import asyncio
 import logging
 import json
+import time
 import websockets
-from typing import Optional, Callable, Dict, Any
+from typing import Optional, Callable, Dict, Any, Awaitable
 from config import Config
+from .tick_frame import TICK_SUBPROTOCOL, decode_tick_frame
+from .clock_sync import ClockSynchronizer
 
 logger = logging.getLogger(__name__)
 
+# device_hello でサーバーに申告する対応機能
+CLIENT_FEATURES = ["timeline_offer", "timeline_chunked"]
+
 
 class CloudRunWebSocketClient:
     """Cloud Run APIへのWebSocketクライアント"""
@@ -19,15 +25,23 @@ class CloudRunWebSocketClient:
     def __init__(
         self,
         session_id: str,
-        on_message_callback: Optional[Callable[[Dict[str, Any]], None]] = None
+        on_message_callback: Optional[Callable[[Dict[str, Any]], None]] = None,
+        on_connected_callback: Optional[Callable[[], Awaitable[None]]] = None
     ):
         self.session_id = session_id
         self.on_message_callback = on_message_callback
+        # (再)接続直後に呼ばれるコールバック（分割転送の再開要求など）
+        self.on_connected_callback = on_connected_callback
         self.websocket: Optional[websockets.WebSocketClientProtocol] = None
         self.is_connected: bool = False
         self.reconnect_task: Optional[asyncio.Task] = None
         self.ping_task: Optional[asyncio.Task] = None
+        self.clock_sync_task: Optional[asyncio.Task] = None
+        # サーバー時計とのオフセット推定（server_timestamp → ローカル単調時計の変換に使う）
+        self.clock = ClockSynchronizer()
         self._stop_requested: bool = False
+        # サーバーと合意したサブプロトコル（Noneの場合はJSONのみ）
+        self.subprotocol: Optional[str] = None
     
     async def connect(self) -> None:
         """WebSocketサーバーに接続"""
@@ -38,17 +52,33 @@ class CloudRunWebSocketClient:
         try:
             self.websocket = await websockets.connect(
                 ws_url,
+                subprotocols=[TICK_SUBPROTOCOL] if Config.WS_BINARY_TICKS else None,
                 ping_interval=Config.WS_PING_INTERVAL,
                 ping_timeout=10,
                 close_timeout=5
             )
             
             self.is_connected = True
-            logger.info("WebSocket接続成功")
+            self.subprotocol = self.websocket.subprotocol
+            logger.info(f"WebSocket接続成功 (subprotocol={self.subprotocol or 'json'})")
+            
+            # 対応機能を申告（キャッシュ済みタイムラインの再送を省略させる）
+            await self.send_message({
+                "type": "device_hello",
+                "device_id": Config.DEVICE_HUB_ID,
+                "features": CLIENT_FEATURES
+            })
+            
+            if self.on_connected_callback:
+                await self.on_connected_callback()
             
             # Ping送信タスクを開始
             self.ping_task = asyncio.create_task(self._ping_loop())
             
+            # 時刻同期タスクを開始（接続先が変わり得るため推定はやり直す）
+            self.clock.reset()
+            self.clock_sync_task = asyncio.create_task(self._clock_sync_loop())
+            
         except Exception as e:
             logger.error(f"WebSocket接続エラー: {e}", exc_info=True)
             self.is_connected = False
@@ -58,13 +88,14 @@ class CloudRunWebSocketClient:
         """WebSocket接続を切断"""
         self._stop_requested = True
         
-        # Pingタスクをキャンセル
-        if self.ping_task and not self.ping_task.done():
-            self.ping_task.cancel()
-            try:
-                await self.ping_task
-            except asyncio.CancelledError:
-                pass
+        # Ping・時刻同期タスクをキャンセル
+        for task in (self.ping_task, self.clock_sync_task):
+            if task and not task.done():
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
         
         # WebSocket切断
         if self.websocket and not self.websocket.closed:
@@ -103,19 +134,35 @@ class CloudRunWebSocketClient:
             async for message in self.websocket:
                 if self._stop_requested:
                     break
+                received_ms = time.monotonic() * 1000
                 
                 try:
-                    data = json.loads(message)
+                    # バイナリは時刻同期フレーム、テキストは従来のJSON
+                    if isinstance(message, bytes):
+                        data = decode_tick_frame(message, self.session_id)
+                    else:
+                        data = json.loads(message)
                     message_type = data.get("type", "unknown")
                     
                     logger.debug(f"WebSocket受信: type={message_type}")
                     
+                    if message_type == "time_sync_response":
+                        self.clock.handle_response(data, received_ms)
+                        continue
+                    
+                    # サーバー時刻をローカル単調時計に変換して付与（到着揺らぎの補正用）
+                    server_timestamp = data.get("server_timestamp")
+                    if isinstance(server_timestamp, (int, float)) and self.clock.is_synced:
+                        data["local_monotonic"] = self.clock.server_to_local(server_timestamp)
+                    
                     # コールバック実行
                     if self.on_message_callback:
                         self.on_message_callback(data)
                 
                 except json.JSONDecodeError as e:
                     logger.error(f"JSON解析エラー: {e}", exc_info=True)
+                except ValueError as e:
+                    logger.error(f"バイナリフレーム解析エラー: {e}")
                 except Exception as e:
                     logger.error(f"メッセージ処理エラー: {e}", exc_info=True)
         
@@ -181,3 +228,33 @@ class CloudRunWebSocketClient:
             logger.debug("Pingループがキャンセルされました")
         except Exception as e:
             logger.error(f"Pingループエラー: {e}", exc_info=True)
+    
+    async def _clock_sync_loop(self) -> None:
+        """接続直後と定期的に時刻同期サンプルをまとめて取得し、推定値をサーバーに通知"""
+        try:
+            while not self._stop_requested and self.is_connected:
+                for _ in range(Config.CLOCK_SYNC_BURST):
+                    if not self.is_connected:
+                        return
+                    await self.send_message(self.clock.make_request())
+                    await asyncio.sleep(Config.CLOCK_SYNC_BURST_SPACING)
+                
+                # 最後の応答を待ってから推定値を報告
+                await asyncio.sleep(Config.CLOCK_SYNC_BURST_SPACING * 2)
+                stats = self.clock.get_stats()
+                if stats["synced"]:
+                    logger.debug(
+                        f"時刻同期: offset={stats['offset_ms']}ms, rtt={stats['rtt_ms']}ms"
+                    )
+                    await self.send_message({
+                        "type": "time_sync_report",
+                        "device_id": Config.DEVICE_HUB_ID,
+                        **stats
+                    })
+                
+                await asyncio.sleep(Config.CLOCK_SYNC_INTERVAL)
+        
+        except asyncio.CancelledError:
+            logger.debug("時刻同期ループがキャンセルされました")
+        except Exception as e:
+            logger.error(f"時刻同期ループエラー: {e}", exc_info=True)
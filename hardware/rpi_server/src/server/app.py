@@ -22,7 +22,8 @@ class FlaskServer:
         self,
         device_manager=None,
         timeline_processor=None,
-        mqtt_client=None
+        mqtt_client=None,
+        clock_sync=None
     ):
         # 絶対パスでtemplates/staticディレクトリを指定
         base_dir = Path(__file__).resolve().parent.parent.parent
@@ -42,6 +43,7 @@ class FlaskServer:
         self.device_manager = device_manager
         self.timeline_processor = timeline_processor
         self.mqtt_client = mqtt_client
+        self.clock_sync = clock_sync
         
         # ルート設定
         self._setup_routes()
@@ -81,7 +83,8 @@ class FlaskServer:
                     "broker": f"{Config.MQTT_BROKER_HOST}:{Config.MQTT_BROKER_PORT}"
                 },
                 "devices": self.device_manager.get_status_summary() if self.device_manager else {},
-                "timeline": self.timeline_processor.get_stats() if self.timeline_processor else {}
+                "timeline": self.timeline_processor.get_stats() if self.timeline_processor else {},
+                "clock_sync": self.clock_sync.get_stats() if self.clock_sync else {}
             }
             
             return jsonify(status)
@@ -1,5 +1,6 @@
 """Timeline module initialization"""
 from .processor import TimelineProcessor
-from .cache_manager import TimelineCacheManager
+from .cache_manager import TimelineCacheManager, compute_timeline_sha256
+from .chunk_assembler import TimelineChunkAssembler
 
-__all__ = ["TimelineProcessor", "TimelineCacheManager"]
+__all__ = ["TimelineProcessor", "TimelineCacheManager", "compute_timeline_sha256", "TimelineChunkAssembler"]
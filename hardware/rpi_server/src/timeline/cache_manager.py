@@ -3,6 +3,7 @@
 タイムラインデータをJSONファイルとしてキャッシュ
 """
 
+import hashlib
 import json
 import logging
 import os
@@ -13,14 +14,32 @@ from config import Config
 logger = logging.getLogger(__name__)
 
 
+def compute_timeline_sha256(timeline_data: Dict) -> str:
+    """タイムラインのコンテンツハッシュを計算
+
+    バックエンドと同じ正規化JSON（キー順固定・区切り文字固定）のsha256。
+
+    Args:
+        timeline_data: タイムラインデータ（sync_data部分）
+
+    Returns:
+        16進sha256文字列
+    """
+    canonical = json.dumps(timeline_data, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
 class TimelineCacheManager:
     """タイムラインキャッシュ管理"""
     
     def __init__(self):
         self.cache_dir = Config.TIMELINE_CACHE_DIR
+        # コンテンツハッシュ別キャッシュ（セッションをまたいで再利用）
+        self.content_dir = os.path.join(self.cache_dir, "content")
         
         # キャッシュディレクトリを作成
         os.makedirs(self.cache_dir, exist_ok=True)
+        os.makedirs(self.content_dir, exist_ok=True)
     
     def save_timeline(self, session_id: str, timeline_data: Dict) -> str:
         """タイムラインデータを保存
@@ -48,6 +67,72 @@ class TimelineCacheManager:
             logger.error(f"タイムライン保存エラー: {e}", exc_info=True)
             raise
     
+    def _content_path(self, sha256: str) -> str:
+        return os.path.join(self.content_dir, f"{sha256}.json")
+    
+    def has_content(self, sha256: str) -> bool:
+        """コンテンツハッシュのタイムラインを保持しているか
+        
+        Args:
+            sha256: タイムラインのsha256
+        """
+        return bool(sha256) and os.path.exists(self._content_path(sha256))
+    
+    def save_content(self, timeline_data: Dict, expected_sha256: Optional[str] = None) -> Optional[str]:
+        """タイムライン本体をコンテンツハッシュで保存
+        
+        Args:
+            timeline_data: タイムラインデータ（sync_data部分）
+            expected_sha256: サーバーが通知したsha256（不一致時は警告）
+        
+        Returns:
+            保存したsha256（エラー時はNone）
+        """
+        try:
+            sha256 = compute_timeline_sha256(timeline_data)
+            if expected_sha256 and expected_sha256 != sha256:
+                logger.warning(
+                    f"タイムラインのsha256が通知と一致しません: "
+                    f"expected={expected_sha256[:12]}, actual={sha256[:12]}"
+                )
+            
+            filepath = self._content_path(sha256)
+            if os.path.exists(filepath):
+                return sha256
+            
+            # 書き込み途中のファイルを読まないよう一時ファイル経由で置き換え
+            tmp_path = f"{filepath}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(timeline_data, f, ensure_ascii=False)
+            os.replace(tmp_path, filepath)
+            
+            logger.info(f"タイムラインをハッシュ保存: {sha256[:12]}")
+            return sha256
+        
+        except Exception as e:
+            logger.error(f"タイムラインハッシュ保存エラー: {e}", exc_info=True)
+            return None
+    
+    def load_content(self, sha256: str) -> Optional[Dict]:
+        """コンテンツハッシュでタイムライン本体を読み込み
+        
+        Args:
+            sha256: タイムラインのsha256
+        
+        Returns:
+            タイムラインデータ（未保持・破損時はNone）
+        """
+        if not self.has_content(sha256):
+            return None
+        
+        data = self.load_timeline(self._content_path(sha256))
+        if data is not None and compute_timeline_sha256(data) != sha256:
+            logger.warning(f"キャッシュ内容が破損しています: {sha256[:12]}")
+            os.remove(self._content_path(sha256))
+            return None
+        
+        return data
+    
     def load_timeline(self, filepath: str) -> Optional[Dict]:
         """タイムラインデータを読み込み
         
@@ -0,0 +1,179 @@
+"""
+4DX@HOME Timeline Chunk Assembler
+圧縮チャンクで分割転送されたタイムラインを逐次復元
+"""
+
+import base64
+import hashlib
+import json
+import logging
+import zlib
+from typing import Dict, List, Optional, Any
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class TimelineChunkAssembler:
+    """分割転送の受信・逐次展開・完全性検証
+
+    チャンクは受信順に解凍してハッシュを更新するため、
+    全体を圧縮状態で溜めてから一括展開する必要がない。
+    途中で切断しても状態を保持し、再接続後に続きの連番から再開を要求できる。
+    """
+
+    def __init__(self):
+        # 転送ID → 受信状態
+        self.transfers: Dict[str, Dict[str, Any]] = {}
+        self.ack_interval = Config.TIMELINE_CHUNK_ACK_INTERVAL
+
+    def begin(self, message: Dict[str, Any]) -> None:
+        """転送開始メッセージを処理
+
+        同じ転送IDで受信途中の状態がある場合（再開）はそのまま継続する。
+
+        Args:
+            message: timeline_chunk_begin メッセージ
+        """
+        transfer_id = message["transfer_id"]
+        if transfer_id in self.transfers:
+            logger.info(f"分割転送再開: {transfer_id[:8]} seq={self.transfers[transfer_id]['next_seq']}")
+            return
+
+        if message.get("encoding") != "gzip":
+            raise ValueError(f"未対応のエンコーディング: {message.get('encoding')}")
+
+        self.transfers[transfer_id] = {
+            "session_id": message.get("session_id"),
+            "video_id": message.get("video_id"),
+            # 転送ペイロード（非圧縮バイト列）の完全性検証用。内容のsha256は transmission_metadata 側
+            "payload_sha256": message.get("payload_sha256"),
+            "size": message.get("size", 0),
+            "total_chunks": message.get("total_chunks", 0),
+            "transmission_metadata": message.get("transmission_metadata") or {},
+            "next_seq": 0,
+            # gzipヘッダー付きストリームを逐次展開
+            "decompressor": zlib.decompressobj(wbits=16 + zlib.MAX_WBITS),
+            "digest": hashlib.sha256(),
+            "buffer": bytearray()
+        }
+
+        logger.info(
+            f"分割転送開始: {transfer_id[:8]} video_id={message.get('video_id')}, "
+            f"{message.get('size')}B / {message.get('total_chunks')}チャンク"
+        )
+
+    def add_chunk(self, message: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """チャンクを逐次展開
+
+        Args:
+            message: timeline_chunk メッセージ
+
+        Returns:
+            サーバーへ送るACK / 再開要求メッセージ（不要な場合はNone）
+        """
+        transfer_id = message["transfer_id"]
+        state = self.transfers.get(transfer_id)
+        if state is None:
+            logger.warning(f"開始前のチャンクを破棄: {transfer_id[:8]}")
+            return None
+
+        seq = message.get("seq")
+        if seq < state["next_seq"]:
+            # 再送による重複
+            return None
+        if seq > state["next_seq"]:
+            # 欠落位置ごとに再開要求は1回だけ（後続チャンクごとに要求しない）
+            if state.get("resume_requested") == state["next_seq"]:
+                return None
+            logger.warning(f"チャンク欠落: expected={state['next_seq']}, got={seq}")
+            state["resume_requested"] = state["next_seq"]
+            return self._progress_message("timeline_transfer_resume", transfer_id, state)
+
+        data = state["decompressor"].decompress(base64.b64decode(message.get("data", "")))
+        state["digest"].update(data)
+        state["buffer"].extend(data)
+        state["next_seq"] += 1
+
+        if state["next_seq"] % self.ack_interval == 0:
+            return self._progress_message("timeline_chunk_ack", transfer_id, state)
+        return None
+
+    def finish(self, message: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """転送終了を処理しダイジェストを検証
+
+        Args:
+            message: timeline_chunk_end メッセージ
+
+        Returns:
+            sync_data_bulk_transmission と同じ形式のデータ（session_id, video_id, sync_data, transmission_metadata）。
+            チャンクが揃っていない場合はNone（再開要求で続きを待つ）
+
+        Raises:
+            ValueError: 不明な転送・ダイジェスト不一致
+        """
+        transfer_id = message["transfer_id"]
+        state = self.transfers.get(transfer_id)
+        if state is None:
+            raise ValueError(f"不明な転送: {transfer_id}")
+
+        if state["next_seq"] < message.get("total_chunks", state["total_chunks"]):
+            logger.warning(f"チャンク不足のため完了保留: {state['next_seq']}/{state['total_chunks']}")
+            return None
+
+        tail = state["decompressor"].flush()
+        state["digest"].update(tail)
+        state["buffer"].extend(tail)
+        del self.transfers[transfer_id]
+
+        # 受信バイト列の完全性（正規化前のペイロードのsha256。タイムライン内容のsha256とは別）
+        expected = message.get("payload_sha256", state["payload_sha256"])
+        actual = state["digest"].hexdigest()
+        if expected and actual != expected:
+            raise ValueError(f"ダイジェスト不一致: expected={expected[:12]}, actual={actual[:12]}")
+
+        sync_data = json.loads(bytes(state["buffer"]).decode("utf-8"))
+        metadata = dict(state["transmission_metadata"])
+
+        logger.info(f"分割転送完了: {transfer_id[:8]} {len(state['buffer'])}B")
+
+        return {
+            "session_id": state["session_id"],
+            "video_id": state["video_id"],
+            "sync_data": sync_data,
+            "transmission_metadata": metadata
+        }
+
+    def discard(self, transfer_id: str) -> None:
+        """受信途中の転送を破棄
+
+        Args:
+            transfer_id: 転送ID
+        """
+        self.transfers.pop(transfer_id, None)
+
+    def resume_message(self, transfer_id: str) -> Optional[Dict[str, Any]]:
+        """指定転送の再開要求メッセージ
+
+        Args:
+            transfer_id: 転送ID
+        """
+        state = self.transfers.get(transfer_id)
+        if state is None:
+            return None
+        return self._progress_message("timeline_transfer_resume", transfer_id, state)
+
+    def pending_resumes(self) -> List[Dict[str, Any]]:
+        """再接続時に送る再開要求メッセージ一覧"""
+        return [
+            self._progress_message("timeline_transfer_resume", transfer_id, state)
+            for transfer_id, state in self.transfers.items()
+        ]
+
+    def _progress_message(self, message_type: str, transfer_id: str, state: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "type": message_type,
+            "transfer_id": transfer_id,
+            "device_id": Config.DEVICE_HUB_ID,
+            "next_seq": state["next_seq"]
+        }